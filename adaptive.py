@@ -0,0 +1,249 @@
+import argparse
+import math
+import os
+
+import ledger
+import simulation
+import sweep
+
+# Two-sided 95% normal quantile, used for all the confidence intervals
+Z = 1.96
+
+def outcome(model: str, params: dict, result: dict):
+    '''Extracts the quantities we want to estimate from the result of one run.
+
+    Args:
+        model: name of the model
+        params: parameters of the run, as returned by simulation.run_params
+        result: result of the run, as returned by simulation.Simulation.run
+
+    Returns:
+        (float, bool, int): mean proportion of sapiens genes over the whole
+            population, whether the neanderthal Y-chromosome went extinct, and
+            the cycle when it did so. The cycle is None if it did not go
+            extinct, or if that is not known.
+    '''
+    stats = result["stats"]
+    if model == "multi-gene":
+        constants = params["constants"]
+        genes = [constants["NUMBER_OF_APPEARANCE_GENES"], constants["NUMBER_OF_FANCY_GENES"],
+            constants["NUMBER_OF_MISCARRY_GENES"], constants["NUMBER_OF_OTHER_GENES"]]
+        means = [stats["appearance"], stats["fancy"], stats["miscarry"], stats["other"]]
+        ancestry = sum(n * mean for (n, mean) in zip(genes, means)) / sum(genes)
+        extinct = stats["neander_y"] == 0
+    else:
+        counts = [stats["sapiens"], stats["neanders"], stats["females"]]
+        means = [stats["mean-sapiens"], stats["mean-neander"], stats["mean-female"]]
+        ancestry = sum(n * mean for (n, mean) in zip(counts, means)) / sum(counts)
+        extinct = stats["neanders"] == 0
+
+    return (ancestry, extinct, result["extinction"])
+
+def mean_interval(values):
+    '''Mean and half-width of its 95% confidence interval
+
+    The half-width is infinite if there are fewer than two values.
+    '''
+    n = len(values)
+    if n == 0:
+        return (math.nan, math.inf)
+    mean = sum(values) / n
+    if n < 2:
+        return (mean, math.inf)
+    variance = sum((value - mean) ** 2 for value in values) / (n - 1)
+    return (mean, Z * math.sqrt(variance / n))
+
+def wilson_interval(successes: int, n: int):
+    '''Wilson score 95% confidence interval of a probability. Unlike the
+    normal approximation, this does not collapse to zero width when every run
+    has the same outcome.
+
+    Returns:
+        (float, float): the lower and upper bounds
+    '''
+    if n == 0:
+        return (0.0, 1.0)
+    p = successes / n
+    denominator = 1.0 + Z * Z / n
+    centre = (p + Z * Z / (2 * n)) / denominator
+    half_width = Z * math.sqrt(p * (1.0 - p) / n + Z * Z / (4 * n * n)) / denominator
+    return (centre - half_width, centre + half_width)
+
+def proportion_interval(successes: int, n: int):
+    '''Observed proportion, and the half-width of its Wilson 95% confidence
+    interval. The interval is not centred on the proportion, so the
+    half-width is only a measure of precision: use wilson_interval for the
+    bounds.
+    '''
+    if n == 0:
+        return (0.0, math.inf)
+    (low, high) = wilson_interval(successes, n)
+    return (successes / n, 0.5 * (high - low))
+
+def estimates(outcomes):
+    '''Estimates and confidence interval half-widths for one parameter point
+
+    Args:
+        outcomes (List[(float, bool, int)]): as returned by outcome
+
+    Returns:
+        dict: (estimate, half-width) of the mean ancestry, the probability of
+            Y-extinction and the mean time to Y-extinction, keyed by
+            "ancestry", "extinct" and "extinction", and the Wilson bounds of
+            the probability of Y-extinction, keyed by "extinct_bounds". The
+            time to Y-extinction is the mean over the runs where it went
+            extinct, so it is conditional on extinction within max_cycles.
+    '''
+    ancestries = [ancestry for (ancestry, _, _) in outcomes]
+    n_extinct = sum(1 for (_, extinct, _) in outcomes if extinct)
+    times = [extinction for (_, _, extinction) in outcomes if extinction is not None]
+
+    return {
+        "ancestry": mean_interval(ancestries),
+        "extinct": proportion_interval(n_extinct, len(outcomes)),
+        "extinct_bounds": wilson_interval(n_extinct, len(outcomes)),
+        "extinction": mean_interval(times)}
+
+def shortfall(point_estimates: dict, targets: dict) -> float:
+    '''How far a point is from the target precision.
+
+    This is the largest ratio of confidence interval half-width to target
+    half-width, so the point is done when this is no more than one. The time
+    to extinction is ignored unless extinction is at least possible, judged
+    by the upper Wilson bound of its probability, as otherwise there is
+    nothing to estimate.
+
+    Args:
+        point_estimates: as returned by estimates
+        targets: target half-width for each of the keys of point_estimates
+    '''
+    ratios = [point_estimates["ancestry"][1] / targets["ancestry"],
+        point_estimates["extinct"][1] / targets["extinct"]]
+
+    (_, p_upper) = point_estimates["extinct_bounds"]
+    if p_upper > targets["extinct"]:
+        ratios.append(point_estimates["extinction"][1] / targets["extinction"])
+
+    return max(ratios)
+
+def schedule(ledger_path: str, model: str, pool_sizes, targets: dict,
+        min_replicates: int = 5, max_replicates: int = 500, first_seed: int = 0,
+        workers: int = 1, overrides: dict = None, constants: dict = None):
+    '''Sequentially allocates replicates to the points that most need them.
+
+    Every pool size first gets min_replicates runs. After that, each batch of
+    runs goes to the points whose confidence intervals are widest relative to
+    the targets, until every point either meets its targets or has had
+    max_replicates runs. Runs are memoised in the ledger, with replicate i of
+    every point using seed first_seed + i, so results are shared with sweeps.
+
+    Args:
+        ledger_path: file name of the ledger
+        model: name of the model
+        pool_sizes (Iterable[int]): the parameter points to estimate
+        targets (dict): target confidence interval half-widths, keyed by
+            "ancestry", "extinct" and "extinction"
+        min_replicates: number of runs at every point before being adaptive
+        max_replicates: maximum number of runs at any point
+        first_seed: seed of the first replicate
+        workers: number of worker processes, which is also the batch size
+        overrides: replacements for any of the DEFAULTS of the model
+        constants: replacements for any of the model_constants
+
+    Returns:
+        dict: for each pool size, a tuple of the number of runs, the
+            estimates as returned by the estimates function, and whether
+            the targets were met
+    '''
+    outcomes = {pool_size: [] for pool_size in pool_sizes}
+    jobs = [(pool_size, first_seed + replicate)
+        for pool_size in pool_sizes for replicate in range(min_replicates)]
+    batch = max(workers, 1)
+
+    while jobs:
+        results = sweep.run_many(ledger_path, model, jobs, workers, overrides, constants)
+        for ((pool_size, _), (status, result)) in zip(jobs, results):
+            if status != ledger.DONE:
+                raise RuntimeError("run of pool size {} {}".format(pool_size, status))
+            params = simulation.run_params(model, pool_size, overrides, constants)
+            outcomes[pool_size].append(outcome(model, params, result))
+
+        # Share out the next batch, each run going to whichever point has the
+        # largest shortfall, allowing for the runs already given out
+        allocated = {pool_size: 0 for pool_size in pool_sizes}
+        shortfalls = {}
+        for pool_size in pool_sizes:
+            if len(outcomes[pool_size]) < max_replicates:
+                shortfalls[pool_size] = shortfall(estimates(outcomes[pool_size]), targets)
+
+        jobs = []
+        for _ in range(batch):
+            candidates = [pool_size for (pool_size, value) in shortfalls.items() if value > 1.0
+                and len(outcomes[pool_size]) + allocated[pool_size] < max_replicates]
+            if not candidates:
+                break
+
+            # Assume the interval shrinks as one over the square root of the runs
+            def projected(pool_size):
+                n = len(outcomes[pool_size])
+                return shortfalls[pool_size] * math.sqrt(n / (n + allocated[pool_size]))
+
+            pool_size = max(candidates, key=projected)
+            jobs.append((pool_size, first_seed + len(outcomes[pool_size]) + allocated[pool_size]))
+            allocated[pool_size] += 1
+
+    report = {}
+    for pool_size in pool_sizes:
+        point_estimates = estimates(outcomes[pool_size])
+        report[pool_size] = (len(outcomes[pool_size]), point_estimates,
+            shortfall(point_estimates, targets) <= 1.0)
+    return report
+
+def print_report(report: dict):
+    '''Writes to stdout a tab-separated table of the estimates at each point
+    '''
+    print("pool\truns\tconverged\tancestry\t+-\tp_extinct\t+-\textinction\t+-")
+    for (pool_size, (runs, point_estimates, converged)) in sorted(report.items()):
+        columns = [pool_size, runs, converged]
+        for name in ("ancestry", "extinct", "extinction"):
+            columns.extend(point_estimates[name])
+        print("\t".join(str(column) for column in columns))
+
+    print("total runs: {}".format(sum(runs for (runs, _, _) in report.values())))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run replicates of a model until its estimates are tight enough")
+    parser.add_argument("--model", choices=sorted(simulation.MODELS), default="evolve")
+    parser.add_argument("--pools", type=sweep.parse_range, default=sweep.parse_range("1-6"))
+    parser.add_argument("--ancestry", type=float, default=0.02,
+        help="target 95%% half-width of the mean proportion of sapiens genes")
+    parser.add_argument("--extinct", type=float, default=0.1,
+        help="target 95%% half-width of the probability of Y-extinction")
+    parser.add_argument("--extinction", type=float, default=5.0,
+        help="target 95%% half-width of the mean cycles to Y-extinction")
+    parser.add_argument("--min-replicates", type=int, default=5)
+    parser.add_argument("--max-replicates", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first replicate")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--ledger", default="sweep.db")
+    parser.add_argument("--set", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a run parameter, e.g. max_cycles=200")
+    parser.add_argument("--const", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a model constant, e.g. ALWAYS_KILL=0")
+    parser.add_argument("--stop", metavar="RULES",
+        help="stopping rules to use instead of extra_cycles, e.g. stationary:20:0.01,y_extinct:40")
+    args = parser.parse_args(argv)
+
+    overrides = dict(args.set)
+    if args.stop:
+        overrides["stop"] = args.stop
+
+    targets = {"ancestry": args.ancestry, "extinct": args.extinct, "extinction": args.extinction}
+    report = schedule(args.ledger, args.model, args.pools, targets,
+        args.min_replicates, args.max_replicates, args.seed, args.workers,
+        overrides, dict(args.const))
+    print_report(report)
+
+if __name__ == '__main__':
+    main()
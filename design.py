@@ -0,0 +1,478 @@
+import argparse
+import json
+import math
+import os
+import random
+
+import adaptive
+import ledger
+import simulation
+import sweep
+
+# A design-of-experiments sweep varies several model constants and run
+# parameters at once, over a space-filling design of points rather than a full
+# grid, and fits a cheap surrogate of the outcome to the runs. The surrogate is
+# saved, so it can be queried at points that were never run, and is used to
+# estimate the Sobol sensitivity indices that rank the factors. For example
+#
+#     python design.py run --model multi-gene --points 64 --factor BREEDING_PROPORTION=0.2:0.8
+#         --factor MAX_POPULATION=500:4000 --factor NUMBER_OF_MISCARRY_GENES=5:40
+#     python design.py query --surrogate-file design.json BREEDING_PROPORTION=0.3
+
+# Direction numbers of the Sobol sequence for its second and later dimensions,
+# from Joe and Kuo (2008): the degree, the coefficients and the initial
+# numbers of the primitive polynomial of each dimension. The first dimension
+# is the van der Corput sequence. The number of entries limits the factors of
+# a Sobol design.
+SOBOL_DIRECTIONS = [
+    (1, 0, [1]), (2, 1, [1, 3]), (3, 1, [1, 3, 1]), (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]), (4, 4, [1, 3, 5, 13]), (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]), (5, 7, [1, 1, 7, 11, 19]), (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]), (5, 14, [1, 3, 5, 5, 31]),
+]
+SOBOL_BITS = 30
+
+# The outcomes fitted by the surrogate. The ancestry is the final proportion of
+# sapiens genes, and the extinction is the cycle when the neanderthal
+# Y-chromosome went extinct. Runs where it did not go extinct are censored,
+# and are left out of the extinction, so that is the mean time to extinction
+# given that it happened within max_cycles. Points where it never did are
+# left out of the extinction surrogate.
+RESPONSES = ["ancestry", "extinction"]
+
+# Length scales and noise levels tried when fitting a Gaussian process. The
+# factors are scaled to the unit cube, and the responses to unit variance.
+GP_LENGTH_SCALES = [0.1, 0.2, 0.35, 0.5, 0.75, 1.0, 1.5, 2.5]
+GP_NOISES = [0.001, 0.01, 0.05, 0.1, 0.25, 0.5]
+
+# Number of base samples used to estimate the sensitivity indices. Each costs
+# one surrogate evaluation per factor, plus two.
+SENSITIVITY_SAMPLES = 1024
+
+# A surrogate whose variance over the unit cube is no more than this times its
+# squared mean is taken to be flat, and all its sensitivity indices are zero.
+# Fitting a constant leaves rounding residue, and dividing by it would give
+# arbitrarily large indices.
+SENSITIVITY_TOLERANCE = 1e-12
+
+def parse_factor(text: str):
+    '''Parses a NAME=LOW:HIGH factor. The factor takes whole values if both
+    bounds are whole numbers
+
+    Returns:
+        (str, float, float, bool): name, bounds, and whether it is whole
+    '''
+    (name, _, bounds) = text.partition("=")
+    (low, _, high) = bounds.partition(":")
+    if not high:
+        raise ValueError("factor {} needs bounds LOW:HIGH".format(text))
+    (low, high) = (json.loads(low), json.loads(high))
+    return (name, low, high, isinstance(low, int) and isinstance(high, int))
+
+def latin_hypercube(n: int, dimensions: int, rng: random.Random) -> list:
+    '''A Latin hypercube design of n points in the unit cube. Every dimension
+    is split into n equal strata, each holding exactly one point
+    '''
+    columns = []
+    for _ in range(dimensions):
+        strata = list(range(n))
+        rng.shuffle(strata)
+        columns.append([(stratum + rng.random()) / n for stratum in strata])
+    return [list(point) for point in zip(*columns)]
+
+def sobol(n: int, dimensions: int, rng: random.Random) -> list:
+    '''The first n points of a Sobol sequence in the unit cube, randomised by
+    a digital shift, which keeps its low discrepancy. Best with n a power of two
+    '''
+    if dimensions > len(SOBOL_DIRECTIONS) + 1:
+        raise ValueError("Sobol designs have at most {} factors".format(len(SOBOL_DIRECTIONS) + 1))
+
+    directions = [[1 << (SOBOL_BITS - 1 - i) for i in range(SOBOL_BITS)]]
+    for (degree, coefficients, initial) in SOBOL_DIRECTIONS[:dimensions - 1]:
+        numbers = [m << (SOBOL_BITS - 1 - i) for (i, m) in enumerate(initial)]
+        for i in range(degree, SOBOL_BITS):
+            number = numbers[i - degree] ^ (numbers[i - degree] >> degree)
+            for k in range(1, degree):
+                if (coefficients >> (degree - 1 - k)) & 1:
+                    number ^= numbers[i - k]
+            numbers.append(number)
+        directions.append(numbers)
+
+    # Gray code order: each point differs from the last in one direction number
+    shifts = [rng.getrandbits(SOBOL_BITS) for _ in range(dimensions)]
+    scale = 1.0 / (1 << SOBOL_BITS)
+    state = [0] * dimensions
+    points = []
+    for index in range(n):
+        points.append([(bits ^ shift) * scale for (bits, shift) in zip(state, shifts)])
+        lowest_zero = (~index & (index + 1)).bit_length() - 1
+        state = [bits ^ numbers[lowest_zero] for (bits, numbers) in zip(state, directions)]
+    return points
+
+DESIGNS = {"lhs": latin_hypercube, "sobol": sobol}
+
+def solve(matrix: list, vector: list) -> list:
+    '''Solves a small dense linear system by Gaussian elimination with partial
+    pivoting. The arguments are not modified
+    '''
+    n = len(vector)
+    rows = [list(row) + [value] for (row, value) in zip(matrix, vector)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda row: abs(rows[row][column]))
+        (rows[column], rows[pivot]) = (rows[pivot], rows[column])
+        if rows[column][column] == 0.0:
+            raise ValueError("singular matrix")
+        for row in range(column + 1, n):
+            factor = rows[row][column] / rows[column][column]
+            if factor != 0.0:
+                rows[row] = [a - factor * b for (a, b) in zip(rows[row], rows[column])]
+
+    solution = [0.0] * n
+    for row in range(n - 1, -1, -1):
+        total = rows[row][n] - sum(rows[row][k] * solution[k] for k in range(row + 1, n))
+        solution[row] = total / rows[row][row]
+    return solution
+
+def cholesky(matrix: list) -> list:
+    '''Lower triangular factor of a symmetric positive definite matrix
+    '''
+    n = len(matrix)
+    lower = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1):
+            total = matrix[i][j] - sum(lower[i][k] * lower[j][k] for k in range(j))
+            if i == j:
+                if total <= 0.0:
+                    raise ValueError("matrix is not positive definite")
+                lower[i][i] = math.sqrt(total)
+            else:
+                lower[i][j] = total / lower[j][j]
+    return lower
+
+def cholesky_solve(lower: list, vector: list) -> list:
+    '''Solves L L^T x = b, given the Cholesky factor L
+    '''
+    n = len(vector)
+    forward = [0.0] * n
+    for i in range(n):
+        forward[i] = (vector[i] - sum(lower[i][k] * forward[k] for k in range(i))) / lower[i][i]
+    solution = [0.0] * n
+    for i in range(n - 1, -1, -1):
+        solution[i] = (forward[i] - sum(lower[k][i] * solution[k] for k in range(i + 1, n))) / lower[i][i]
+    return solution
+
+class Quadratic:
+    '''Least-squares fit of a full quadratic polynomial, with interactions, in
+    the factors scaled to the unit cube. Falls back to a linear fit if there
+    are too few points for all the terms.
+    '''
+
+    def __init__(self, state: dict = None):
+        self.degree = state["degree"] if state else 2
+        self.coefficients = state["coefficients"] if state else []
+
+    def terms(self, x: list) -> list:
+        values = [1.0] + list(x)
+        if self.degree == 2:
+            values.extend(x[i] * x[j] for i in range(len(x)) for j in range(i, len(x)))
+        return values
+
+    def fit(self, points: list, values: list):
+        dimensions = len(points[0])
+        self.degree = 2 if len(points) > (dimensions + 1) * (dimensions + 2) // 2 else 1
+        rows = [self.terms(x) for x in points]
+        n_terms = len(rows[0])
+
+        # Normal equations, with a little ridge to keep them well conditioned
+        normal = [[sum(row[i] * row[j] for row in rows) + (1e-9 if i == j else 0.0)
+            for j in range(n_terms)] for i in range(n_terms)]
+        self.coefficients = solve(normal, [sum(row[i] * y for (row, y) in zip(rows, values))
+            for i in range(n_terms)])
+
+    def predict(self, x: list) -> float:
+        return sum(c * t for (c, t) in zip(self.coefficients, self.terms(x)))
+
+    def state(self) -> dict:
+        return {"kind": "quadratic", "degree": self.degree, "coefficients": self.coefficients}
+
+class GaussianProcess:
+    '''Gaussian-process emulator with a squared-exponential kernel, in the
+    factors scaled to the unit cube. The length scale and the noise, which
+    absorbs the Monte-Carlo scatter of the runs, are chosen from GP_LENGTH_SCALES
+    and GP_NOISES by maximum marginal likelihood.
+    '''
+
+    def __init__(self, state: dict = None):
+        state = state or {}
+        self.points = state.get("points", [])
+        self.weights = state.get("weights", [])
+        self.length_scale = state.get("length_scale", 1.0)
+        self.noise = state.get("noise", 0.0)
+        self.mean = state.get("mean", 0.0)
+        self.scale = state.get("scale", 1.0)
+
+    def kernel(self, a: list, b: list, length_scale: float) -> float:
+        return math.exp(-0.5 * sum((p - q) ** 2 for (p, q) in zip(a, b)) / (length_scale * length_scale))
+
+    def fit(self, points: list, values: list):
+        n = len(values)
+        self.mean = sum(values) / n
+        self.scale = math.sqrt(sum((y - self.mean) ** 2 for y in values) / n) or 1.0
+        targets = [(y - self.mean) / self.scale for y in values]
+
+        best = None
+        for length_scale in GP_LENGTH_SCALES:
+            covariance = [[self.kernel(a, b, length_scale) for b in points] for a in points]
+            for noise in GP_NOISES:
+                try:
+                    lower = cholesky([[value + (noise if i == j else 0.0) for (j, value) in enumerate(row)]
+                        for (i, row) in enumerate(covariance)])
+                except ValueError:
+                    continue
+                weights = cholesky_solve(lower, targets)
+                likelihood = (-0.5 * sum(y * w for (y, w) in zip(targets, weights))
+                    - sum(math.log(lower[i][i]) for i in range(n)))
+                if best is None or likelihood > best[0]:
+                    best = (likelihood, length_scale, noise, weights)
+
+        (_, self.length_scale, self.noise, self.weights) = best
+        self.points = [list(x) for x in points]
+
+    def predict(self, x: list) -> float:
+        return self.mean + self.scale * sum(w * self.kernel(x, point, self.length_scale)
+            for (w, point) in zip(self.weights, self.points))
+
+    def state(self) -> dict:
+        return {"kind": "gp", "points": self.points, "weights": self.weights,
+            "length_scale": self.length_scale, "noise": self.noise, "mean": self.mean, "scale": self.scale}
+
+SURROGATES = {"quadratic": Quadratic, "gp": GaussianProcess}
+
+def load_surrogate(state: dict):
+    '''Recreates a fitted surrogate from its state
+    '''
+    return SURROGATES[state["kind"]](state)
+
+def sensitivity(surrogate, dimensions: int, rng: random.Random, samples: int = SENSITIVITY_SAMPLES) -> list:
+    '''First-order and total Sobol sensitivity indices of each factor, over the
+    unit cube, estimated on the surrogate by the Saltelli and Jansen estimators
+
+    Returns:
+        List[(float, float)]: first-order and total index of each factor,
+            which are all zero if the surrogate is flat
+    '''
+    a = [[rng.random() for _ in range(dimensions)] for _ in range(samples)]
+    b = [[rng.random() for _ in range(dimensions)] for _ in range(samples)]
+    f_a = [surrogate.predict(x) for x in a]
+    f_b = [surrogate.predict(x) for x in b]
+    mean = sum(f_a + f_b) / (2 * samples)
+    variance = sum((y - mean) ** 2 for y in f_a + f_b) / (2 * samples)
+    if variance <= SENSITIVITY_TOLERANCE * mean * mean:
+        return [(0.0, 0.0)] * dimensions
+
+    indices = []
+    for i in range(dimensions):
+        f_ab = [surrogate.predict(x[:i] + [y[i]] + x[i + 1:]) for (x, y) in zip(a, b)]
+        # Centring f_b does not change the expectation, but keeps the
+        # estimate from being swamped when the mean is large
+        first = sum((fb - mean) * (fab - fa) for (fa, fb, fab) in zip(f_a, f_b, f_ab)) / samples / variance
+        total = sum((fa - fab) ** 2 for (fa, fab) in zip(f_a, f_ab)) / (2 * samples) / variance
+        indices.append((first, total))
+    return indices
+
+def factor_values(factors: list, x: list) -> dict:
+    '''Converts a point of the unit cube into values of the factors
+    '''
+    values = {}
+    for ((name, low, high, whole), u) in zip(factors, x):
+        value = low + u * (high - low)
+        values[name] = min(max(int(round(value)), low), high) if whole else value
+    return values
+
+def unit_point(factors: list, values: dict) -> list:
+    '''Converts values of the factors into a point of the unit cube
+    '''
+    return [(values[name] - low) / (high - low) if high != low else 0.5 for (name, low, high, _) in factors]
+
+def run_design(ledger_path: str, model: str, factors: list, design: list, pool_size: int = 1,
+        replicates: int = 1, first_seed: int = 0, workers: int = 1,
+        overrides: dict = None, constants: dict = None) -> list:
+    '''Runs replicates of a model at every point of a design, skipping
+    memoised runs.
+
+    Args:
+        ledger_path: file name of the ledger
+        model: name of the model
+        factors (List[(str, float, float, bool)]): as returned by parse_factor.
+            Each is pool_size, one of the DEFAULTS of the model, or a constant
+        design (List[List[float]]): points of the unit cube
+        pool_size: number of choices when picking a partner, unless it is
+            one of the factors
+        replicates: number of Monte-Carlo runs at every point
+        first_seed: seed of the first replicate
+        workers: number of worker processes
+        overrides: replacements for any of the DEFAULTS of the model
+        constants: replacements for any of the model_constants
+
+    Returns:
+        List[(dict, dict)]: the factor values of each point, and the mean of
+            each of the RESPONSES over its replicates. The extinction is the
+            mean over the replicates that went extinct, or None if none did
+    '''
+    points = [factor_values(factors, x) for x in design]
+    jobs = []
+    for values in points:
+        job_overrides = {name: value for (name, value) in values.items() if name in simulation.DEFAULTS[model]}
+        job_constants = {name: value for (name, value) in values.items()
+            if name not in job_overrides and name != "pool_size"}
+        jobs.extend((values.get("pool_size", pool_size), first_seed + replicate, job_constants, job_overrides)
+            for replicate in range(replicates))
+    results = sweep.run_many(ledger_path, model, jobs, workers, overrides, constants)
+
+    outcomes = []
+    for (i, values) in enumerate(points):
+        responses = {name: 0.0 for name in RESPONSES}
+        times = []
+        for (job, (status, result)) in zip(jobs[i * replicates:(i + 1) * replicates],
+                results[i * replicates:(i + 1) * replicates]):
+            if status != ledger.DONE:
+                raise RuntimeError("run at {} {}".format(values, status))
+            params = simulation.run_params(model, job[0], dict(overrides or {}, **job[3]),
+                dict(constants or {}, **job[2]))
+            (ancestry, _, extinction) = adaptive.outcome(model, params, result)
+            responses["ancestry"] += ancestry / replicates
+            if extinction is not None:
+                times.append(extinction)
+        responses["extinction"] = sum(times) / len(times) if times else None
+        outcomes.append((values, responses))
+    return outcomes
+
+def fit(factors: list, outcomes: list, kind: str = "gp") -> dict:
+    '''Fits a surrogate of each of the RESPONSES to the outcomes of run_design,
+    leaving out the points where the response is not known
+
+    Returns:
+        dict: the fitted surrogates, keyed by response. Responses not known
+            at any point are left out
+    '''
+    surrogates = {}
+    for name in RESPONSES:
+        (points, values) = known_points(factors, outcomes, name)
+        if points:
+            surrogate = SURROGATES[kind]()
+            surrogate.fit(points, values)
+            surrogates[name] = surrogate
+    return surrogates
+
+def known_points(factors: list, outcomes: list, name: str):
+    '''The points of the unit cube where a response is known, and its values
+    there
+    '''
+    pairs = [(unit_point(factors, values), responses[name]) for (values, responses) in outcomes
+        if responses[name] is not None]
+    return ([point for (point, _) in pairs], [value for (_, value) in pairs])
+
+def r_squared(surrogate, points: list, values: list) -> float:
+    '''Proportion of the variance of the values explained by the surrogate
+    '''
+    mean = sum(values) / len(values)
+    total = sum((y - mean) ** 2 for y in values)
+    residual = sum((y - surrogate.predict(x)) ** 2 for (x, y) in zip(points, values))
+    return 1.0 - residual / total if total > 0.0 else 1.0
+
+def main_run(args):
+    overrides = dict(args.set)
+    if args.stop:
+        overrides["stop"] = args.stop
+    factors = [parse_factor(text) for text in args.factor]
+    if not factors:
+        raise SystemExit("give at least one --factor")
+    known = set(simulation.model_constants(args.model, overrides.get("engine", "standard")))
+    known.update(simulation.DEFAULTS[args.model], ["pool_size"])
+    for (name, _, _, _) in factors:
+        if name not in known:
+            raise KeyError("{} has no constant or run parameter {}".format(args.model, name))
+
+    rng = random.Random(args.design_seed)
+    design = DESIGNS[args.design](args.points, len(factors), rng)
+    outcomes = run_design(args.ledger, args.model, factors, design, args.pool, args.replicates,
+        args.seed, args.workers, overrides, dict(args.const))
+
+    names = [name for (name, _, _, _) in factors]
+    print("\t".join(names + RESPONSES))
+    for (values, responses) in outcomes:
+        print("\t".join(str(value) for value in list(values.values()) + list(responses.values())))
+
+    surrogates = fit(factors, outcomes, args.surrogate)
+    print()
+    print("response\tsurrogate\tpoints\tR^2")
+    for name in surrogates:
+        (points, values) = known_points(factors, outcomes, name)
+        print("{}\t{}\t{}\t{}".format(name, args.surrogate, len(points), r_squared(surrogates[name], points, values)))
+
+    # Rank the factors by their total effect on the ancestry
+    indices = {name: sensitivity(surrogate, len(factors), rng) for (name, surrogate) in surrogates.items()}
+    print()
+    print("factor\t" + "\t".join("{0}-first\t{0}-total".format(name) for name in RESPONSES))
+    for i in sorted(range(len(factors)), key=lambda i: -indices["ancestry"][i][1]):
+        columns = [names[i]]
+        for name in RESPONSES:
+            columns.extend(indices[name][i] if name in indices else [None, None])
+        print("\t".join(str(column) for column in columns))
+
+    with open(args.surrogate_file, "w") as output:
+        json.dump({"model": args.model, "factors": factors,
+            "surrogates": {name: surrogate.state() for (name, surrogate) in surrogates.items()}}, output)
+    print()
+    print("wrote {}".format(args.surrogate_file))
+
+def main_query(args):
+    with open(args.surrogate_file) as source:
+        saved = json.load(source)
+    values = factor_values(saved["factors"], [0.5] * len(saved["factors"]))
+    values.update(dict(args.values))
+    x = unit_point(saved["factors"], values)
+    names = [name for (name, _, _, _) in saved["factors"]]
+    print("\t".join(names + list(saved["surrogates"])))
+    print("\t".join(str(value) for value in [values[name] for name in names]
+        + [load_surrogate(state).predict(x) for state in saved["surrogates"].values()]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a model over a space-filling design, and fit a surrogate of the results")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a design, fit the surrogate and rank the factors")
+    run_parser.add_argument("--model", choices=sorted(simulation.MODELS), default="evolve")
+    run_parser.add_argument("--factor", action="append", default=[], metavar="NAME=LOW:HIGH",
+        help="a constant or run parameter to vary, e.g. ALWAYS_KILL=0:20 or BREEDING_PROPORTION=0.2:0.8")
+    run_parser.add_argument("--design", choices=sorted(DESIGNS), default="lhs")
+    run_parser.add_argument("--points", type=int, default=32, help="number of points in the design")
+    run_parser.add_argument("--design-seed", type=int, default=0, help="seed of the design itself")
+    run_parser.add_argument("--surrogate", choices=sorted(SURROGATES), default="gp")
+    run_parser.add_argument("--surrogate-file", default="design.json", help="where to save the surrogate")
+    run_parser.add_argument("--pool", type=int, default=1, help="pool size, unless it is a factor")
+    run_parser.add_argument("--replicates", type=int, default=1, help="Monte-Carlo runs at each point")
+    run_parser.add_argument("--seed", type=int, default=0, help="seed of the first replicate")
+    run_parser.add_argument("--workers", type=int, default=os.cpu_count())
+    run_parser.add_argument("--ledger", default="sweep.db")
+    run_parser.add_argument("--set", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a run parameter, e.g. max_cycles=200")
+    run_parser.add_argument("--const", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a model constant, e.g. ALWAYS_KILL=0")
+    run_parser.add_argument("--stop", metavar="RULES",
+        help="stopping rules to use instead of extra_cycles, e.g. stationary:20:0.01,y_extinct:40")
+
+    query_parser = commands.add_parser("query", help="predict the outcome at a point from a saved surrogate")
+    query_parser.add_argument("--surrogate-file", default="design.json")
+    query_parser.add_argument("values", type=simulation.parse_assignment, nargs="*", metavar="NAME=VALUE",
+        help="values of the factors, by default the middle of their ranges")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        main_run(args)
+    else:
+        main_query(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,47 @@
+import itertools
 import random
 
-def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
+import lineage
+import miscarriage
+import sampling
+import spatial
+import stopping
+
+# Population caps and fixed kill count used by one_culling_cycle
+MALE_MAX_POPULATION = 10000
+FEMALE_MAX_POPULATION = 10000
+ALWAYS_KILL = 10
+
+# How partners are chosen. "pool" means picking the best of pool_size randomly
+# chosen candidates. "weighted" ignores pool_size, and picks any candidate with
+# probability proportional to exp(-MATE_CHOICE_BETA * distance), bucketing the
+# candidates into MATE_CHOICE_BUCKETS buckets of sapiensness.
+MATE_CHOICE = "pool"
+MATE_CHOICE_BETA = 10.0
+MATE_CHOICE_BUCKETS = 100
+
+# Model of miscarriages, as described in miscarriage.py. The default is that a
+# boy with a neanderthal Y-chromosome miscarries with probability equal to the
+# sapiensness of his mother.
+MISCARRIAGE = "linear:1.0"
+
+# If more than zero, the paternal lineage of every male is tracked, as
+# described in lineage.py, and lineages that have died out are pruned every
+# LINEAGES cycles. Off by default, as it costs memory and time.
+LINEAGES = 0
+
+# If more than zero, every individual has a position in the unit square, and a
+# female only considers males within SPATIAL_RADIUS of her, as described in
+# spatial.py, and does not breed if there are none. A child is born near its
+# mother, moved by a normal distribution with standard deviation
+# SPATIAL_DISPERSAL in each direction. Each run then reports a map of
+# ancestry, on a grid of SPATIAL_MAP_BINS cells a side, and the width of the
+# hybrid zone.
+SPATIAL_RADIUS = 0.0
+SPATIAL_DISPERSAL = 0.02
+SPATIAL_MAP_BINS = 10
+
+def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size, lineages=None, landscape=None):
     '''Executes one breeding cycle, given a population of mixed species
 
     Each of the population parameters is a list of floating point numbers,
@@ -20,7 +61,7 @@ def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
     In other words, the difference between male_sapiens and male_neanderthal is
     that the latter carries a neanderthal Y-chromosome. The probability of 
     miscarriage when a male foetus carries a neanderthal Y-chromosome is defined by the
-    miscarry_with_neanderthal function, which is called from within this function.
+    MISCARRIAGE model, which is applied by the conceive function.
 
     The probability of a sapiens mating with a neanderthal is defined by the 
     find_partner function, which is called from within this function.
@@ -30,6 +71,9 @@ def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
         male_neanders (List[float]): males with neanderthal y-chromosome
         females (List[float]): females of any species
         pool_size (int): how many partners to consider when finding the best  
+        lineages (lineage.Lineages): if given, the sons are added to it
+        landscape (spatial.Landscape): if given, mates are chosen locally,
+            and the children are added to it
 
     Returns:
         None: The input lists are all modified in place.
@@ -37,27 +81,9 @@ def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
     '''
 
     # Create arrays for offspring. We assume these cannot mate within this cycle,
-    # so keep them separate
-    boy_sapiens = []
-    boy_neanders = []
-    girls = []
-
-    # Each female tries to mate. We assume that all females mate with at most one
-    # partner at a time, so we iterate through females rather than males. Males on
-    # the other hand may have zero, one or many partners in any cycle. 
-    for female in females:
-        boy = random.randint(0, 1) == 0 # assume equal probability of boy or girl
-        (is_sapiens, male) = find_partner(female, male_sapiens, male_neanders, pool_size)
-        mix = (male + female) * 0.5
-        if not boy:
-            # girls never miscarry (at least in this simulation)
-            girls.append(mix)
-        elif is_sapiens:
-            # no miscarriages with sapiens Y-chromosome
-            boy_sapiens.append(mix)
-        elif not miscarry_with_neanderthal(female):
-            # picked a neanderthal, produced a male foetus, and tested for miscarriage
-            boy_neanders.append(mix)
+    # so keep them separate. Every female tries to mate.
+    (boy_sapiens, boy_neanders, girls) = conceive(females, male_sapiens, male_neanders, pool_size,
+        lineages, landscape)
 
     # Append the new individuals to the ends of the lists. We keep them
     # at the end, so position in the list is an indication of age. For
@@ -69,9 +95,127 @@ def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
 
     return None
 
+def conceive(mothers, male_sapiens, male_neanders, pool_size, lineages=None, landscape=None):
+    '''Each of the given females picks a partner, and may bear a child.
+
+    All the pregnancies are tested for miscarriage in one batch, using the
+    MISCARRIAGE model.
+
+    Args:
+        mothers (Iterable[float]): the females who are to mate
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        pool_size (int): how many partners to consider when finding the best
+        lineages (lineage.Lineages): if given, the surviving boys are added to
+            it, so they must then be added to the end of the male lists
+        landscape (spatial.Landscape): if given, the mothers must be all the
+            females, in order. Each picks from the males near her, or does
+            not breed if there are none, and the surviving children are added
+            to it, so they must then be added to the end of the lists
+
+    Returns:
+        (List[float], List[float], List[float]): the surviving boys with
+            sapiens y-chromosome, boys with neanderthal y-chromosome, and girls
+
+    '''
+
+    # For weighted mate choice, index the males by sapiensness once per cycle
+    if MATE_CHOICE == "weighted":
+        choice = sampling.WeightedChoice(
+            itertools.chain(male_sapiens, male_neanders), MATE_CHOICE_BETA, MATE_CHOICE_BUCKETS)
+
+    if lineages is not None:
+        (sapiens_nodes, neander_nodes) = (lineages.living(True), lineages.living(False))
+
+    # For spatial mate choice, index the males by position once per cycle
+    if landscape is not None:
+        if MATE_CHOICE == "weighted":
+            raise ValueError("weighted mate choice cannot be spatial")
+        grid = landscape.grid()
+        (mother_xs, mother_ys) = (landscape.xs[2], landscape.ys[2])
+
+    # We assume that all females mate with at most one partner at a time, so we
+    # iterate through females rather than males. Males on the other hand may
+    # have zero, one or many partners in any cycle.
+    females = []
+    neanderthal_y = []
+    boys = []
+    mixes = []
+    fathers = []
+    places = []
+    for (i, female) in enumerate(mothers):
+        boy = random.randint(0, 1) == 0 # assume equal probability of boy or girl
+        if MATE_CHOICE == "weighted":
+            (is_sapiens, index) = find_weighted_partner_index(female, male_sapiens, male_neanders, choice)
+        elif landscape is not None:
+            picks = grid.near(mother_xs[i], mother_ys[i], pool_size)
+            if not picks:
+                continue
+            (is_sapiens, index) = find_partner_index(female, male_sapiens, male_neanders, pool_size, picks)
+            places.append(i)
+        else:
+            (is_sapiens, index) = find_partner_index(female, male_sapiens, male_neanders, pool_size)
+        male = male_sapiens[index] if is_sapiens else male_neanders[index]
+        females.append(female)
+        neanderthal_y.append(not is_sapiens)
+        boys.append(boy)
+        mixes.append((male + female) * 0.5)
+        if lineages is not None:
+            fathers.append(sapiens_nodes[index] if is_sapiens else neander_nodes[index])
+
+    boy_sapiens = []
+    boy_neanders = []
+    girls = []
+    miscarried = miscarriage.mask(MISCARRIAGE, females, neanderthal_y, boys)
+    for (is_neanderthal, boy, mix, lost) in zip(neanderthal_y, boys, mixes, miscarried):
+        if lost:
+            continue
+        if not boy:
+            girls.append(mix)
+        elif is_neanderthal:
+            boy_neanders.append(mix)
+        else:
+            boy_sapiens.append(mix)
+
+    # The sons are added to the lineages in the same order as to the boy lists
+    if lineages is not None:
+        sons = [(is_neanderthal, father) for (is_neanderthal, boy, father, lost)
+            in zip(neanderthal_y, boys, fathers, miscarried) if boy and not lost]
+        lineages.add_sons(True, [father for (is_neanderthal, father) in sons if not is_neanderthal])
+        lineages.add_sons(False, [father for (is_neanderthal, father) in sons if is_neanderthal])
+
+    # Likewise the children are placed near their mothers
+    if landscape is not None:
+        born = [(is_neanderthal, boy, landscape.disperse(mother_xs[i], mother_ys[i]))
+            for (i, is_neanderthal, boy, lost) in zip(places, neanderthal_y, boys, miscarried) if not lost]
+        landscape.add(0, [position for (is_neanderthal, boy, position) in born if boy and not is_neanderthal])
+        landscape.add(1, [position for (is_neanderthal, boy, position) in born if boy and is_neanderthal])
+        landscape.add(2, [position for (is_neanderthal, boy, position) in born if not boy])
+
+    return (boy_sapiens, boy_neanders, girls)
+
 def find_partner(female, male_sapiens, male_neanders, pool_size):
     ''' Finds a male partner for the given female.
 
+    See find_partner_index, which makes the choice.
+
+    Args:
+        female (float): the sapiensness of the female
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        pool_size (int): how many males to consider when finding the best 
+
+    Returns:
+        (bool, float): The bool is true if the male partner has a sapiens
+            y-chromosome. The float represents the sapiensness of the partner.
+    
+    '''
+    (is_sapiens, index) = find_partner_index(female, male_sapiens, male_neanders, pool_size)
+    return (is_sapiens, male_sapiens[index] if is_sapiens else male_neanders[index])
+
+def find_partner_index(female, male_sapiens, male_neanders, pool_size, picks=None):
+    ''' Finds a male partner for the given female, returning where he is.
+
     The female's species is a floating point number ranging from 0.0
     meaning totally neanderthal to 1.0 meaning totally sapiens. The
     populations of male sapiens and neanders are both lists of floats,
@@ -82,10 +226,13 @@ def find_partner(female, male_sapiens, male_neanders, pool_size):
         male_sapiens (List[float]): males with sapiens y-chromosome
         male_neanders (List[float]): males with neanderthal y-chromosome
         pool_size (int): how many males to consider when finding the best 
+        picks (List[int]): if given, the males to consider, numbered through
+            male_sapiens followed by male_neanders, rather than drawing them
+            at random from the whole population
 
     Returns:
-        (bool, float): The bool is true if the male partner has a sapiens
-            y-chromosome. The float represents the sapiensness of the partner.
+        (bool, int): The bool is true if the male partner has a sapiens
+            y-chromosome. The int is his index in male_sapiens or male_neanders.
     
     '''
     n_sapiens = len(male_sapiens)
@@ -98,61 +245,75 @@ def find_partner(female, male_sapiens, male_neanders, pool_size):
     # the best. The number of draws makes a critical difference to the outcome.
 
     best_distance = 1.1      # the maximum possible is 1
-    best_male = 0.0          # in practice this is always overridden
+    best_index = 0           # in practice this is always overridden
     best_is_sapiens = False  # this is also overridden
 
     # Adjust the female, pushing her to one or other extreme.
     exactly_half = female == 0.5
     adj_female = 0.0 if female < 0.5 else 1.0
 
-    for _ in range(pool_size):
-        pick = random.randint(0, n_total - 1)
+    for j in range(pool_size):
+        pick = random.randint(0, n_total - 1) if picks is None else picks[j]
         is_sapiens = pick < n_sapiens
         if is_sapiens:
             male = male_sapiens[pick]
         else:
-            male = male_neanders[pick - n_sapiens]
+            pick -= n_sapiens
+            male = male_neanders[pick]
 
         # if the female is exactly half, no point choosing
         if exactly_half:
-            return (is_sapiens, male)
+            return (is_sapiens, pick)
 
         distance = abs(male - adj_female)   # L infinite norm
         if distance < best_distance:
             best_distance = distance
-            best_male = male
+            best_index = pick
             best_is_sapiens = is_sapiens
     
     assert(best_distance <= 1.0)
-    return (best_is_sapiens, best_male)
+    return (best_is_sapiens, best_index)
 
-def miscarry_with_neanderthal(female):
-    '''Will sex between a neanderthal male and the given female result in
-    miscarriage?
+def find_weighted_partner(female, male_sapiens, male_neanders, choice):
+    ''' Finds a male partner for the given female, by weighted (soft) choice.
 
-    Assumes that the foetus is male and carries the neanderthal Y-chromosome.
-
-    We make the simplifying assumption that the miscarriage-causing genes are
-    equally spread among all genes, so whether a miscarriage occurs is a
-    probabilistic function of the proportion of sapiens-ness, with 100% probability
-    for sapiens and 0% probability for neanderthal. The shape of the function, and
-    the Monte-Carlo draws that define instances are internal to this function.
+    As in find_partner, the female prefers males close to whichever extreme is
+    nearest her own sapiensness. Rather than picking the best of a pool, she
+    may pick any male, with probability proportional to
+    exp(-MATE_CHOICE_BETA * distance).
 
     Args:
-        female (float): The sapiensness of the female carrying the foetus
+        female (float): the sapiensness of the female
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        choice (sampling.WeightedChoice): index of male_sapiens followed by
+            male_neanders, built once per breeding cycle
 
     Returns:
-        bool: true if there is miscarriage, or false if the pregnancy runs to term.
+        (bool, float): The bool is true if the male partner has a sapiens
+            y-chromosome. The float represents the sapiensness of the partner.
 
     '''
+    (is_sapiens, index) = find_weighted_partner_index(female, male_sapiens, male_neanders, choice)
+    return (is_sapiens, male_sapiens[index] if is_sapiens else male_neanders[index])
 
-    # For simplicity, assume a linear probabilistic function, where a neanderthal
-    # female (0.0) has zero probability of miscarrying and a sapiens female (1.0)
-    # miscarries with probability one.
-    draw = random.random()  # a uniform draw between zero and one: range [0, 1)
-    return draw < female    # always true if female = 1.0, never true if female = 0.0
+def find_weighted_partner_index(female, male_sapiens, male_neanders, choice):
+    ''' As find_weighted_partner, but returns whether the partner has a sapiens
+    y-chromosome and his index in male_sapiens or male_neanders.
+    '''
+    n_sapiens = len(male_sapiens)
+
+    # if the female is exactly half, she has no preference
+    if female == 0.5:
+        pick = random.randint(0, n_sapiens + len(male_neanders) - 1)
+    else:
+        pick = choice.draw(0.0 if female < 0.5 else 1.0)
+
+    if pick < n_sapiens:
+        return (True, pick)
+    return (False, pick - n_sapiens)
 
-def one_culling_cycle(male_sapiens, male_neanders, females):
+def one_culling_cycle(male_sapiens, male_neanders, females, lineages=None, landscape=None):
     '''Kills off some proportion of the population.
 
     The parameters each list a number of individuals who may be
@@ -172,6 +333,10 @@ def one_culling_cycle(male_sapiens, male_neanders, females):
         male_sapiens (List[float]): males with sapiens y-chromosome
         male_neanders (List[float]): males with neanderthal y-chromosome
         females (List[float]): females of any species
+        lineages (lineage.Lineages): if given, the culled males are removed
+            from it too
+        landscape (spatial.Landscape): if given, the culled individuals are
+            removed from it too
 
     Returns:
         None: The input lists are modified in situ.
@@ -206,10 +371,6 @@ def one_culling_cycle(male_sapiens, male_neanders, females):
     # males and females to some maximum, by killing the oldest. We also
     # kill some fixed number each year from each population, just to avoid
     # steady state solutions where nobody ever dies.
-    MALE_MAX_POPULATION = 10000
-    FEMALE_MAX_POPULATION = 10000
-    ALWAYS_KILL = 10
-
     n_sapiens = len(male_sapiens)
     n_neanders = len(male_neanders)
     n_males = n_sapiens + n_neanders
@@ -228,8 +389,17 @@ def one_culling_cycle(male_sapiens, male_neanders, females):
     kill_sapiens = (kill * n_sapiens) // n_males + ALWAYS_KILL
     del male_neanders[0:kill_neanders]
     del male_sapiens[0:kill_sapiens]
-
-def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles, extra_cycles):
+    if lineages is not None:
+        lineages.kill_oldest(False, kill_neanders)
+        lineages.kill_oldest(True, kill_sapiens)
+        lineages.end_cycle()
+    if landscape is not None:
+        landscape.kill_oldest(2, kill_females)
+        landscape.kill_oldest(1, kill_neanders)
+        landscape.kill_oldest(0, kill_sapiens)
+
+def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles, extra_cycles,
+        progress=None, lineages=None, landscape=None):
     ''' Repeatedly alternates breeding and culling cycles.
 
     The input lists are modified in situ.
@@ -243,6 +413,10 @@ def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles,
         extra_cycles (int): if we run out of neanderthal y-chromosomes, just
             run a few extra cycles to stabilise the population. Still
             limited by max_cycles
+        progress (Callable[[int], None]): if given, called with the number
+            of cycles performed so far after every cycle
+        lineages (lineage.Lineages): if given, kept in step with the males
+        landscape (spatial.Landscape): if given, mates are chosen locally
 
     Returns:
         int: The number of cycles actually performed
@@ -254,8 +428,10 @@ def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles,
     cycles_after_last_neaderthal = extra_cycles
 
     for cycle in range(max_cycles):
-        one_breeding_cycle(male_sapiens, male_neanders, females, pool_size)
-        one_culling_cycle(male_sapiens, male_neanders, females)
+        one_breeding_cycle(male_sapiens, male_neanders, females, pool_size, lineages, landscape)
+        one_culling_cycle(male_sapiens, male_neanders, females, lineages, landscape)
+        if progress is not None:
+            progress(cycle + 1)
 
         # No point continuing long if there are no neanderthal y-chromosomes left.
         # The population stabilises very quickly
@@ -266,18 +442,102 @@ def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles,
     
     return max_cycles
 
-def print_stats(male_sapiens, male_neanders, females, pool_size, cycles):
-    '''Writes to stdout a comma-separated list of stats
+def cycles_until(male_sapiens, male_neanders, females, pool_size, stop, lineages=None, landscape=None):
+    ''' Repeatedly alternates breeding and culling cycles until told to stop.
+
+    Unlike repeated_cycles, the decision to stop is made by a stopping rule,
+    which is shown cheap statistics of the population after every cycle. The
+    input lists are modified in situ.
 
     Args:
         male_sapiens (List[float]): males with sapiens y-chromosome
         male_neanders (List[float]): males with neanderthal y-chromosome
         females (List[float]): females of any species
         pool_size (int): number of choices when picking a partner
-        cycles (int): number of repeated breeding and culling cycles
+        stop (stopping.Stopping): decides when to stop, and records why
+        lineages (lineage.Lineages): if given, kept in step with the males
+        landscape (spatial.Landscape): if given, mates are chosen locally
+
+    Returns:
+        int: The number of cycles actually performed
 
     '''
-    
+
+    cycle = 0
+    while True:
+        one_breeding_cycle(male_sapiens, male_neanders, females, pool_size, lineages, landscape)
+        one_culling_cycle(male_sapiens, male_neanders, females, lineages, landscape)
+
+        if stop.update(stopping.cycle_stats(cycle, (male_sapiens, male_neanders, females))):
+            return cycle + 1
+        cycle += 1
+
+def initial_population(n_sapiens, n_neanders):
+    '''Creates a population of pure-bred founders.
+
+    There are equal numbers of males and females of each species. The females
+    are interleaved, so that neither species is older than the other.
+
+    Args:
+        n_sapiens (int): number of sapiens of each sex
+        n_neanders (int): number of neanderthals of each sex
+
+    Returns:
+        (List[float], List[float], List[float]): male sapiens, male neanderthals
+            and females, ready to pass to repeated_cycles.
+
+    '''
+
+    females = []
+    for i in range(max(n_sapiens, n_neanders)):
+        if i < n_sapiens:
+            females.append(1.0)
+        if i < n_neanders:
+            females.append(0.0)
+
+    return ([1.0] * n_sapiens, [0.0] * n_neanders, females)
+
+def initial_lineages(male_sapiens, male_neanders):
+    '''Starts tracking the paternal lineages of the given founders, if LINEAGES
+    is set
+
+    Returns:
+        lineage.Lineages: to pass to repeated_cycles or cycles_until, or None
+    '''
+    if LINEAGES <= 0:
+        return None
+    return lineage.Lineages(len(male_sapiens), len(male_neanders), LINEAGES)
+
+def initial_landscape(male_sapiens, male_neanders, females):
+    '''Places the given founders in space, if SPATIAL_RADIUS is set
+
+    Returns:
+        spatial.Landscape: to pass to repeated_cycles or cycles_until, or None
+    '''
+    if SPATIAL_RADIUS <= 0.0:
+        return None
+    return spatial.Landscape((male_sapiens, male_neanders, females), SPATIAL_RADIUS, SPATIAL_DISPERSAL)
+
+def spatial_summary(male_sapiens, male_neanders, females, landscape):
+    '''The map of ancestry and the width of the hybrid zone, as worked out by
+    spatial.Landscape.summary
+    '''
+    return landscape.summary((male_sapiens, male_neanders, females), SPATIAL_MAP_BINS)
+
+def summary(male_sapiens, male_neanders, females):
+    '''Summarises the state of the population
+
+    Args:
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        females (List[float]): females of any species
+
+    Returns:
+        dict: counts and mean sapiensness of each class, keyed by the column
+            titles written by print_header, in the same order.
+
+    '''
+
     n_sapiens = len(male_sapiens)
     n_neander = len(male_neanders)
     n_female = len(females)
@@ -286,17 +546,47 @@ def print_stats(male_sapiens, male_neanders, females, pool_size, cycles):
     mean_neander = sum(male_neanders) / n_neander if n_neander > 0 else 0
     mean_female = sum(females) / len(females) if n_female > 0 else 0
 
-    print("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}".format(
-        pool_size, cycles,
-        n_sapiens, mean_sapiens, 
-        n_neander, mean_neander,
-        n_female, mean_female))
+    return {
+        "sapiens": n_sapiens, "mean-sapiens": mean_sapiens,
+        "neanders": n_neander, "mean-neander": mean_neander,
+        "females": n_female, "mean-female": mean_female}
 
-def print_header():
+def print_stats(male_sapiens, male_neanders, females, pool_size, cycles):
+    '''Writes to stdout a comma-separated list of stats
+
+    Args:
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        females (List[float]): females of any species
+        pool_size (int): number of choices when picking a partner
+        cycles (int): number of repeated breeding and culling cycles
+
+    '''
+
+    print_row(pool_size, cycles, summary(male_sapiens, male_neanders, females))
+
+def print_row(pool_size, cycles, stats, *extra):
+    '''Writes to stdout a comma-separated list of previously summarised stats
+
+    Args:
+        pool_size (int): number of choices when picking a partner
+        cycles (int): number of repeated breeding and culling cycles
+        stats (dict): as returned by summary
+        extra: values of any extra columns, such as the reason for stopping
+
+    '''
+
+    print("\t".join(str(value) for value in [pool_size, cycles] + list(stats.values()) + list(extra)))
+
+def print_header(*extra):
     ''' Writes to stdout a line of comma-separated column titles
+
+    Args:
+        extra (str): titles of any extra columns, as passed to print_row
     '''
 
-    print("pool\tcycles\tsapiens\tmean-sapiens\tneanders\tmean-neander\tfemales\tmean-female")
+    print("\t".join(["pool", "cycles", "sapiens", "mean-sapiens", "neanders", "mean-neander",
+        "females", "mean-female"] + list(extra)))
 
 # Simple test code, if the module is invoked directly from the command line.
 # Evolve the population given a sensible starting point with equal populations
@@ -308,9 +598,7 @@ if __name__ == '__main__':
     for _ in range(10):   # repeated tests with different MonteCarlo draws   
         for pool_size in range(1, 7):    # repeat with different pool sizes
 
-            male_sapiens = [1.0] * 200
-            male_neanders = [0.0] * 200
-            females = [1.0, 0.0] * 200
+            (male_sapiens, male_neanders, females) = initial_population(200, 200)
             cycles = repeated_cycles(male_sapiens, male_neanders, females, pool_size, 100, 40)
             print_stats(male_sapiens, male_neanders, females, pool_size, cycles)
 
@@ -1,25 +1,70 @@
 import random
+from typing import FrozenSet
 from typing import NamedTuple
 from typing import List
+from typing import Tuple
+from typing import Union
+
+import miscarriage
+import stopping
 
 class Gene(NamedTuple):
     a: bool
     b: bool
 
+class SparseGenes(NamedTuple):
+    '''A block of genes stored as its differences from a pure-bred founder.
+
+    The alleles are numbered 2 * i for the first of gene i, and 2 * i + 1 for
+    the second. Every allele is sapiens if sapiens is true, and neanderthal
+    otherwise, apart from those in differences.
+    '''
+    sapiens: bool
+    differences: FrozenSet[int]
+    length: int
+
+# A block of genes, stored either densely as a list of gene pairs, or sparsely
+Genes = Union[List[Gene], SparseGenes]
+
 class Genome(NamedTuple):
-    appearance: List[Gene]
-    fancy: List[Gene]
-    miscarry: List[Gene]
-    other: List[Gene]
+    '''One individual. A genome never changes once born, so the summaries
+    needed by mate choice, miscarriage and the stats are worked out once, by
+    make_genome: the dosage (number of sapiens alleles) of each block, and the
+    dosage of every appearance and fancy gene, packed by dosage_code.
+    '''
+    appearance: Genes
+    fancy: Genes
+    miscarry: Genes
+    other: Genes
     is_male: bool
     is_neanderthal: bool
     birthday: int
+    dosages: Tuple[int, int, int, int]
+    appearance_code: int
+    fancy_code: int
 
 NUMBER_OF_APPEARANCE_GENES = 20
 NUMBER_OF_FANCY_GENES = 20
 NUMBER_OF_MISCARRY_GENES = 20
 NUMBER_OF_OTHER_GENES = 20
 
+# We expect some proportion of the available females to breed in each cycle
+BREEDING_PROPORTION = 0.5
+
+# Population cap used by one_culling_cycle
+MAX_POPULATION = 2000
+
+# Model of miscarriages, as described in miscarriage.py. The default is that a
+# boy with a neanderthal Y-chromosome always miscarries if he has any sapiens
+# miscarriage genes. (Assume dominant gene.)
+MISCARRIAGE = "dosage:1.0"
+
+# A block of genes is stored sparsely while fewer than this proportion of its
+# alleles differ from a pure-bred founder, and densely once more do. Most
+# individuals stay close to one species for long stretches of a run, so this
+# saves memory and work. Set it to 0.0 to always store blocks densely.
+SPARSE_THRESHOLD = 0.25
+
 def one_breeding_cycle(population: List[Genome], cycle: int, pool_size: int):
     '''Executes one breeding cycle, given a population of mixed species
 
@@ -33,18 +78,21 @@ def one_breeding_cycle(population: List[Genome], cycle: int, pool_size: int):
 
     '''
 
-    # We expect some proportion of the available females to breed
-    BREEDING_PROPORTION = 0.5
     females = reproductive(population, False, cycle)
     unmated_females = int(len(females) * BREEDING_PROPORTION)
     males = reproductive(population, True, cycle)
 
     # Fetch the correct number of breeding pairs from the population. Females are
     # removed, as they can only get pregnant once. Males are left.
+    mothers = []
+    children = []
     while len(females) > unmated_females:
         (female, male) = breeding_pair(females, males, pool_size)
-        child = breed(male, female, cycle)
-        if not miscarry(child):
+        mothers.append(female)
+        children.append(breed(male, female, cycle))
+
+    for (child, lost) in zip(children, miscarriages(children, mothers)):
+        if not lost:
             population.append(child)
 
     return None
@@ -62,7 +110,7 @@ def breed(male: Genome, female: Genome, cycle: int) -> Genome:
     '''
         
     is_male = random.randint(0, 1) == 0 # assume equal probability of boy or girl
-    return Genome(
+    return make_genome(
         merge(male.appearance, female.appearance),
         merge(male.fancy, female.fancy),
         merge(male.miscarry, female.miscarry),
@@ -71,33 +119,30 @@ def breed(male: Genome, female: Genome, cycle: int) -> Genome:
         male.is_neanderthal,
         cycle)
 
-def miscarry(child: Genome):
-    '''Will the given child spontaneously abort?
+def miscarriages(children: List[Genome], mothers: List[Genome]) -> List[bool]:
+    '''Which of the given children will spontaneously abort?
 
-    Checks whether the foetus is male and carries the neanderthal Y-chromosome.
-
-    We make the simplifying assumption that the miscarriage-causing genes are
-    equally spread among all genes, so whether a miscarriage occurs is a
-    probabilistic function of the proportion of sapiens-ness, with 100% probability
-    for sapiens and 0% probability for neanderthal. The shape of the function, and
-    the Monte-Carlo draws that define instances are internal to this function.
+    The whole batch is tested at once by the MISCARRIAGE model, which is
+    given the sapiensness of each mother, whether the father carried the
+    neanderthal Y-chromosome, the sex of the foetus and its number of sapiens
+    miscarriage genes.
 
     Args:
-        child: The child that may miscarry
+        children: The children that may miscarry
+        mothers: The mother of each child
 
     Returns:
-        bool: true if there is miscarriage, or false if the pregnancy runs to term.
+        List[bool]: true for each child that miscarries, or false if the
+            pregnancy runs to term.
 
     '''
 
-    if not child.is_male:
-        return False
-    if not child.is_neanderthal:
-        return False 
-
-    # We assume that the child will always miscarry if there are any miscarriage
-    # genes in the genome. (Assume dominant gene.)
-    return count_genes(child.miscarry) > 0
+    return miscarriage.mask(
+        MISCARRIAGE,
+        [sapiensness(mother) for mother in mothers],
+        [child.is_neanderthal for child in children],
+        [child.is_male for child in children],
+        [child.dosages[2] for child in children])
 
 def breeding_pair(females: List[Genome], males: List[Genome], pool_size) -> (Genome, Genome):
     ''' Given a population of males and females, find a pair to breed.
@@ -123,7 +168,7 @@ def breeding_pair(females: List[Genome], males: List[Genome], pool_size) -> (Gen
     for _ in range(pool_size):
         pick = random.randint(0, n_males - 1)
         male = males[pick]
-        male_matches = match(male.appearance, female.fancy)
+        male_matches = match_codes(male.appearance_code, female.fancy_code, NUMBER_OF_APPEARANCE_GENES)
         if not match:
             male_matches = NUMBER_OF_APPEARANCE_GENES - male_matches
 
@@ -133,19 +178,28 @@ def breeding_pair(females: List[Genome], males: List[Genome], pool_size) -> (Gen
     
     return (female, males[best_male])
 
-def match(appearance: List[Gene], fancies: List[Gene]) -> int:
+def match(appearance: Genes, fancies: Genes) -> int:
     '''Finds the quality of match between appearance and fancy genes
     '''
     # For now, we ignore the issue of dominant and regressive genes,
     # and just assume all genes are important. We assume that there
     # is a one-to-one mapping between appearance genes and the genes
     # to fancy that appearance.
-    assert(len(appearance) == len(fancies))
+    assert(block_length(appearance) == block_length(fancies))
+
+    # If both are sparse, only the genes where either differs from its
+    # founder need visiting. All the others match equally well.
+    if isinstance(appearance, SparseGenes) and isinstance(fancies, SparseGenes):
+        (appear_base, appear_counts) = sparse_counts(appearance)
+        (fancy_base, fancy_counts) = sparse_counts(fancies)
+        differing = appear_counts.keys() | fancy_counts.keys()
+        match = (appearance.length - len(differing)) * (2 - abs(appear_base - fancy_base))
+        for i in differing:
+            match += 2 - abs(appear_counts.get(i, appear_base) - fancy_counts.get(i, fancy_base))
+        return match
 
     match = 0
-    for appear, fancy in zip(appearance, fancies):
-        appear_count = count_gene(appear)  # 0..2
-        fancy_count = count_gene(fancy)    # 0..2
+    for appear_count, fancy_count in zip(gene_counts(appearance), gene_counts(fancies)):
         diff = abs(appear_count - fancy_count)  # 0..2
         match += 2 - diff  # we want match to be greater if diff is small
 
@@ -164,6 +218,66 @@ def count_gene(gene: Gene) -> int:
         count += 1
     return count
 
+def match_codes(appearance_code: int, fancy_code: int, n_genes: int) -> int:
+    '''Finds the same quality of match as match, from the dosage codes of the
+    appearance and fancy genes.
+
+    With the codes of dosage_code, the difference between the dosages of a
+    pair of genes is the number of bits that differ between their codes.
+    '''
+    return 2 * n_genes - bin(appearance_code ^ fancy_code).count("1")
+
+def dosage_code(genes: Genes) -> int:
+    '''Packs the dosage of every gene of a block into an integer, two bits per
+    gene: bit 2 * i is set if gene i has at least one sapiens allele, and bit
+    2 * i + 1 if it has two.
+    '''
+    if isinstance(genes, SparseGenes):
+        (base, counts) = sparse_counts(genes)
+        code = (1 << 2 * genes.length) - 1 if base == 2 else 0
+        for (i, count) in counts.items():
+            code &= ~(3 << 2 * i)
+            code |= (1 << count) - 1 << 2 * i
+        return code
+
+    code = 0
+    for (i, count) in enumerate(gene_counts(genes)):
+        code |= (1 << count) - 1 << 2 * i
+    return code
+
+def gene_counts(genes: Genes) -> List[int]:
+    '''Counts the True genes in each pair of a block, as count_gene does
+    '''
+    if not isinstance(genes, SparseGenes):
+        return [count_gene(gene) for gene in genes]
+
+    (base, counts) = sparse_counts(genes)
+    result = [base] * genes.length
+    for (i, count) in counts.items():
+        result[i] = count
+    return result
+
+def sparse_counts(genes: SparseGenes):
+    '''Counts the True genes in each pair of a sparse block that differs from
+    its founder
+
+    Returns:
+        (int, dict): the count of every other pair, and the count of each
+            differing pair, keyed by its index
+    '''
+    base = 2 if genes.sapiens else 0
+    step = -1 if genes.sapiens else 1
+    counts = {}
+    for allele in genes.differences:
+        i = allele >> 1
+        counts[i] = counts.get(i, base) + step
+    return (base, counts)
+
+def block_length(genes: Genes) -> int:
+    '''Number of genes in a block, however it is stored
+    '''
+    return genes.length if isinstance(genes, SparseGenes) else len(genes)
+
 def reproductive(population: List[Genome], male: bool, cycle: int) -> List[Genome]:
     ''' Given a mixed population, find the females/males who can reproduce.
 
@@ -184,9 +298,13 @@ def reproductive(population: List[Genome], male: bool, cycle: int) -> List[Genom
     
     return result
 
-def count_genes(genes: List[Gene]) -> int:
+def count_genes(genes: Genes) -> int:
     '''Counts both of each gene that matches
     '''
+    if isinstance(genes, SparseGenes):
+        n_different = len(genes.differences)
+        return 2 * genes.length - n_different if genes.sapiens else n_different
+
     total = 0
     for gene in genes:
         if gene[0]:
@@ -196,19 +314,55 @@ def count_genes(genes: List[Gene]) -> int:
     
     return total
 
-def merge(male: List[Gene], female: List[Gene]) -> List[Gene]:
+def merge(male: Genes, female: Genes) -> Genes:
     '''Randomly merges two gene-lists, taking one gene from each
-    '''
 
-    result = []
+    Which allele of each pair is taken is given by one bit of a random
+    number per parent. If both parents are sparse, with the same founder,
+    only the alleles where they differ from it need visiting.
+    '''
+    n_genes = block_length(male)
+    male_picks = random.getrandbits(n_genes)
+    female_picks = random.getrandbits(n_genes)
+
+    if isinstance(male, SparseGenes) and isinstance(female, SparseGenes) and male.sapiens == female.sapiens:
+        differences = [allele & ~1 for allele in male.differences
+            if (male_picks >> (allele >> 1)) & 1 == allele & 1]
+        differences.extend(allele | 1 for allele in female.differences
+            if (female_picks >> (allele >> 1)) & 1 == allele & 1)
+        if len(differences) < SPARSE_THRESHOLD * 2 * n_genes:
+            return SparseGenes(male.sapiens, frozenset(differences), n_genes)
+
+    return store_genes(picked_alleles(male, male_picks), picked_alleles(female, female_picks))
+
+def picked_alleles(genes: Genes, picks: int) -> List[bool]:
+    '''One allele of each pair of a block: the first if the corresponding bit
+    of picks is zero, and the second if it is one
+    '''
+    if not isinstance(genes, SparseGenes):
+        return [gene[(picks >> i) & 1] for (i, gene) in enumerate(genes)]
 
-    for male_gene, female_gene in zip(male, female):
-        pick_male = male_gene[random.randint(0,1)]
-        pick_female = female_gene[random.randint(0,1)]
-        result.append((pick_male, pick_female))
-    
+    result = [genes.sapiens] * genes.length
+    for allele in genes.differences:
+        if (picks >> (allele >> 1)) & 1 == allele & 1:
+            result[allele >> 1] = not genes.sapiens
     return result
 
+def store_genes(first: List[bool], second: List[bool]) -> Genes:
+    '''Makes a block of genes from the first and second allele of each pair,
+    stored sparsely if few enough alleles differ from the nearest founder
+    '''
+    n_genes = len(first)
+    n_sapiens = sum(first) + sum(second)
+    sapiens = n_sapiens >= n_genes
+    n_different = 2 * n_genes - n_sapiens if sapiens else n_sapiens
+    if n_different >= SPARSE_THRESHOLD * 2 * n_genes:
+        return list(zip(first, second))
+
+    differences = [2 * i for (i, allele) in enumerate(first) if allele != sapiens]
+    differences.extend(2 * i + 1 for (i, allele) in enumerate(second) if allele != sapiens)
+    return SparseGenes(sapiens, frozenset(differences), n_genes)
+
 def one_culling_cycle(population: List[Genome]):
     '''Kills off some proportion of the population.
 
@@ -226,7 +380,6 @@ def one_culling_cycle(population: List[Genome]):
 
     # Kill off males and females at random, rather than
     # worrying about age or gender population totals
-    MAX_POPULATION = 2000
     while len(population) > MAX_POPULATION:
         n_population = len(population)
         pick = random.randint(0, n_population - 1)
@@ -236,7 +389,8 @@ def repeated_cycles(
     population: List[Genome], 
     pool_size: int, 
     max_cycles: int, 
-    extra_cycles: int):
+    extra_cycles: int,
+    progress=None):
     ''' Repeatedly alternates breeding and culling cycles.
 
     The input lists are modified in situ.
@@ -248,6 +402,8 @@ def repeated_cycles(
         extra_cycles (int): if we run out of neanderthal y-chromosomes, just
             run a few extra cycles to stabilise the population. Still
             limited by max_cycles
+        progress (Callable[[int], None]): if given, called with the number
+            of cycles performed so far after every cycle
 
     Returns:
         int: The number of cycles actually performed
@@ -261,6 +417,8 @@ def repeated_cycles(
     for cycle in range(max_cycles):
         one_breeding_cycle(population, cycle, pool_size)
         one_culling_cycle(population)
+        if progress is not None:
+            progress(cycle + 1)
 
         # No point continuing long if there are no neanderthal y-chromosomes left.
         # The population stabilises very quickly
@@ -271,6 +429,51 @@ def repeated_cycles(
     
     return max_cycles
 
+def cycles_until(population: List[Genome], pool_size: int, stop: stopping.Stopping) -> int:
+    ''' Repeatedly alternates breeding and culling cycles until told to stop.
+
+    Unlike repeated_cycles, the decision to stop is made by a stopping rule,
+    which is shown cheap statistics of the population after every cycle. The
+    input list is modified in situ.
+
+    Args:
+        population: All individuals. This list is modified by the function.
+        pool_size (int): number of choices when picking a partner
+        stop: decides when to stop, and records why
+
+    Returns:
+        int: The number of cycles actually performed
+
+    '''
+
+    cycle = 0
+    while True:
+        one_breeding_cycle(population, cycle, pool_size)
+        one_culling_cycle(population)
+
+        male_sapiens = []
+        male_neanders = []
+        females = []
+        for individual in population:
+            if not individual.is_male:
+                females.append(sapiensness(individual))
+            elif individual.is_neanderthal:
+                male_neanders.append(sapiensness(individual))
+            else:
+                male_sapiens.append(sapiensness(individual))
+
+        if stop.update(stopping.cycle_stats(cycle, (male_sapiens, male_neanders, females))):
+            return cycle + 1
+        cycle += 1
+
+def sapiensness(individual: Genome) -> float:
+    '''Proportion of sapiens genes in all blocks of the genome (0.0 to 1.0)
+    '''
+    total = sum(individual.dosages)
+    n_genes = (NUMBER_OF_APPEARANCE_GENES + NUMBER_OF_FANCY_GENES
+        + NUMBER_OF_MISCARRY_GENES + NUMBER_OF_OTHER_GENES)
+    return total / (n_genes * 2)
+
 def any_male_neanderthals(population: List[Genome]) -> bool:
     ''' Returns true if there are any males with neanderthal Y-chromosomes
 
@@ -286,14 +489,69 @@ def any_male_neanderthals(population: List[Genome]) -> bool:
     
     return False
 
-def print_stats(population: List[Genome], pool_size: int, cycles: int):
-    '''Writes to stdout a comma-separated list of stats
+def founder(is_male: bool, is_neanderthal: bool) -> Genome:
+    '''Creates a pure-bred individual of the given sex and species
+    '''
+    def pure(n_genes):
+        if SPARSE_THRESHOLD > 0.0:
+            return SparseGenes(not is_neanderthal, frozenset(), n_genes)
+        return [Gene(not is_neanderthal, not is_neanderthal)] * n_genes
+
+    return make_genome(
+        pure(NUMBER_OF_APPEARANCE_GENES),
+        pure(NUMBER_OF_FANCY_GENES),
+        pure(NUMBER_OF_MISCARRY_GENES),
+        pure(NUMBER_OF_OTHER_GENES),
+        is_male, is_neanderthal, -1)
+
+def make_genome(appearance: Genes, fancy: Genes, miscarry: Genes, other: Genes,
+        is_male: bool, is_neanderthal: bool, birthday: int) -> Genome:
+    '''Creates an individual with the given genes, working out its summaries
+    '''
+    return Genome(appearance, fancy, miscarry, other, is_male, is_neanderthal, birthday,
+        (count_genes(appearance), count_genes(fancy), count_genes(miscarry), count_genes(other)),
+        dosage_code(appearance), dosage_code(fancy))
+
+def initial_population(n_sapiens: int, n_neanders: int) -> List[Genome]:
+    '''Creates a population of pure-bred founders.
+
+    There are equal numbers of males and females of each species, interleaved
+    so that neither species is older than the other.
+
+    Args:
+        n_sapiens: number of sapiens of each sex
+        n_neanders: number of neanderthals of each sex
+
+    Returns:
+        The population, ready to pass to repeated_cycles
+    '''
+    male_sapiens = founder(True, False)
+    female_sapiens = founder(False, False)
+    male_neanderthal = founder(True, True)
+    female_neanderthal = founder(False, True)
+
+    population = []
+    for i in range(max(n_sapiens, n_neanders)):
+        if i < n_sapiens:
+            population.append(male_sapiens)
+        if i < n_neanders:
+            population.append(female_neanderthal)
+            population.append(male_neanderthal)
+        if i < n_sapiens:
+            population.append(female_sapiens)
+
+    return population
+
+def summary(population: List[Genome]) -> dict:
+    '''Summarises the state of the population
 
     Args:
         population: List of all individuals
-        pool_size (int): number of choices when picking a partner
-        cycles (int): number of repeated breeding and culling cycles
 
+    Returns:
+        Counts of individuals and mean proportion of sapiens genes in each
+        block, keyed by the column titles written by print_header, in the
+        same order.
     '''
 
     n_total = len(population)
@@ -306,29 +564,62 @@ def print_stats(population: List[Genome], pool_size: int, cycles: int):
     total_other = 0.0
 
     for individual in population:
-        total_appearance += count_genes(individual.appearance)
-        total_fancy += count_genes(individual.fancy)
-        total_miscarry += count_genes(individual.miscarry)
-        total_other += count_genes(individual.other)
+        (appearance, fancy, miscarry, other) = individual.dosages
+        total_appearance += appearance
+        total_fancy += fancy
+        total_miscarry += miscarry
+        total_other += other
         if individual.is_male:
             n_male += 1
             if individual.is_neanderthal:
                 n_neander_y += 1
 
-    mean_appearance = total_appearance / (n_total * NUMBER_OF_APPEARANCE_GENES * 2)
-    mean_fancy = total_fancy / (n_total * NUMBER_OF_FANCY_GENES * 2)
-    mean_miscarry = total_miscarry / (n_total * NUMBER_OF_MISCARRY_GENES * 2)
-    mean_other = total_other / (n_total * NUMBER_OF_OTHER_GENES * 2)
+    # Avoid dividing by zero if the whole population has died out
+    n_genomes = max(n_total, 1)
+    mean_appearance = total_appearance / (n_genomes * NUMBER_OF_APPEARANCE_GENES * 2)
+    mean_fancy = total_fancy / (n_genomes * NUMBER_OF_FANCY_GENES * 2)
+    mean_miscarry = total_miscarry / (n_genomes * NUMBER_OF_MISCARRY_GENES * 2)
+    mean_other = total_other / (n_genomes * NUMBER_OF_OTHER_GENES * 2)
+
+    return {
+        "pop": n_total, "males": n_male, "neander_y": n_neander_y,
+        "appearance": mean_appearance, "fancy": mean_fancy,
+        "miscarry": mean_miscarry, "other": mean_other}
 
-    print("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}".format(
-        pool_size, cycles, n_total, n_male, n_neander_y,
-        mean_appearance, mean_fancy, mean_miscarry, mean_other))
+def print_stats(population: List[Genome], pool_size: int, cycles: int):
+    '''Writes to stdout a comma-separated list of stats
+
+    Args:
+        population: List of all individuals
+        pool_size (int): number of choices when picking a partner
+        cycles (int): number of repeated breeding and culling cycles
+
+    '''
+
+    print_row(pool_size, cycles, summary(population))
+
+def print_row(pool_size: int, cycles: int, stats: dict, *extra):
+    '''Writes to stdout a comma-separated list of previously summarised stats
 
-def print_header():
+    Args:
+        pool_size (int): number of choices when picking a partner
+        cycles (int): number of repeated breeding and culling cycles
+        stats: as returned by summary
+        extra: values of any extra columns, such as the reason for stopping
+
+    '''
+
+    print("\t".join(str(value) for value in [pool_size, cycles] + list(stats.values()) + list(extra)))
+
+def print_header(*extra):
     ''' Writes to stdout a line of comma-separated column titles
+
+    Args:
+        extra (str): titles of any extra columns, as passed to print_row
     '''
 
-    print("pool\tcycles\tpop\tmales\tneander_y\tappearance\tfancy\tmiscarry\tother")
+    print("\t".join(["pool", "cycles", "pop", "males", "neander_y", "appearance", "fancy",
+        "miscarry", "other"] + list(extra)))
 
 # Simple test code, if the module is invoked directly from the command line.
 # Evolve the population given a sensible starting point with equal populations
@@ -337,38 +628,10 @@ if __name__ == '__main__':
 
     print_header()
 
-    sapiens_gene = [Gene(True, True)]
-    neanderthal_gene = [Gene(False, False)]
-        
-    male_sapiens = Genome(
-        sapiens_gene * NUMBER_OF_APPEARANCE_GENES,
-        sapiens_gene * NUMBER_OF_FANCY_GENES,
-        sapiens_gene * NUMBER_OF_MISCARRY_GENES,
-        sapiens_gene * NUMBER_OF_OTHER_GENES,
-        True, False, -1)
-    female_sapiens = Genome(
-        sapiens_gene * NUMBER_OF_APPEARANCE_GENES,
-        sapiens_gene * NUMBER_OF_FANCY_GENES,
-        sapiens_gene * NUMBER_OF_MISCARRY_GENES,
-        sapiens_gene * NUMBER_OF_OTHER_GENES,
-        False, False, -1)
-    male_neanderthal = Genome(
-        neanderthal_gene * NUMBER_OF_APPEARANCE_GENES,
-        neanderthal_gene * NUMBER_OF_FANCY_GENES,
-        neanderthal_gene * NUMBER_OF_MISCARRY_GENES,
-        neanderthal_gene * NUMBER_OF_OTHER_GENES,
-        True, True, -1)
-    female_neanderthal = Genome(
-        neanderthal_gene * NUMBER_OF_APPEARANCE_GENES,
-        neanderthal_gene * NUMBER_OF_FANCY_GENES,
-        neanderthal_gene * NUMBER_OF_MISCARRY_GENES,
-        neanderthal_gene * NUMBER_OF_OTHER_GENES,
-        False, True, -1)
-
     for _ in range(10):   # repeated tests with different MonteCarlo draws   
         for pool_size in range(1, 5):    # repeat with different pool sizes
 
-            population = [male_sapiens, female_neanderthal, male_neanderthal, female_sapiens] * 200
+            population = initial_population(200, 200)
             cycles = repeated_cycles(population, pool_size, 400, 40)
             print_stats(population, pool_size, cycles)
 
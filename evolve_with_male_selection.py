@@ -1,5 +1,32 @@
 import random
 
+import miscarriage
+import sampling
+import stopping
+
+# Proportion of females left unmated at the end of each breeding cycle
+PROPORTION_FEMALES_LEFT = 0.5
+
+# Population caps and fixed kill count used by one_culling_cycle
+MALE_MAX_POPULATION = 10000
+FEMALE_MAX_POPULATION = 10000
+ALWAYS_KILL = 0
+
+# How partners are chosen. "pool" means picking the best of pool_size randomly
+# chosen candidates. "tournament" is the same choice, but with the candidates
+# for a whole block of males drawn at once by tournament_matches, which is
+# faster for large populations. "weighted" ignores pool_size, and picks any candidate with
+# probability proportional to exp(-MATE_CHOICE_BETA * distance), bucketing the
+# candidates into MATE_CHOICE_BUCKETS buckets of sapiensness.
+MATE_CHOICE = "pool"
+MATE_CHOICE_BETA = 10.0
+MATE_CHOICE_BUCKETS = 100
+
+# Model of miscarriages, as described in miscarriage.py. The default is that a
+# boy with a neanderthal Y-chromosome miscarries with probability equal to the
+# sapiensness of his mother.
+MISCARRIAGE = "linear:1.0"
+
 def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
     '''Executes one breeding cycle, given a population of mixed species
 
@@ -20,7 +47,7 @@ def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
     In other words, the difference between male_sapiens and male_neanderthal is
     that the latter carries a neanderthal Y-chromosome. The probability of 
     miscarriage when a male foetus carries a neanderthal Y-chromosome is defined by the
-    miscarry_with_neanderthal function, which is called from within this function.
+    MISCARRIAGE model, which is applied to all the pregnancies of the cycle at once.
 
     The probability of a sapiens mating with a neanderthal is defined by the 
     find_partner function, which is called from within this function.
@@ -36,37 +63,66 @@ def one_breeding_cycle(male_sapiens, male_neanders, females, pool_size):
 
     '''
 
-    # Create arrays for offspring. We assume these cannot mate within this cycle,
-    # so keep them separate
-    boy_sapiens = []
-    boy_neanders = []
-    girls = []
+    # Record the pregnancies, so we can test them for miscarriage in one batch
+    mothers = []
+    neanderthal_y = []
+    boys = []
+    mixes = []
 
     # Loop until the desired proportion of females are left who have not reproduced
     # or miscarried. We default to 50%, which is the proportion that would be left
     # if each male selected one female on average.
-    PROPORTION_FEMALES_LEFT = 0.5
     females_left = int(len(females) * PROPORTION_FEMALES_LEFT)
-    females_to_reproduce = females[:]
+
+    # For weighted mate choice, index the females by sapiensness. The index
+    # keeps track of which females are left.
+    if MATE_CHOICE == "weighted":
+        females_to_reproduce = sampling.RemovingWeightedChoice(
+            females, MATE_CHOICE_BETA, MATE_CHOICE_BUCKETS, (0.0, 1.0))
+    elif MATE_CHOICE == "tournament":
+        females_to_reproduce = []
+        for (is_sapiens, male, female) in tournament_matches(
+                male_sapiens, male_neanders, females, len(females) - females_left, pool_size):
+            mothers.append(female)
+            neanderthal_y.append(not is_sapiens)
+            boys.append(random.randint(0, 1) == 0)
+            mixes.append((male + female) * 0.5)
+    else:
+        females_to_reproduce = females[:]
+
     while len(females_to_reproduce) > females_left:
         # Randomly pick a male by using find_partner with a pool size of 1.
         # female is ignored, so arbitrarily pick 0.5
         (is_sapiens, male) = find_partner(0.5, male_sapiens, male_neanders, 1)
 
         # Allow that male to pick a female
-        female = find_and_remove_female(male, females_to_reproduce, pool_size)
+        if MATE_CHOICE == "weighted":
+            female = find_and_remove_weighted_female(male, females, females_to_reproduce)
+        else:
+            female = find_and_remove_female(male, females_to_reproduce, pool_size)
 
         boy = random.randint(0, 1) == 0 # assume equal probability of boy or girl
-        mix = (male + female) * 0.5
+        mothers.append(female)
+        neanderthal_y.append(not is_sapiens)
+        boys.append(boy)
+        mixes.append((male + female) * 0.5)
+
+    # Create arrays for offspring. We assume these cannot mate within this cycle,
+    # so keep them separate
+    boy_sapiens = []
+    boy_neanders = []
+    girls = []
+
+    miscarried = miscarriage.mask(MISCARRIAGE, mothers, neanderthal_y, boys)
+    for (is_neanderthal, boy, mix, lost) in zip(neanderthal_y, boys, mixes, miscarried):
+        if lost:
+            continue
         if not boy:
-            # girls never miscarry (at least in this simulation)
             girls.append(mix)
-        elif is_sapiens:
-            # no miscarriages with sapiens Y-chromosome
-            boy_sapiens.append(mix)
-        elif not miscarry_with_neanderthal(female):
-            # picked a neanderthal, produced a male foetus, and tested for miscarriage
+        elif is_neanderthal:
             boy_neanders.append(mix)
+        else:
+            boy_sapiens.append(mix)
 
     # Append the new individuals to the ends of the lists. We keep them
     # at the end, so position in the list is an indication of age. For
@@ -166,35 +222,103 @@ def find_and_remove_female(male, females, pool_size):
             best_distance = distance
             best_pick = pick
     
-    # return and delete the picked female
+    # return and delete the picked female. The order of the list does not
+    # matter, so swap her with the last rather than popping from the middle
     assert(best_distance <= 1.0)
-    return females.pop(best_pick)
+    best_female = females[best_pick]
+    females[best_pick] = females[-1]
+    females.pop()
+    return best_female
+
+def tournament_matches(male_sapiens, male_neanders, females, n_matches, pool_size):
+    ''' Pairs up a block of males with females, with the candidates drawn in
+    one batch.
+
+    The matches have the same distribution as calling find_partner and
+    find_and_remove_female n_matches times. All the males, and pool_size
+    candidate females for each, are drawn at once from all the females. The
+    males then choose in the order they were drawn, against a mask of the
+    females already taken. A candidate taken by an earlier male is redrawn
+    until one still available turns up, which is rejection sampling from
+    the available females, so each male's pool is drawn from exactly the
+    females that find_and_remove_female would have offered him.
+
+    At most half the females are normally taken, so a candidate is redrawn
+    fewer than once on average, and the cost is O(n_matches * pool_size).
+
+    Args:
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        females (List[float]): list of females. This is not changed.
+        n_matches (int): how many pairs to make. Must be no more than the
+            number of females
+        pool_size (int): how many females to consider when finding the best
 
-def miscarry_with_neanderthal(female):
-    '''Will sex between a neanderthal male and the given female result in
-    miscarriage?
+    Returns:
+        List[(bool, float, float)]: for each pair, whether the male has a
+            sapiens y-chromosome, and the sapiensness of the male and female
 
-    Assumes that the foetus is male and carries the neanderthal Y-chromosome.
+    '''
 
-    We make the simplifying assumption that the miscarriage-causing genes are
-    equally spread among all genes, so whether a miscarriage occurs is a
-    probabilistic function of the proportion of sapiens-ness, with 100% probability
-    for sapiens and 0% probability for neanderthal. The shape of the function, and
-    the Monte-Carlo draws that define instances are internal to this function.
+    n_sapiens = len(male_sapiens)
+    n_total = n_sapiens + len(male_neanders)
+    n_females = len(females)
+    assert(n_matches <= n_females)
+    if n_matches <= 0 or n_total == 0:
+        return []
+
+    # Draw the males, with replacement, as find_partner would with a pool
+    # size of 1, and all their candidates
+    uniform = random.random
+    males = [int(uniform() * n_total) for _ in range(n_matches)]
+    candidates = [int(uniform() * n_females) for _ in range(n_matches * pool_size)]
+
+    taken = bytearray(n_females)
+    matches = []
+    first = 0
+    for pick in males:
+        is_sapiens = pick < n_sapiens
+        male = male_sapiens[pick] if is_sapiens else male_neanders[pick - n_sapiens]
+        adj_male = 0.0 if male <= 0.5 else 1.0
+
+        # Pick the best of the pool. Ties go to the first drawn, as in
+        # find_and_remove_female
+        best_distance = 1.1
+        for candidate in candidates[first:first + pool_size]:
+            while taken[candidate]:
+                candidate = int(uniform() * n_females)
+            distance = abs(females[candidate] - adj_male)
+            if distance < best_distance:
+                best_distance = distance
+                best = candidate
+        first += pool_size
+
+        taken[best] = 1
+        matches.append((is_sapiens, male, females[best]))
+
+    return matches
+
+def find_and_remove_weighted_female(male, females, choice):
+    ''' Finds and removes a female reproductive partner, by weighted (soft) choice.
+
+    As in find_and_remove_female, the male prefers females close to whichever
+    extreme is nearest his own sapiensness. Rather than picking the best of a
+    pool, he may pick any female still available, with probability
+    proportional to exp(-MATE_CHOICE_BETA * distance).
 
     Args:
-        female (float): The sapiensness of the female carrying the foetus
+        male (float): the sapiensness of the male who is looking for a partner
+        females (List[float]): list of all females. This is not changed.
+        choice (sampling.RemovingWeightedChoice): index of the females still
+            available. The one we find is removed.
 
     Returns:
-        bool: true if there is miscarriage, or false if the pregnancy runs to term.
+        float: represents the sapiensness of the female found.
 
     '''
 
-    # For simplicity, assume a linear probabilistic function, where a neanderthal
-    # female (0.0) has zero probability of miscarrying and a sapiens female (1.0)
-    # miscarries with probability one.
-    draw = random.random()  # a uniform draw between zero and one: range [0, 1)
-    return draw < female    # always true if female = 1.0, never true if female = 0.0
+    assert(len(choice) > 0)
+    return females[choice.draw_and_remove(0.0 if male <= 0.5 else 1.0)]
 
 def one_culling_cycle(male_sapiens, male_neanders, females):
     '''Kills off some proportion of the population.
@@ -225,9 +349,6 @@ def one_culling_cycle(male_sapiens, male_neanders, females):
     # males and females to some maximum, by killing the oldest. We also
     # kill some fixed number each year from each population, just to avoid
     # steady state solutions where nobody ever dies.
-    MALE_MAX_POPULATION = 10000
-    FEMALE_MAX_POPULATION = 10000
-    ALWAYS_KILL = 0
 
     # method 1 -- kill the oldest
     if False:
@@ -271,7 +392,8 @@ def one_culling_cycle(male_sapiens, male_neanders, females):
             else:
                 del male_neanders[kill - len(male_sapiens)]
 
-def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles, extra_cycles):
+def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles, extra_cycles,
+        progress=None):
     ''' Repeatedly alternates breeding and culling cycles.
 
     The input lists are modified in situ.
@@ -285,6 +407,8 @@ def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles,
         extra_cycles (int): if we run out of neanderthal y-chromosomes, just
             run a few extra cycles to stabilise the population. Still
             limited by max_cycles
+        progress (Callable[[int], None]): if given, called with the number
+            of cycles performed so far after every cycle
 
     Returns:
         int: The number of cycles actually performed
@@ -306,6 +430,8 @@ def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles,
         #print(male_sapiens)
         #print(male_neanders)
         #print(females)
+        if progress is not None:
+            progress(cycle + 1)
 
         # No point continuing long if there are no neanderthal y-chromosomes left.
         # The population stabilises very quickly
@@ -316,18 +442,73 @@ def repeated_cycles(male_sapiens, male_neanders, females, pool_size, max_cycles,
     
     return max_cycles
 
-def print_stats(male_sapiens, male_neanders, females, pool_size, cycles):
-    '''Writes to stdout a comma-separated list of stats
+def cycles_until(male_sapiens, male_neanders, females, pool_size, stop):
+    ''' Repeatedly alternates breeding and culling cycles until told to stop.
+
+    Unlike repeated_cycles, the decision to stop is made by a stopping rule,
+    which is shown cheap statistics of the population after every cycle. The
+    input lists are modified in situ.
 
     Args:
         male_sapiens (List[float]): males with sapiens y-chromosome
         male_neanders (List[float]): males with neanderthal y-chromosome
         females (List[float]): females of any species
         pool_size (int): number of choices when picking a partner
-        cycles (int): number of repeated breeding and culling cycles
+        stop (stopping.Stopping): decides when to stop, and records why
+
+    Returns:
+        int: The number of cycles actually performed
 
     '''
-    
+
+    cycle = 0
+    while True:
+        one_breeding_cycle(male_sapiens, male_neanders, females, pool_size)
+        one_culling_cycle(male_sapiens, male_neanders, females)
+
+        if stop.update(stopping.cycle_stats(cycle, (male_sapiens, male_neanders, females))):
+            return cycle + 1
+        cycle += 1
+
+def initial_population(n_sapiens, n_neanders):
+    '''Creates a population of pure-bred founders.
+
+    There are equal numbers of males and females of each species. The females
+    are interleaved, so that neither species is older than the other.
+
+    Args:
+        n_sapiens (int): number of sapiens of each sex
+        n_neanders (int): number of neanderthals of each sex
+
+    Returns:
+        (List[float], List[float], List[float]): male sapiens, male neanderthals
+            and females, ready to pass to repeated_cycles.
+
+    '''
+
+    females = []
+    for i in range(max(n_sapiens, n_neanders)):
+        if i < n_sapiens:
+            females.append(1.0)
+        if i < n_neanders:
+            females.append(0.0)
+
+    return ([1.0] * n_sapiens, [0.0] * n_neanders, females)
+
+def summary(male_sapiens, male_neanders, females):
+    '''Summarises the state of the population
+
+    Args:
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        females (List[float]): females of any species
+
+    Returns:
+        dict: counts and mean sapiensness of each class, keyed by the column
+            titles written by print_header, in the same order.
+
+    '''
+
     n_sapiens = len(male_sapiens)
     n_neander = len(male_neanders)
     n_female = len(females)
@@ -336,17 +517,47 @@ def print_stats(male_sapiens, male_neanders, females, pool_size, cycles):
     mean_neander = sum(male_neanders) / n_neander if n_neander > 0 else 0
     mean_female = sum(females) / len(females) if n_female > 0 else 0
 
-    print("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}".format(
-        pool_size, cycles,
-        n_sapiens, mean_sapiens, 
-        n_neander, mean_neander,
-        n_female, mean_female))
+    return {
+        "sapiens": n_sapiens, "mean-sapiens": mean_sapiens,
+        "neanders": n_neander, "mean-neander": mean_neander,
+        "females": n_female, "mean-female": mean_female}
 
-def print_header():
+def print_stats(male_sapiens, male_neanders, females, pool_size, cycles):
+    '''Writes to stdout a comma-separated list of stats
+
+    Args:
+        male_sapiens (List[float]): males with sapiens y-chromosome
+        male_neanders (List[float]): males with neanderthal y-chromosome
+        females (List[float]): females of any species
+        pool_size (int): number of choices when picking a partner
+        cycles (int): number of repeated breeding and culling cycles
+
+    '''
+
+    print_row(pool_size, cycles, summary(male_sapiens, male_neanders, females))
+
+def print_row(pool_size, cycles, stats, *extra):
+    '''Writes to stdout a comma-separated list of previously summarised stats
+
+    Args:
+        pool_size (int): number of choices when picking a partner
+        cycles (int): number of repeated breeding and culling cycles
+        stats (dict): as returned by summary
+        extra: values of any extra columns, such as the reason for stopping
+
+    '''
+
+    print("\t".join(str(value) for value in [pool_size, cycles] + list(stats.values()) + list(extra)))
+
+def print_header(*extra):
     ''' Writes to stdout a line of comma-separated column titles
+
+    Args:
+        extra (str): titles of any extra columns, as passed to print_row
     '''
 
-    print("pool\tcycles\tsapiens\tmean-sapiens\tneanders\tmean-neander\tfemales\tmean-female")
+    print("\t".join(["pool", "cycles", "sapiens", "mean-sapiens", "neanders", "mean-neander",
+        "females", "mean-female"] + list(extra)))
 
 # Simple test code, if the module is invoked directly from the command line.
 # Evolve the population given a sensible starting point with equal populations
@@ -358,9 +569,7 @@ if __name__ == '__main__':
     for _ in range(10):   # repeated tests with different MonteCarlo draws   
         for pool_size in range(1, 6):    # repeat with different pool sizes
 
-            male_sapiens = [1.0] * 1000
-            male_neanders = [0.0] * 1000
-            females = [1.0, 0.0] * 1000
+            (male_sapiens, male_neanders, females) = initial_population(1000, 1000)
             cycles = repeated_cycles(male_sapiens, male_neanders, females, pool_size, 200, 40)
             print_stats(male_sapiens, male_neanders, females, pool_size, cycles)
 
@@ -0,0 +1,221 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+
+# Each run is one of these states. Runs are added as pending, claimed by a
+# worker as running, and end up done or failed. Failed runs, and runs whose
+# worker died while they were running, are put back to pending by requeue_runs.
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+def open_ledger(path: str) -> sqlite3.Connection:
+    '''Opens (creating if necessary) a SQLite run ledger.
+
+    The ledger records every Monte-Carlo run of a sweep, keyed by a hash of
+    the model source, its parameters and the seed. Several worker processes on
+    the same machine may have the same ledger open at once.
+
+    Args:
+        path: file name of the SQLite database
+
+    Returns:
+        An open connection, to pass to the other functions in this module
+    '''
+
+    # Autocommit mode, so we control the transactions ourselves. The timeout
+    # lets workers wait for each other rather than failing with "locked".
+    conn = sqlite3.connect(path, timeout=60.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute('''CREATE TABLE IF NOT EXISTS runs (
+        key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        version TEXT NOT NULL,
+        params TEXT NOT NULL,
+        seed INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        worker TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        started REAL,
+        finished REAL,
+        result TEXT,
+        error TEXT)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS runs_status ON runs (status, version)")
+    return conn
+
+def worker_name() -> str:
+    '''Identifies this process, so that interrupted runs can be detected
+    '''
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+def add_run(conn: sqlite3.Connection, key: str, model: str, version: str, params: dict, seed: int) -> str:
+    '''Adds a run to the ledger as pending, unless it is already there.
+
+    Args:
+        conn: the ledger
+        key: unique hash of model, version, params and seed
+        model: name of the model to run
+        version: hash of the model source
+        params: everything other than the seed that affects the result
+        seed: Monte-Carlo seed
+
+    Returns:
+        The status of the run, which is pending unless it was already known
+    '''
+
+    conn.execute(
+        "INSERT OR IGNORE INTO runs (key, model, version, params, seed, status) VALUES (?, ?, ?, ?, ?, ?)",
+        (key, model, version, json.dumps(params, sort_keys=True), seed, PENDING))
+    return conn.execute("SELECT status FROM runs WHERE key = ?", (key,)).fetchone()[0]
+
+def requeue_runs(conn: sqlite3.Connection) -> int:
+    '''Puts failed and interrupted runs back in the queue.
+
+    A run is interrupted if it is marked as running by a worker on this machine
+    that no longer exists.
+
+    Returns:
+        The number of runs requeued
+    '''
+
+    host = socket.gethostname()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        requeued = conn.execute(
+            "UPDATE runs SET status = ?, worker = NULL WHERE status = ?", (PENDING, FAILED)).rowcount
+
+        running = conn.execute("SELECT key, worker FROM runs WHERE status = ?", (RUNNING,)).fetchall()
+        for (key, worker) in running:
+            (worker_host, _, pid) = worker.rpartition(":")
+            if worker_host == host and not _process_alive(int(pid)):
+                conn.execute("UPDATE runs SET status = ?, worker = NULL WHERE key = ?", (PENDING, key))
+                requeued += 1
+
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
+
+    return requeued
+
+def claim_run(conn: sqlite3.Connection, worker: str, versions):
+    '''Claims the next pending run, marking it as running.
+
+    The select and update happen in one write transaction, so two workers
+    can never claim the same run.
+
+    Args:
+        conn: the ledger
+        worker: name of the claiming worker, from worker_name
+        versions (Iterable[str]): model versions this worker can run. Runs
+            recorded against other versions of the source are left alone.
+
+    Returns:
+        (str, str, dict, int): key, model, params and seed of the claimed run,
+            or None if there is nothing left to do.
+    '''
+
+    versions = list(versions)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT key, model, params, seed FROM runs WHERE status = ? AND version IN ({}) ORDER BY rowid LIMIT 1"
+                .format(",".join("?" * len(versions))),
+            [PENDING] + versions).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE runs SET status = ?, worker = ?, attempts = attempts + 1, started = ? WHERE key = ?",
+                (RUNNING, worker, time.time(), row[0]))
+        conn.execute("COMMIT")
+    except:
+        conn.execute("ROLLBACK")
+        raise
+
+    if row is None:
+        return None
+
+    (key, model, params, seed) = row
+    return (key, model, json.loads(params), seed)
+
+def complete_run(conn: sqlite3.Connection, key: str, result: dict):
+    '''Records the final stats of a run, marking it as done
+    '''
+    conn.execute(
+        "UPDATE runs SET status = ?, finished = ?, result = ?, error = NULL WHERE key = ?",
+        (DONE, time.time(), json.dumps(result), key))
+
+def fail_run(conn: sqlite3.Connection, key: str, error: str):
+    '''Marks a run as failed. It is retried next time the queue is requeued
+    '''
+    conn.execute(
+        "UPDATE runs SET status = ?, finished = ?, error = ? WHERE key = ?",
+        (FAILED, time.time(), error, key))
+
+def run_result(conn: sqlite3.Connection, key: str):
+    '''Fetches the result of a run
+
+    Returns:
+        (str, dict): status of the run and its result, which is None unless
+            the run is done.
+    '''
+    row = conn.execute("SELECT status, result FROM runs WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return (None, None)
+
+    (status, result) = row
+    return (status, json.loads(result) if result is not None else None)
+
+def done_runs(conn: sqlite3.Connection, skip=()) -> list:
+    '''Fetches every run that is done, other than those already seen.
+
+    Args:
+        conn: the ledger
+        skip (Container[str]): keys of runs to leave out
+
+    Returns:
+        List[(str, str, str, dict, int, dict)]: key, model, version, params,
+            seed and result of each run, in the order they were added
+    '''
+    keys = [key for (key,) in conn.execute("SELECT key FROM runs WHERE status = ? ORDER BY rowid", (DONE,))
+        if key not in skip]
+
+    # Fetch the rest of each run in chunks, keeping within the SQLite limit
+    # on the number of parameters
+    runs = []
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        rows = conn.execute(
+            "SELECT key, model, version, params, seed, result FROM runs WHERE key IN ({}) ORDER BY rowid"
+                .format(",".join("?" * len(chunk))), chunk).fetchall()
+        runs.extend((key, model, version, json.loads(params), seed, json.loads(result))
+            for (key, model, version, params, seed, result) in rows)
+    return runs
+
+def finished_since(conn: sqlite3.Connection, since: float):
+    '''Counts the runs done since the given time, for measuring throughput
+
+    Returns:
+        (int, float): the number of runs, and the start of the period they
+            cover, which is the given time or the earliest start of any of
+            them if that is later
+    '''
+    (n, first) = conn.execute(
+        "SELECT COUNT(*), MIN(started) FROM runs WHERE status = ? AND finished >= ?", (DONE, since)).fetchone()
+    return (n, max(since, first) if first is not None else since)
+
+def status_counts(conn: sqlite3.Connection) -> dict:
+    '''Counts the runs in each state
+    '''
+    return dict(conn.execute("SELECT status, COUNT(*) FROM runs GROUP BY status").fetchall())
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,332 @@
+import bisect
+import itertools
+import math
+import random
+from typing import List, NamedTuple
+
+import stopping
+
+# Age-specific schedules, indexed by age in cycles (the current cycle minus the
+# cycle of birth). The last entry of each applies to all older ages.
+#
+# FEMALE_FERTILITY is the probability that a female of that age conceives in a
+# cycle. MALE_FERTILE is 1 for ages at which males are available as partners,
+# and 0 otherwise. MORTALITY is the probability of dying at the end of a cycle.
+FEMALE_FERTILITY = [0.0, 0.6, 0.6, 0.6, 0.6, 0.4, 0.2, 0.0]
+MALE_FERTILE = [0, 1]
+MORTALITY = [0.05, 0.05, 0.05, 0.1, 0.15, 0.25, 0.4, 1.0]
+
+class Cohort(NamedTuple):
+    '''All the living individuals born in one cycle, split into classes
+
+    Individuals are floats (sapiensness) for evolve.py, or Genomes for
+    evolve_multi_gene.py.
+    '''
+    born: int
+    male_sapiens: list
+    male_neanders: list
+    females: list
+
+def schedule(rates: list, age: int):
+    '''Looks up an age-specific rate. Ages beyond the table use the last entry
+    '''
+    return rates[min(age, len(rates) - 1)]
+
+def binomial(n: int, p: float) -> int:
+    '''Draws from a binomial distribution, with n trials of probability p.
+
+    Uses geometric skipping between successes, so the cost is proportional
+    to the number of successes rather than to n.
+    '''
+    if p <= 0.0 or n == 0:
+        return 0
+    if p >= 1.0:
+        return n
+    if p > 0.5:
+        return n - binomial(n, 1.0 - p)
+
+    log_q = math.log(1.0 - p)
+    successes = 0
+    trial = 0
+    while True:
+        trial += int(math.log(1.0 - random.random()) / log_q) + 1
+        if trial > n:
+            return successes
+        successes += 1
+
+def choose(individuals: list, n: int) -> list:
+    '''Picks n distinct individuals at random from a list, in O(n) time.
+
+    This is a partial Fisher-Yates shuffle, which moves the chosen individuals
+    to the end of the list. Within a cohort, the order has no meaning.
+
+    Returns:
+        The chosen individuals, which are also the last n in the list
+    '''
+    size = len(individuals)
+    for i in range(n):
+        last = size - 1 - i
+        pick = random.randint(0, last)
+        (individuals[pick], individuals[last]) = (individuals[last], individuals[pick])
+    return individuals[size - n:]
+
+def kill(individuals: list, n: int) -> list:
+    '''Removes n randomly chosen individuals from a list, in O(n) time
+
+    Returns:
+        The individuals removed
+    '''
+    dead = choose(individuals, n)
+    del individuals[len(individuals) - n:]
+    return dead
+
+class Blocks:
+    '''Read-only view of a number of lists as if they were one list.
+
+    Indexing is O(log number of lists), so the partner choice functions of
+    the models can pick uniformly from many cohorts without copying them.
+    '''
+
+    def __init__(self, lists):
+        self.lists = [block for block in lists if block]
+        self.starts = []
+        size = 0
+        for block in self.lists:
+            self.starts.append(size)
+            size += len(block)
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int):
+        block = bisect.bisect_right(self.starts, index) - 1
+        return self.lists[block][index - self.starts[block]]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.lists)
+
+class Tally:
+    '''Running count, total sapiensness and histogram of each class, over
+    all the cohorts.
+
+    It is updated as individuals are born and die, so the stats of each cycle
+    cost O(HISTOGRAM_BINS) rather than a pass over the whole population.
+    '''
+
+    def __init__(self, cohorts: List[Cohort], model):
+        '''
+        Args:
+            cohorts: the population to start from
+            model: evolve or evolve_multi_gene module
+        '''
+        self.model = model
+        self.counts = [0, 0, 0]
+        self.totals = [0.0, 0.0, 0.0]
+        self.histogram = [0] * stopping.HISTOGRAM_BINS
+        for cohort in cohorts:
+            for category in (1, 2, 3):
+                self.add(category, cohort[category])
+
+    def add(self, category: int, individuals, sign: int = 1):
+        '''Counts individuals of one class (a field number of Cohort) in, or
+        out if sign is -1
+        '''
+        if _is_genome_model(self.model):
+            individuals = [self.model.sapiensness(individual) for individual in individuals]
+        top = stopping.HISTOGRAM_BINS - 1
+        total = 0.0
+        for value in individuals:
+            total += value
+            self.histogram[min(int(value * stopping.HISTOGRAM_BINS), top)] += sign
+        self.counts[category - 1] += sign * len(individuals)
+        self.totals[category - 1] += sign * total
+
+        # Stop rounding errors building up in a class that has died out
+        if self.counts[category - 1] == 0:
+            self.totals[category - 1] = 0.0
+
+    def remove(self, category: int, individuals):
+        '''Counts dead individuals of one class out
+        '''
+        self.add(category, individuals, -1)
+
+    def stats(self, cycle: int) -> stopping.CycleStats:
+        '''The same summary as stopping.cycle_stats would give for the
+        whole population
+        '''
+        means = tuple(total / n if n > 0 else 0.0 for (n, total) in zip(self.counts, self.totals))
+        n_total = sum(self.counts)
+        histogram = [count / n_total for count in self.histogram] if n_total > 0 else list(self.histogram)
+        return stopping.CycleStats(cycle, tuple(self.counts), means, histogram)
+
+def initial_cohorts(model, *population) -> List[Cohort]:
+    '''Spreads a population of founders across cohorts.
+
+    The founders are given ages drawn from the stable age distribution
+    implied by MORTALITY, so they do not all die at once.
+
+    Args:
+        model: evolve or evolve_multi_gene module
+        population: as returned by the initial_population function of the model
+
+    Returns:
+        The cohorts, oldest first
+    '''
+    survival = []
+    alive = 1.0
+    for rate in MORTALITY:
+        survival.append(alive)
+        alive *= 1.0 - rate
+    ages = list(range(len(survival)))
+
+    cohorts = {}
+    def place(category: int, individual):
+        age = random.choices(ages, survival)[0]
+        born = -1 - age
+        if _is_genome_model(model):
+            individual = individual._replace(birthday=born)
+        if born not in cohorts:
+            cohorts[born] = Cohort(born, [], [], [])
+        cohorts[born][category].append(individual)
+
+    if _is_genome_model(model):
+        (individuals,) = population
+        for individual in individuals:
+            place(_category(individual), individual)
+    else:
+        for (category, individuals) in zip((1, 2, 3), population):
+            for individual in individuals:
+                place(category, individual)
+
+    return [cohorts[born] for born in sorted(cohorts)]
+
+def one_breeding_cycle(cohorts: List[Cohort], cycle: int, model, pool_size: int, tally: Tally = None):
+    '''Executes one breeding cycle on an age-structured population.
+
+    The number of mothers in each cohort is a binomial draw using the
+    FEMALE_FERTILITY of its age. Each mother picks a partner from the males of
+    fertile ages, using the partner choice of the model, and the surviving
+    offspring form a new cohort at the end of the list.
+
+    Args:
+        cohorts: the population, oldest first. Modified in situ
+        cycle: which breeding cycle this is
+        model: evolve or evolve_multi_gene module
+        pool_size: how many partners to consider when finding the best
+        tally: if given, the children are counted into it
+    '''
+    fertile = [cohort for cohort in cohorts if schedule(MALE_FERTILE, cycle - cohort.born)]
+    male_sapiens = Blocks(cohort.male_sapiens for cohort in fertile)
+    male_neanders = Blocks(cohort.male_neanders for cohort in fertile)
+    if male_sapiens.size + male_neanders.size == 0:
+        return
+
+    mothers = []
+    for cohort in cohorts:
+        n_mothers = binomial(len(cohort.females), schedule(FEMALE_FERTILITY, cycle - cohort.born))
+        mothers.extend(choose(cohort.females, n_mothers))
+
+    if _is_genome_model(model):
+        children = Cohort(cycle, [], [], [])
+        males = Blocks(male_sapiens.lists + male_neanders.lists)
+        conceived = []
+        for mother in mothers:
+            (female, male) = model.breeding_pair([mother], males, pool_size)
+            conceived.append(model.breed(male, female, cycle))
+        for (child, lost) in zip(conceived, model.miscarriages(conceived, mothers)):
+            if not lost:
+                children[_category(child)].append(child)
+    else:
+        children = Cohort(cycle, *model.conceive(mothers, male_sapiens, male_neanders, pool_size))
+
+    cohorts.append(children)
+    if tally is not None:
+        for category in (1, 2, 3):
+            tally.add(category, children[category])
+
+def one_culling_cycle(cohorts: List[Cohort], cycle: int, model, tally: Tally = None):
+    '''Kills off individuals according to the MORTALITY of their age.
+
+    If the population is still over the caps of the model, every individual
+    then has the same extra chance of dying, to bring it back to the cap.
+    Empty cohorts are dropped.
+
+    Args:
+        cohorts: the population, oldest first. Modified in situ
+        cycle: which breeding cycle this is
+        model: evolve or evolve_multi_gene module
+        tally: if given, the dead are counted out of it
+    '''
+    def cull(category: int, individuals: list, rate: float):
+        dead = kill(individuals, binomial(len(individuals), rate))
+        if tally is not None:
+            tally.remove(category, dead)
+
+    for cohort in cohorts:
+        rate = schedule(MORTALITY, cycle - cohort.born)
+        for category in (1, 2, 3):
+            cull(category, cohort[category], rate)
+
+    # The caps are on the whole population for the multi-gene model, and
+    # separately on males and females for the simple one
+    if _is_genome_model(model):
+        groups = [((1, 2, 3), model.MAX_POPULATION)]
+    else:
+        groups = [((1, 2), model.MALE_MAX_POPULATION), ((3,), model.FEMALE_MAX_POPULATION)]
+
+    for (categories, cap) in groups:
+        n = sum(len(cohort[category]) for cohort in cohorts for category in categories)
+        if n > cap:
+            rate = (n - cap) / n
+            for cohort in cohorts:
+                for category in categories:
+                    cull(category, cohort[category], rate)
+
+    cohorts[:] = [cohort for cohort in cohorts
+        if cohort.male_sapiens or cohort.male_neanders or cohort.females]
+
+def cycles_until(cohorts: List[Cohort], model, pool_size: int, stop: stopping.Stopping) -> int:
+    '''Repeatedly alternates breeding and culling cycles until told to stop.
+
+    Args:
+        cohorts: the population, oldest first. Modified in situ
+        model: evolve or evolve_multi_gene module
+        pool_size: number of choices when picking a partner
+        stop: decides when to stop, and records why. To reproduce the
+            behaviour of repeated_cycles, use the rule "y_extinct:extra_cycles"
+
+    Returns:
+        int: The number of cycles actually performed
+    '''
+    tally = Tally(cohorts, model)
+    cycle = 0
+    while True:
+        one_breeding_cycle(cohorts, cycle, model, pool_size, tally)
+        one_culling_cycle(cohorts, cycle, model, tally)
+        if stop.update(tally.stats(cycle)):
+            return cycle + 1
+        cycle += 1
+
+def population(cohorts: List[Cohort], model):
+    '''Flattens the cohorts back into the form the model works with
+
+    Returns:
+        tuple: arguments for the summary function of the model
+    '''
+    if _is_genome_model(model):
+        return ([individual for cohort in cohorts for category in (1, 2, 3)
+            for individual in cohort[category]],)
+
+    return tuple([individual for cohort in cohorts for individual in cohort[category]]
+        for category in (1, 2, 3))
+
+def _is_genome_model(model) -> bool:
+    return hasattr(model, "Genome")
+
+def _category(individual) -> int:
+    '''Which field of Cohort a Genome belongs in
+    '''
+    if not individual.is_male:
+        return 3
+    return 2 if individual.is_neanderthal else 1
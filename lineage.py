@@ -0,0 +1,138 @@
+from array import array
+import itertools
+from typing import List, Optional
+
+class Lineages:
+    '''The paternal lineages of the males of evolve.py, which carry the
+    Y-chromosome from father to son.
+
+    Every male ever born who still has a living male-line descendant is a node
+    of a family tree, stored as flat int32 arrays rather than Python objects:
+    the node of his father (-1 for a founder), the cycle he was born in (-1 for
+    a founder) and the founder at the top of his line. The nodes of the living
+    males are held in two more arrays, parallel to male_sapiens and
+    male_neanders, which must be kept in the same order as them: sons are added
+    at the end as they are born, and the oldest removed from the front as they
+    are culled.
+
+    Every prune_cycles cycles, the nodes with no living descendants are thrown
+    away, so memory stays in proportion to the living males and their
+    surviving ancestors.
+    '''
+
+    def __init__(self, n_sapiens: int, n_neanders: int, prune_cycles: int):
+        '''
+        Args:
+            n_sapiens: number of founding males with a sapiens y-chromosome
+            n_neanders: number of founding males with a neanderthal y-chromosome
+            prune_cycles: how often to throw away extinct lineages
+        '''
+        n_founders = n_sapiens + n_neanders
+        self.parent = array("i", [-1]) * n_founders
+        self.born = array("i", [-1]) * n_founders
+        self.founder = array("i", range(n_founders))
+        self.sapiens = array("i", range(n_sapiens))
+        self.neanders = array("i", range(n_sapiens, n_founders))
+        self.n_sapiens_founders = n_sapiens
+        self.prune_cycles = prune_cycles
+        self.cycle = 0
+
+    def living(self, is_sapiens: bool) -> array:
+        '''The nodes of the living males of one class, parallel to male_sapiens
+        or male_neanders
+        '''
+        return self.sapiens if is_sapiens else self.neanders
+
+    def add_sons(self, is_sapiens: bool, fathers: List[int]):
+        '''Adds newborn sons to the end of one class of living males
+
+        Args:
+            is_sapiens: whether the sons have a sapiens y-chromosome
+            fathers: node of the father of each son, in the order the sons
+                are added to the male list
+        '''
+        start = len(self.parent)
+        self.parent.extend(fathers)
+        self.founder.extend(map(self.founder.__getitem__, fathers))
+        self.born.extend(array("i", [self.cycle]) * len(fathers))
+        self.living(is_sapiens).extend(range(start, start + len(fathers)))
+
+    def kill_oldest(self, is_sapiens: bool, n: int):
+        '''Removes the n oldest living males of one class, as the culling does
+        '''
+        del self.living(is_sapiens)[0:n]
+
+    def end_cycle(self):
+        '''Called after every culling cycle. Prunes every prune_cycles cycles
+        '''
+        self.cycle += 1
+        if self.cycle % self.prune_cycles == 0:
+            self.prune()
+
+    def prune(self):
+        '''Throws away every node that is neither a living male nor an ancestor
+        of one, renumbering the rest.
+
+        A father is always born before his sons, so his node number is always
+        lower, and the order of the nodes is kept.
+        '''
+        parent = self.parent
+        keep = bytearray(len(parent))
+        for node in itertools.chain(self.sapiens, self.neanders):
+            while node >= 0 and not keep[node]:
+                keep[node] = 1
+                node = parent[node]
+
+        renumber = array("i", [-1]) * len(parent)
+        (new_parent, new_born, new_founder) = (array("i"), array("i"), array("i"))
+        for node in itertools.compress(range(len(parent)), keep):
+            renumber[node] = len(new_parent)
+            father = parent[node]
+            new_parent.append(renumber[father] if father >= 0 else -1)
+            new_born.append(self.born[node])
+            new_founder.append(self.founder[node])
+
+        (self.parent, self.born, self.founder) = (new_parent, new_born, new_founder)
+        self.sapiens = array("i", map(renumber.__getitem__, self.sapiens))
+        self.neanders = array("i", map(renumber.__getitem__, self.neanders))
+
+    def tmrca(self) -> Optional[int]:
+        '''Number of cycles since the birth of the most recent common paternal
+        ancestor of all the living males.
+
+        Returns:
+            None if there are no living males, or their lines go back to more
+            than one founder. If they all descend from a single founder, the
+            result is at least the number of cycles run.
+        '''
+        self.prune()
+        n_nodes = len(self.parent)
+        roots = self.parent.count(-1)
+        if n_nodes == 0 or roots > 1:
+            return None
+
+        # Every node left is a living male or an ancestor of one. Walk down
+        # from the founder until the line splits, or reaches a living male.
+        children = array("i", [0]) * n_nodes
+        only_child = array("i", [-1]) * n_nodes
+        for (node, father) in enumerate(self.parent):
+            if father >= 0:
+                children[father] += 1
+                only_child[father] = node
+        alive = bytearray(n_nodes)
+        for node in itertools.chain(self.sapiens, self.neanders):
+            alive[node] = 1
+
+        node = self.parent.index(-1)
+        while children[node] == 1 and not alive[node]:
+            node = only_child[node]
+        return self.cycle - self.born[node]
+
+    def summary(self) -> dict:
+        '''The number of founders with a surviving male line, in total and of
+        each species, and the TMRCA of the living males
+        '''
+        founders = set(map(self.founder.__getitem__, itertools.chain(self.sapiens, self.neanders)))
+        n_sapiens = sum(1 for founder in founders if founder < self.n_sapiens_founders)
+        return {"founders": len(founders), "sapiens-founders": n_sapiens,
+            "neander-founders": len(founders) - n_sapiens, "tmrca": self.tmrca()}
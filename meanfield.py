@@ -0,0 +1,258 @@
+import math
+from typing import List
+
+import lifetable
+import miscarriage
+import stopping
+
+# A deterministic, infinite-population version of the breeding and culling
+# cycles of evolve.py. Rather than individuals, each class holds the expected
+# number of individuals with each sapiensness, on a grid of MEAN_FIELD_BINS + 1
+# values from 0.0 to 1.0. Every random choice of evolve.py is replaced by its
+# expected effect, so a run takes a few milliseconds per cycle whatever the
+# population size, and every seed gives the same result. It is meant for
+# screening parameters before spending Monte-Carlo runs on them.
+#
+# The population is held as lifetable.Cohort tuples, oldest first, whose
+# fields are lists of expected numbers at each grid value rather than lists
+# of individuals. evolve.py kills the oldest first, so the age order matters.
+MEAN_FIELD_BINS = 64
+
+# A class with fewer than this many individuals expected is treated as having
+# died out, so that the neanderthal Y-chromosome can go extinct
+MEAN_FIELD_EXTINCT = 0.5
+
+def deposit(masses: List[float], value: float, mass: float):
+    '''Adds a number of individuals with the given sapiensness to a grid.
+
+    Values between grid points are shared between the two nearest, keeping
+    the mean sapiensness exact.
+    '''
+    position = value * (len(masses) - 1)
+    low = int(position)
+    fraction = position - low
+    masses[low] += mass * (1.0 - fraction)
+    if fraction > 0.0:
+        masses[low + 1] += mass * fraction
+
+def initial_cohorts(model, male_sapiens, male_neanders, females) -> List[lifetable.Cohort]:
+    '''Converts a population of individuals into a single cohort of founders
+
+    Args:
+        model: the evolve module
+        male_sapiens, male_neanders, females: as returned by initial_population
+
+    Returns:
+        The cohorts, as used by the other functions of this module
+    '''
+    classes = []
+    for individuals in (male_sapiens, male_neanders, females):
+        masses = [0.0] * (MEAN_FIELD_BINS + 1)
+        for value in individuals:
+            deposit(masses, value, 1.0)
+        classes.append(masses)
+    return [lifetable.Cohort(-1, *classes)]
+
+def totals(cohorts: List[lifetable.Cohort], category: int) -> List[float]:
+    '''Expected number at each grid value of one class, over all cohorts
+    '''
+    result = [0.0] * (MEAN_FIELD_BINS + 1)
+    for cohort in cohorts:
+        for (j, mass) in enumerate(cohort[category]):
+            result[j] += mass
+    return result
+
+def choice_distribution(males: List[float], target: float, pool_size: int, model) -> List[float]:
+    '''Probability that a female who prefers the given target picks a male at
+    each grid value, using the MATE_CHOICE of the model.
+
+    For the best of a pool of k, the chance that the best is no closer than
+    some value is the chance that all k are no closer, so the probability of
+    each value is a difference of k-th powers.
+
+    Args:
+        males: expected number of males (of either class) at each grid value
+        target: 0.0 or 1.0 for the preferred extreme, or None for no
+            preference, as for a female of exactly half
+        pool_size: number of males in the pool
+        model: the evolve module
+    '''
+    n_males = sum(males)
+    if target is None:
+        return [mass / n_males for mass in males]
+
+    if model.MATE_CHOICE == "weighted":
+        weights = [mass * math.exp(-model.MATE_CHOICE_BETA * abs(j / MEAN_FIELD_BINS - target))
+            for (j, mass) in enumerate(males)]
+        total = sum(weights)
+        return [weight / total for weight in weights]
+
+    # Visit the grid from the most to the least attractive value
+    order = range(MEAN_FIELD_BINS, -1, -1) if target == 1.0 else range(MEAN_FIELD_BINS + 1)
+    result = [0.0] * (MEAN_FIELD_BINS + 1)
+    closer = 0.0
+    for j in order:
+        if males[j] > 0.0:
+            no_closer = max(1.0 - closer / n_males, 0.0)
+            further = max(no_closer - males[j] / n_males, 0.0)
+            result[j] = no_closer ** pool_size - further ** pool_size
+            closer += males[j]
+    return result
+
+def one_breeding_cycle(cohorts: List[lifetable.Cohort], cycle: int, model, pool_size: int):
+    '''The expected effect of a breeding cycle of evolve.py.
+
+    Every female mates, with a male chosen as by find_partner, and half the
+    children are boys. Each pairing of a mother and a father class loses the
+    fraction of children that the MISCARRIAGE model expects to miscarry.
+
+    Args:
+        cohorts: the population, oldest first. Modified in situ
+        cycle: which breeding cycle this is
+        model: the evolve module
+        pool_size: how many partners to consider when finding the best
+    '''
+    male_sapiens = totals(cohorts, 1)
+    male_neanders = totals(cohorts, 2)
+    females = totals(cohorts, 3)
+    males = [s + n for (s, n) in zip(male_sapiens, male_neanders)]
+    if sum(males) <= 0.0:
+        return
+
+    # Chance of miscarriage of each kind of child, by the mother's grid value
+    grid = [i / MEAN_FIELD_BINS for i in range(MEAN_FIELD_BINS + 1)]
+    survive = {}
+    for neanderthal_y in (False, True):
+        for boy in (False, True):
+            survive[(neanderthal_y, boy)] = [1.0 - p for p in miscarriage.probabilities(
+                model.MISCARRIAGE, grid, [neanderthal_y] * len(grid), [boy] * len(grid))]
+
+    # Choice of father, split into his classes, for each preference
+    fathers = {}
+    for target in (0.0, 1.0, None):
+        choice = choice_distribution(males, target, pool_size, model)
+        fathers[target] = [(j, p * s / (s + n), p * n / (s + n))
+            for (j, (p, s, n)) in enumerate(zip(choice, male_sapiens, male_neanders)) if p > 0.0]
+
+    boy_sapiens = [0.0] * (2 * MEAN_FIELD_BINS + 1)
+    boy_neanders = [0.0] * (2 * MEAN_FIELD_BINS + 1)
+    girls = [0.0] * (2 * MEAN_FIELD_BINS + 1)
+    for (i, mothers) in enumerate(females):
+        if mothers <= 0.0:
+            continue
+        half = 0.5 * mothers
+        target = None if 2 * i == MEAN_FIELD_BINS else 0.0 if 2 * i < MEAN_FIELD_BINS else 1.0
+        (sapiens_boy, neander_boy) = (survive[(False, True)][i], survive[(True, True)][i])
+        (sapiens_girl, neander_girl) = (survive[(False, False)][i], survive[(True, False)][i])
+
+        # Children are indexed on a grid twice as fine, at the sum of the
+        # indices of their parents
+        for (j, p_sapiens, p_neander) in fathers[target]:
+            boy_sapiens[i + j] += half * p_sapiens * sapiens_boy
+            boy_neanders[i + j] += half * p_neander * neander_boy
+            girls[i + j] += half * (p_sapiens * sapiens_girl + p_neander * neander_girl)
+
+    children = []
+    for fine in (boy_sapiens, boy_neanders, girls):
+        masses = [0.0] * (MEAN_FIELD_BINS + 1)
+        for (k, mass) in enumerate(fine):
+            if mass > 0.0:
+                deposit(masses, k / (2 * MEAN_FIELD_BINS), mass)
+        children.append(masses)
+    cohorts.append(lifetable.Cohort(cycle, *children))
+
+def kill_oldest(cohorts: List[lifetable.Cohort], category: int, n: float):
+    '''Removes the expected n oldest individuals of one class. Within a
+    cohort, all grid values die in proportion
+    '''
+    for cohort in cohorts:
+        if n <= 0.0:
+            return
+        masses = cohort[category]
+        total = sum(masses)
+        if total <= n:
+            masses[:] = [0.0] * len(masses)
+            n -= total
+        elif total > 0.0:
+            masses[:] = [mass * (1.0 - n / total) for mass in masses]
+            n = 0.0
+
+def one_culling_cycle(cohorts: List[lifetable.Cohort], cycle: int, model):
+    '''The expected effect of the culling cycle of evolve.py, which keeps each
+    sex to its cap, and always kills ALWAYS_KILL of each class, oldest first.
+    Classes expected to have fewer than MEAN_FIELD_EXTINCT individuals are then
+    removed, and empty cohorts dropped.
+
+    Args:
+        cohorts: the population, oldest first. Modified in situ
+        cycle: which breeding cycle this is
+        model: the evolve module
+    '''
+    n_females = sum(sum(cohort.females) for cohort in cohorts)
+    kill_oldest(cohorts, 3, max(n_females - model.FEMALE_MAX_POPULATION - model.ALWAYS_KILL, 0) + model.ALWAYS_KILL)
+
+    n_sapiens = sum(sum(cohort.male_sapiens) for cohort in cohorts)
+    n_neanders = sum(sum(cohort.male_neanders) for cohort in cohorts)
+    n_males = n_sapiens + n_neanders
+    if n_males > 0.0:
+        kill = max(n_males - model.MALE_MAX_POPULATION - model.ALWAYS_KILL, 0)
+        kill_oldest(cohorts, 2, kill * n_neanders / n_males + model.ALWAYS_KILL)
+        kill_oldest(cohorts, 1, kill * n_sapiens / n_males + model.ALWAYS_KILL)
+
+    for category in (1, 2, 3):
+        if sum(sum(cohort[category]) for cohort in cohorts) < MEAN_FIELD_EXTINCT:
+            for cohort in cohorts:
+                cohort[category][:] = [0.0] * len(cohort[category])
+
+    cohorts[:] = [cohort for cohort in cohorts if any(any(cohort[category]) for category in (1, 2, 3))]
+
+def cycle_stats(cycle: int, cohorts: List[lifetable.Cohort]) -> stopping.CycleStats:
+    '''Summarises the population like stopping.cycle_stats, with expected
+    rather than actual numbers
+    '''
+    counts = []
+    means = []
+    histogram = [0.0] * stopping.HISTOGRAM_BINS
+    top = stopping.HISTOGRAM_BINS - 1
+    for category in (1, 2, 3):
+        masses = totals(cohorts, category)
+        n = sum(masses)
+        counts.append(n)
+        means.append(sum(j * mass for (j, mass) in enumerate(masses)) / MEAN_FIELD_BINS / n if n > 0.0 else 0.0)
+        for (j, mass) in enumerate(masses):
+            histogram[min(int(j / MEAN_FIELD_BINS * stopping.HISTOGRAM_BINS), top)] += mass
+
+    n_total = sum(counts)
+    if n_total > 0.0:
+        histogram = [mass / n_total for mass in histogram]
+    return stopping.CycleStats(cycle, tuple(counts), tuple(means), histogram)
+
+def cycles_until(cohorts: List[lifetable.Cohort], model, pool_size: int, stop: stopping.Stopping) -> int:
+    '''Repeatedly alternates breeding and culling cycles until told to stop.
+
+    Args:
+        cohorts: the population, oldest first. Modified in situ
+        model: the evolve module
+        pool_size: number of choices when picking a partner
+        stop: decides when to stop, and records why
+
+    Returns:
+        int: The number of cycles actually performed
+    '''
+    cycle = 0
+    while True:
+        one_breeding_cycle(cohorts, cycle, model, pool_size)
+        one_culling_cycle(cohorts, cycle, model)
+        if stop.update(cycle_stats(cycle, cohorts)):
+            return cycle + 1
+        cycle += 1
+
+def summary(cohorts: List[lifetable.Cohort], model) -> dict:
+    '''Summarises the population with the same keys as the summary function
+    of evolve.py. The counts are expected numbers, so are not whole.
+    '''
+    stats = cycle_stats(0, cohorts)
+    values = []
+    for (n, mean) in zip(stats.counts, stats.means):
+        values.extend([n, mean])
+    return dict(zip(["sapiens", "mean-sapiens", "neanders", "mean-neander", "females", "mean-female"], values))
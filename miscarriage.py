@@ -0,0 +1,89 @@
+import random
+
+# Models of miscarriage. Each is written as "name:arg:arg", for example
+# "linear:0.25", and gives the probability of miscarriage of each pregnancy:
+#
+#     none                   no miscarriages at all
+#     linear:R               a boy with a neanderthal y-chromosome miscarries
+#                            with probability R times the sapiensness of his
+#                            mother. "linear:1.0" is the original evolve.py
+#     threshold:T:R          as linear, but with probability R if the mother
+#                            is more than T sapiens, and zero otherwise
+#     dosage:P               a boy with a neanderthal y-chromosome miscarries
+#                            with probability 1 - (1 - P)^dosage, where dosage
+#                            is his number of sapiens miscarriage genes.
+#                            "dosage:1.0" is the original evolve_multi_gene.py
+#     sex:M:F                any foetus with a neanderthal father miscarries
+#                            with probability M (boys) or F (girls) times the
+#                            sapiensness of the mother
+#
+# Models that need the dosage can only be used by evolve_multi_gene.py.
+
+def mask(model: str, mothers, neanderthal_y, male, dosage=None):
+    '''Decides which of a batch of pregnancies miscarry.
+
+    All the arguments other than model are sequences with one entry per
+    pregnancy. Random draws are only made for pregnancies at risk.
+
+    Args:
+        model: which model of miscarriage, such as "linear:1.0"
+        mothers (List[float]): sapiensness of each mother (0.0 to 1.0)
+        neanderthal_y (List[bool]): whether the father carries a neanderthal
+            y-chromosome
+        male (List[bool]): whether the foetus is a boy
+        dosage (List[int]): number of sapiens miscarriage genes in the foetus,
+            or None if the model does not track genes
+
+    Returns:
+        List[bool]: true for each pregnancy that miscarries
+    '''
+    return [p > 0.0 and random.random() < p
+        for p in probabilities(model, mothers, neanderthal_y, male, dosage)]
+
+def probabilities(model: str, mothers, neanderthal_y, male, dosage=None):
+    '''The probability of miscarriage of each of a batch of pregnancies, with
+    the same arguments as mask
+
+    Returns:
+        List[float]: probability of each pregnancy miscarrying
+    '''
+    (name, args) = parse(model)
+    if name == "dosage" and dosage is None:
+        raise ValueError("miscarriage model {} needs a model of genes".format(model))
+
+    return _MODELS[name](mothers, neanderthal_y, male, dosage, *args)
+
+def parse(model: str):
+    '''Splits a model such as "sex:0.25:0.125" into its name and arguments
+    '''
+    (name, *args) = model.strip().split(":")
+    if name not in _MODELS:
+        raise ValueError("unknown miscarriage model {}".format(name))
+    return (name, [float(arg) for arg in args])
+
+def _none(mothers, neanderthal_y, male, dosage):
+    return [0.0] * len(mothers)
+
+def _linear(mothers, neanderthal_y, male, dosage, rate=1.0):
+    return [rate * mother if boy and y else 0.0
+        for (mother, y, boy) in zip(mothers, neanderthal_y, male)]
+
+def _threshold(mothers, neanderthal_y, male, dosage, threshold=0.5, rate=1.0):
+    return [rate if boy and y and mother > threshold else 0.0
+        for (mother, y, boy) in zip(mothers, neanderthal_y, male)]
+
+def _dosage(mothers, neanderthal_y, male, dosage, per_gene=1.0):
+    return [1.0 - (1.0 - per_gene) ** genes if boy and y else 0.0
+        for (y, boy, genes) in zip(neanderthal_y, male, dosage)]
+
+def _sex(mothers, neanderthal_y, male, dosage, male_rate=1.0, female_rate=0.0):
+    return [(male_rate if boy else female_rate) * mother if y else 0.0
+        for (mother, y, boy) in zip(mothers, neanderthal_y, male)]
+
+_MODELS = {
+    "none": _none,
+    "linear": _linear,
+    "threshold": _threshold,
+    "dosage": _dosage,
+    "sex": _sex,
+}
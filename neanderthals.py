@@ -0,0 +1,89 @@
+import argparse
+import json
+
+import simulation
+
+# Command-line interface to all the models. For example
+#
+#     python neanderthals.py run --model multi-gene --pool 3 --replicates 5
+#     python neanderthals.py run --config experiment.json --seed 7
+#     python neanderthals.py sweep --model evolve --pools 1-6 --replicates 10
+#     python neanderthals.py status --watch 5
+#     python neanderthals.py design run --factor ALWAYS_KILL=0:20 --points 32
+#
+# Only the modules needed by the command are imported, so the sweep machinery
+# (multiprocessing and the SQLite ledger) costs nothing for a single run.
+
+def run(args, config: dict):
+    '''Executes replicates of one simulation, and writes the results to stdout
+    '''
+    overrides = dict(args.set)
+    if args.stop:
+        overrides["stop"] = args.stop
+    (model, overrides, constants) = simulation.configure(config, args.model, overrides, dict(args.const))
+    pool_size = args.pool if args.pool is not None else config.get("pool_size", 1)
+    first_seed = args.seed if args.seed is not None else config.get("seed", 0)
+
+    sim = simulation.Simulation(model, pool_size, constants, **overrides)
+    module = simulation.load_model(model)
+    lineages = ["founders", "sapiens-founders", "neander-founders", "tmrca"] \
+        if sim.params["constants"].get("LINEAGES", 0) > 0 else []
+    spatial = ["hybrid-zone", "ancestry-map"] if sim.params["constants"].get("SPATIAL_RADIUS", 0) > 0 else []
+    module.print_header("seed", "stop", "extinction", *lineages, *spatial)
+    for seed in range(first_seed, first_seed + args.replicates):
+        result = sim.run(seed)
+        module.print_row(pool_size, result["cycles"], result["stats"],
+            seed, result["reason"], result["extinction"], *(result["lineages"][name] for name in lineages),
+            *(spatial_columns(result["spatial"]) if spatial else []))
+
+def spatial_columns(summary: dict) -> list:
+    '''The hybrid zone width and ancestry map of a spatial run, as printed by
+    run. The map is compact JSON, so that it stays in one column
+    '''
+    return [summary["hybrid_zone"], json.dumps(summary["map"], separators=(",", ":"))]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate a mixed population of Neanderthals and Sapiens")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run one model without a ledger")
+    run_parser.add_argument("--config", metavar="FILE",
+        help="JSON file of the model, run parameters and constants, overridden by any flags")
+    run_parser.add_argument("--model", choices=sorted(simulation.MODELS), help="default evolve")
+    run_parser.add_argument("--pool", type=int, help="pool size, default 1")
+    run_parser.add_argument("--seed", type=int, help="seed of the first replicate, default 0")
+    run_parser.add_argument("--replicates", type=int, default=1)
+    run_parser.add_argument("--set", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a run parameter, e.g. max_cycles=200")
+    run_parser.add_argument("--const", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a model constant, e.g. ALWAYS_KILL=0")
+    run_parser.add_argument("--stop", metavar="RULES",
+        help="stopping rules to use instead of extra_cycles, e.g. stationary:20:0.01,y_extinct:40")
+
+    # The sweep command takes all the arguments of sweep.py, so leave them for
+    # it to parse, including --help
+    commands.add_parser("sweep", add_help=False, help="run a memoised sweep, as sweep.py")
+    commands.add_parser("status", add_help=False, help="show the progress of a sweep, as progress.py")
+    commands.add_parser("design", add_help=False,
+        help="run a design of experiments and fit a surrogate, as design.py")
+
+    (args, rest) = parser.parse_known_args(argv)
+    if args.command == "sweep":
+        import sweep
+        sweep.main(rest)
+        return
+    if args.command == "status":
+        import progress
+        progress.main(rest)
+        return
+    if args.command == "design":
+        import design
+        design.main(rest)
+        return
+
+    if rest:
+        parser.error("unrecognized arguments: {}".format(" ".join(rest)))
+    run(args, simulation.load_config(args.config) if args.config else {})
+
+if __name__ == '__main__':
+    main()
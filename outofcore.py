@@ -0,0 +1,387 @@
+import os
+import random
+import struct
+import tempfile
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import lifetable
+import miscarriage
+import stopping
+
+# An out-of-core version of the breeding and culling cycles of
+# evolve_multi_gene.py, for populations too big to hold in memory. Each
+# individual is a fixed-size record in a temporary file: a flags byte, the
+# cycle of birth, and the first and second allele of every gene as two
+# bitsets. Only an index of the record numbers of the males and females is
+# kept in memory, at 8 bytes per individual.
+#
+# Records are read and written in chunks, each read in a background thread
+# while the previous chunk is being worked on. Whatever the population size,
+# no more than about OUT_OF_CORE_MEMORY bytes of records are in memory at
+# once. Culling, the stats and the index are all done in one sequential pass
+# per cycle, which writes the survivors to a fresh file. The file and the
+# background thread are released by close, which simulation.py calls at the
+# end of every run.
+OUT_OF_CORE_MEMORY = 64 * 2 ** 20
+
+# Bits of the flags byte of a record. Private, so that simulation.py does not
+# take them for tunable model constants
+_MALE = 1
+_NEANDERTHAL = 2
+
+# Flags byte and cycle of birth, at the start of every record
+HEADER = struct.Struct("<Bi")
+
+def popcount(bits: int) -> int:
+    return bin(bits).count("1")
+
+class Store:
+    '''A population of the multi-gene model, held in a temporary file.
+
+    Gene i of the genome is bit i of each bitset, with the appearance genes
+    first, then the fancy, miscarry and other genes. Mixing the genes of two
+    parents, or comparing appearance with fancy, is then a few operations on
+    whole bitsets, however many genes there are.
+    '''
+
+    def __init__(self, model, directory: str = None):
+        '''
+        Args:
+            model: the evolve_multi_gene module
+            directory: where to put the file, by default the system
+                temporary directory
+        '''
+        self.blocks = [model.NUMBER_OF_APPEARANCE_GENES, model.NUMBER_OF_FANCY_GENES,
+            model.NUMBER_OF_MISCARRY_GENES, model.NUMBER_OF_OTHER_GENES]
+        self.n_genes = sum(self.blocks)
+        self.gene_bytes = (self.n_genes + 7) // 8
+        self.record_size = HEADER.size + 2 * self.gene_bytes
+        self.masks = []
+        start = 0
+        for n_genes in self.blocks:
+            self.masks.append(((1 << n_genes) - 1) << start)
+            start += n_genes
+
+        # Two chunks are in memory at once, one being read and one worked on
+        self.chunk_records = max(OUT_OF_CORE_MEMORY // (2 * self.record_size), 1)
+        self.directory = directory
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.reader = ThreadPoolExecutor(max_workers=1)
+        self.n_records = 0
+        self.males = array("q")
+        self.females = array("q")
+
+    def close(self):
+        '''Deletes the file and stops the background thread. The store
+        cannot be used afterwards
+        '''
+        self.reader.shutdown()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def encode(self, flags: int, birthday: int, first: int, second: int) -> bytes:
+        return (HEADER.pack(flags, birthday) + first.to_bytes(self.gene_bytes, "little")
+            + second.to_bytes(self.gene_bytes, "little"))
+
+    def decode(self, record: bytes, offset: int = 0):
+        '''Unpacks the record at the given offset
+
+        Returns:
+            (int, int, int, int): flags, birthday, first and second alleles
+        '''
+        (flags, birthday) = HEADER.unpack_from(record, offset)
+        start = offset + HEADER.size
+        middle = start + self.gene_bytes
+        return (flags, birthday, int.from_bytes(record[start:middle], "little"),
+            int.from_bytes(record[middle:middle + self.gene_bytes], "little"))
+
+    def append(self, records: List[bytes]):
+        '''Writes records to the end of the file, adding them to the index
+        '''
+        for record in records:
+            (self.males if record[0] & _MALE else self.females).append(self.n_records)
+            self.n_records += 1
+        os.pwrite(self.file.fileno(), b"".join(records), (self.n_records - len(records)) * self.record_size)
+
+    def read(self, start: int, count: int) -> bytes:
+        '''Reads count records, starting at record number start
+        '''
+        return os.pread(self.file.fileno(), count * self.record_size, start * self.record_size)
+
+    def read_records(self, numbers: List[int]) -> dict:
+        '''Reads the given records, in order of record number, reading runs of
+        consecutive records in one go
+
+        Returns:
+            dict: the record of each number
+        '''
+        records = {}
+        numbers = sorted(set(numbers))
+        i = 0
+        while i < len(numbers):
+            j = i + 1
+            while j < len(numbers) and numbers[j] == numbers[j - 1] + 1:
+                j += 1
+            data = self.read(numbers[i], j - i)
+            for k in range(i, j):
+                offset = (k - i) * self.record_size
+                records[numbers[k]] = data[offset:offset + self.record_size]
+            i = j
+        return records
+
+    def chunks(self):
+        '''Reads the whole file in order, a chunk at a time, reading the next
+        chunk in the background
+
+        Yields:
+            bytes: the records of each chunk
+        '''
+        if self.n_records == 0:
+            return
+        pending = self.reader.submit(self.read, 0, self.chunk_records)
+        for start in range(0, self.n_records, self.chunk_records):
+            data = pending.result()
+            following = start + self.chunk_records
+            if following < self.n_records:
+                pending = self.reader.submit(self.read, following, self.chunk_records)
+            yield data
+
+    def sapiensness(self, first: int, second: int) -> float:
+        return (popcount(first) + popcount(second)) / (2 * self.n_genes)
+
+def initial_cohorts(model, individuals) -> Store:
+    '''Writes a population of the multi-gene model to a new store
+
+    Args:
+        model: the evolve_multi_gene module
+        individuals: as returned by its initial_population
+
+    Returns:
+        The store, as used by the other functions of this module
+    '''
+    store = Store(model)
+    try:
+        _write_founders(store, model, individuals)
+    except:
+        store.close()
+        raise
+    return store
+
+def _write_founders(store: Store, model, individuals):
+    records = []
+    encoded = {}
+    for individual in individuals:
+        # The founders of each kind are usually all the same object
+        if id(individual) not in encoded:
+            first = 0
+            second = 0
+            start = 0
+            for (genes, n_genes) in zip(individual[:4], store.blocks):
+                for (i, allele) in enumerate(model.picked_alleles(genes, 0)):
+                    first |= allele << (start + i)
+                for (i, allele) in enumerate(model.picked_alleles(genes, (1 << n_genes) - 1)):
+                    second |= allele << (start + i)
+                start += n_genes
+            flags = (_MALE if individual.is_male else 0) | (_NEANDERTHAL if individual.is_neanderthal else 0)
+            encoded[id(individual)] = store.encode(flags, individual.birthday, first, second)
+        records.append(encoded[id(individual)])
+        if len(records) == store.chunk_records:
+            store.append(records)
+            records = []
+    store.append(records)
+
+def one_breeding_cycle(store: Store, cycle: int, model, pool_size: int):
+    '''Executes one breeding cycle of evolve_multi_gene.py on the store.
+
+    The mothers are taken in batches that fit the memory budget. The pools of
+    males for the next batch are drawn, and their records read in the
+    background, while the current batch is bred. The surviving children are
+    added to the end of the file.
+
+    Args:
+        store: the population. Modified in situ
+        cycle: which breeding cycle this is
+        model: the evolve_multi_gene module
+        pool_size: how many partners to consider when finding the best
+    '''
+    n_females = len(store.females)
+    n_mothers = n_females - int(n_females * model.BREEDING_PROPORTION)
+    if n_mothers <= 0 or not store.males:
+        return
+
+    mothers = lifetable.choose(array("q", store.females), n_mothers)
+    batch = max(OUT_OF_CORE_MEMORY // (2 * (pool_size + 1) * store.record_size), 1)
+    (n_appearance, n_fancy) = store.blocks[:2]
+    if n_appearance != n_fancy:
+        raise ValueError("appearance and fancy genes must match one to one")
+    appearance = store.masks[0]
+    miscarry = store.masks[2]
+    n_males = len(store.males)
+
+    def plan(start):
+        batch_mothers = mothers[start:start + batch]
+        pools = [[store.males[random.randint(0, n_males - 1)] for _ in range(pool_size)]
+            for _ in batch_mothers]
+        return (batch_mothers, pools)
+
+    def fetch(batch_mothers, pools):
+        return store.read_records(list(batch_mothers) + [male for pool in pools for male in pool])
+
+    reader = store.reader
+    (batch_mothers, pools) = plan(0)
+    pending = reader.submit(fetch, batch_mothers, pools)
+    for start in range(0, n_mothers, batch):
+        records = pending.result()
+        (current_mothers, current_pools) = (batch_mothers, pools)
+        if start + batch < n_mothers:
+            (batch_mothers, pools) = plan(start + batch)
+            pending = reader.submit(fetch, batch_mothers, pools)
+
+        # The dosage of a gene is 0, 1 or 2, which we code as two bits, at
+        # least one and two. The difference between two dosages is then
+        # the number of bits that differ, as in match_codes.
+        codes = {}
+        def code(number, shift):
+            if (number, shift) not in codes:
+                (_, _, first, second) = store.decode(records[number])
+                codes[(number, shift)] = ((((first | second) >> shift) & appearance),
+                    (((first & second) >> shift) & appearance))
+            return codes[(number, shift)]
+
+        children = []
+        mother_sapiens = []
+        for (mother, pool) in zip(current_mothers, current_pools):
+            (fancy_any, fancy_both) = code(mother, n_appearance)
+            best_match = -1
+            for male in pool:
+                (appear_any, appear_both) = code(male, 0)
+                male_matches = (2 * n_appearance - popcount(appear_any ^ fancy_any)
+                    - popcount(appear_both ^ fancy_both))
+                if male_matches > best_match:
+                    best_match = male_matches
+                    father = male
+
+            (_, _, mother_first, mother_second) = store.decode(records[mother])
+            (father_flags, _, father_first, father_second) = store.decode(records[father])
+            is_male = random.randint(0, 1) == 0
+            father_picks = random.getrandbits(store.n_genes)
+            mother_picks = random.getrandbits(store.n_genes)
+            children.append(((_MALE if is_male else 0) | (father_flags & _NEANDERTHAL),
+                (father_first & ~father_picks) | (father_second & father_picks),
+                (mother_first & ~mother_picks) | (mother_second & mother_picks)))
+            mother_sapiens.append(store.sapiensness(mother_first, mother_second))
+
+        lost = miscarriage.mask(model.MISCARRIAGE, mother_sapiens,
+            [bool(flags & _NEANDERTHAL) for (flags, _, _) in children],
+            [bool(flags & _MALE) for (flags, _, _) in children],
+            [popcount(first & miscarry) + popcount(second & miscarry) for (_, first, second) in children])
+        store.append([store.encode(flags, cycle, first, second)
+            for ((flags, first, second), miscarried) in zip(children, lost) if not miscarried])
+
+def one_culling_cycle(store: Store, cycle: int, model) -> stopping.CycleStats:
+    '''Executes one culling cycle of evolve_multi_gene.py on the store, which
+    kills individuals at random until there are MAX_POPULATION left.
+
+    The survivors are chosen in one pass by selection sampling, and written to
+    a fresh file, which replaces the old one. The same pass rebuilds the index
+    and works out the stats.
+
+    Args:
+        store: the population. Modified in situ
+        cycle: which breeding cycle this is
+        model: the evolve_multi_gene module
+
+    Returns:
+        The stats of the survivors, for the stopping rule
+    '''
+    remaining = store.n_records
+    needed = min(remaining, model.MAX_POPULATION)
+    survivors = tempfile.TemporaryFile(dir=store.directory)
+    (males, females) = (array("q"), array("q"))
+    counts = [0, 0, 0]
+    totals = [0.0, 0.0, 0.0]
+    histogram = [0] * stopping.HISTOGRAM_BINS
+    top = stopping.HISTOGRAM_BINS - 1
+
+    written = 0
+    kept = bytearray()
+    for data in store.chunks():
+        for offset in range(0, len(data), store.record_size):
+            if needed < remaining and random.random() * remaining >= needed:
+                remaining -= 1
+                continue
+            remaining -= 1
+            needed -= 1
+
+            (flags, _, first, second) = store.decode(data, offset)
+            category = 2 if not flags & _MALE else 1 if flags & _NEANDERTHAL else 0
+            (males if flags & _MALE else females).append(written + len(kept) // store.record_size)
+            value = store.sapiensness(first, second)
+            counts[category] += 1
+            totals[category] += value
+            histogram[min(int(value * stopping.HISTOGRAM_BINS), top)] += 1
+            kept += data[offset:offset + store.record_size]
+
+        os.pwrite(survivors.fileno(), kept, written * store.record_size)
+        written += len(kept) // store.record_size
+        kept = bytearray()
+
+    store.file.close()
+    (store.file, store.n_records, store.males, store.females) = (survivors, written, males, females)
+
+    n_total = sum(counts)
+    if n_total > 0:
+        histogram = [count / n_total for count in histogram]
+    means = tuple(total / n if n > 0 else 0.0 for (total, n) in zip(totals, counts))
+    return stopping.CycleStats(cycle, tuple(counts), means, histogram)
+
+def cycles_until(store: Store, model, pool_size: int, stop: stopping.Stopping) -> int:
+    '''Repeatedly alternates breeding and culling cycles until told to stop.
+
+    Args:
+        store: the population. Modified in situ
+        model: the evolve_multi_gene module
+        pool_size: number of choices when picking a partner
+        stop: decides when to stop, and records why
+
+    Returns:
+        int: The number of cycles actually performed
+    '''
+    cycle = 0
+    while True:
+        one_breeding_cycle(store, cycle, model, pool_size)
+        if stop.update(one_culling_cycle(store, cycle, model)):
+            return cycle + 1
+        cycle += 1
+
+def summary(store: Store, model) -> dict:
+    '''Summarises the population with the same keys as the summary function
+    of evolve_multi_gene.py, in one pass over the store
+    '''
+    n_male = 0
+    n_neander_y = 0
+    totals = [0, 0, 0, 0]
+    for data in store.chunks():
+        for offset in range(0, len(data), store.record_size):
+            (flags, _, first, second) = store.decode(data, offset)
+            for (i, mask) in enumerate(store.masks):
+                totals[i] += popcount(first & mask) + popcount(second & mask)
+            if flags & _MALE:
+                n_male += 1
+                if flags & _NEANDERTHAL:
+                    n_neander_y += 1
+
+    # Avoid dividing by zero if the whole population has died out
+    n_genomes = max(store.n_records, 1)
+    (appearance, fancy, miscarry, other) = (total / (n_genomes * n_genes * 2)
+        for (total, n_genes) in zip(totals, store.blocks))
+    return {
+        "pop": store.n_records, "males": n_male, "neander_y": n_neander_y,
+        "appearance": appearance, "fancy": fancy, "miscarry": miscarry, "other": other}
@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import ledger
+
+# Each sweep worker writes its status to its own small JSON file, in a
+# directory next to the ledger, at most once every INTERVAL seconds. The
+# status command reads them all back, along with the ledger, so nothing is
+# shared between workers and the breeding loop never waits for anyone.
+INTERVAL = 1.0
+
+# Window over which the throughput of the whole sweep is measured, in seconds
+WINDOW = 300.0
+
+# A worker that has not written its status for this long is shown as stale
+STALE = 30.0
+
+def status_directory(ledger_path: str) -> str:
+    '''Where the workers of a sweep using the given ledger write their status
+    '''
+    return ledger_path + ".status"
+
+class Progress:
+    '''Publishes the progress of one worker through its runs.
+
+    Call begin before each run and end after it. During the run, the model
+    calls the object with the number of cycles so far after every cycle.
+    That only looks at the clock, and the status is written out when
+    INTERVAL seconds have passed since it last was.
+    '''
+
+    def __init__(self, path: str, interval: float = INTERVAL):
+        '''
+        Args:
+            path: file name for the status of this worker
+            interval: minimum number of seconds between writes
+        '''
+        self.path = path
+        self.interval = interval
+        self.status = {"worker": ledger.worker_name(), "state": "idle", "runs": 0}
+        self.counts = None
+        self.started = time.monotonic()
+        self.next_write = 0.0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.write()
+
+    def begin(self, key: str, model: str, params: dict, seed: int):
+        '''Records the start of a run
+        '''
+        self.status.update({"state": "running", "key": key, "model": model,
+            "pool_size": params["pool_size"], "seed": seed, "max_cycles": params["max_cycles"],
+            "cycle": 0, "counts": None, "cycles_per_second": 0.0})
+        self.counts = None
+        self.started = time.monotonic()
+        self.write()
+
+    def watch(self, counts):
+        '''Sets the function called for the current population counts (male
+        sapiens, male neanderthals and females), which is only called when the
+        status is written
+        '''
+        self.counts = counts
+
+    def __call__(self, cycles: int):
+        now = time.monotonic()
+        if now < self.next_write:
+            return
+        self.status["cycle"] = cycles
+        self.status["cycles_per_second"] = cycles / max(now - self.started, 1e-9)
+        if self.counts is not None:
+            self.status["counts"] = list(self.counts())
+        self.write()
+
+    def end(self):
+        '''Records the end of a run
+        '''
+        self.status["state"] = "idle"
+        self.status["runs"] += 1
+        self.write()
+
+    def close(self):
+        '''Records that the worker has finished
+        '''
+        self.status["state"] = "finished"
+        self.write()
+
+    def write(self):
+        '''Writes the status now. The file is replaced in one step, so readers
+        never see half of it
+        '''
+        self.status["updated"] = time.time()
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as output:
+            json.dump(self.status, output)
+        os.replace(temporary, self.path)
+        self.next_write = time.monotonic() + self.interval
+
+def read_statuses(ledger_path: str) -> list:
+    '''The latest status of every worker that has run against the ledger
+    '''
+    directory = status_directory(ledger_path)
+    if not os.path.isdir(directory):
+        return []
+
+    statuses = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            try:
+                with open(os.path.join(directory, name)) as source:
+                    statuses.append(json.load(source))
+            except (OSError, ValueError):
+                pass   # removed or replaced while we were reading it
+    return statuses
+
+def format_duration(seconds: float) -> str:
+    '''Formats a number of seconds as, for example, 1h 02m 03s
+    '''
+    if seconds != seconds or seconds == float("inf"):
+        return "unknown"
+    seconds = int(seconds)
+    (hours, seconds) = divmod(seconds, 3600)
+    (minutes, seconds) = divmod(seconds, 60)
+    if hours:
+        return "{}h {:02d}m {:02d}s".format(hours, minutes, seconds)
+    if minutes:
+        return "{}m {:02d}s".format(minutes, seconds)
+    return "{}s".format(seconds)
+
+def print_status(ledger_path: str, file=sys.stdout):
+    '''Writes a summary of the progress of a sweep: the runs in each state,
+    the throughput and estimated time to finish, and what each worker is doing
+    '''
+    conn = ledger.open_ledger(ledger_path)
+    counts = ledger.status_counts(conn)
+    now = time.time()
+    (finished, since) = ledger.finished_since(conn, now - WINDOW)
+    conn.close()
+
+    n_total = sum(counts.values())
+    n_done = counts.get(ledger.DONE, 0)
+    n_left = counts.get(ledger.PENDING, 0) + counts.get(ledger.RUNNING, 0)
+    throughput = finished / (now - since) if finished and now > since else 0.0
+
+    print("runs: {} done, {} running, {} pending, {} failed ({:.0%} complete)".format(
+        n_done, counts.get(ledger.RUNNING, 0), counts.get(ledger.PENDING, 0),
+        counts.get(ledger.FAILED, 0), n_done / n_total if n_total else 0.0), file=file)
+    print("throughput: {:.3g} runs/s, ETA {}".format(throughput,
+        format_duration(n_left / throughput) if throughput else "unknown"), file=file)
+
+    print("worker\tstate\tmodel\tpool\tseed\tcycle\tcycles/s\tsapiens\tneanders\tfemales\truns\tupdated",
+        file=file)
+    for status in read_statuses(ledger_path):
+        age = now - status["updated"]
+        state = "stale" if status["state"] != "finished" and age > STALE else status["state"]
+        columns = [status["worker"], state]
+        if status["state"] == "running":
+            columns.extend([status["model"], status["pool_size"], status["seed"],
+                "{}/{}".format(status["cycle"], status["max_cycles"]),
+                "{:.1f}".format(status["cycles_per_second"])])
+            columns.extend(status["counts"] or ["", "", ""])
+        else:
+            columns.extend([""] * 8)
+        columns.extend([status["runs"], "{} ago".format(format_duration(age))])
+        print("\t".join(str(column) for column in columns), file=file)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the progress of a sweep")
+    parser.add_argument("--ledger", default="sweep.db")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+        help="keep showing the progress, refreshing this often")
+    args = parser.parse_args(argv)
+
+    while True:
+        print_status(args.ledger)
+        if not args.watch:
+            return
+        time.sleep(args.watch)
+        print()
+
+if __name__ == '__main__':
+    main()
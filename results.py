@@ -0,0 +1,368 @@
+import argparse
+import csv
+import json
+import math
+import os
+
+import adaptive
+import ledger
+
+# The results store holds the runs that are done in a ledger as tables, split
+# into parts by model and by when they were added:
+#
+#     STORE/runs/model=evolve/part-00000.parquet      one row per run
+#     STORE/cycles/model=evolve/part-00000.parquet    one row per traced cycle
+#     STORE/digests/model=evolve/part-00000.json      what the reports need
+#     STORE/ingested.txt                              keys of runs in the store
+#
+# Parts are Parquet if pyarrow is installed, and CSV otherwise. Ingesting only
+# writes new parts, and regenerating the reports only reads the parts that do
+# not yet have a digest, so both stay fast as the store grows. Per-cycle rows
+# only exist for runs with the trace parameter set, e.g. --set trace=1.
+
+# Run parameters and model constants that separate the series of the reports.
+# Runs that differ only in anything else are lumped together.
+SERIES = ["engine", "stop", "MISCARRIAGE", "MATE_CHOICE"]
+
+# Columns of the cycles table, after the key of the run. These are the items
+# of each entry of the trace, as recorded by stopping.Stopping
+CYCLE_COLUMNS = ["cycle", "sapiens", "neanders", "females", "mean-sapiens", "mean-neander", "mean-female"]
+
+ANCESTRY_LABEL = "Percentage Sapiens in the genome"
+EXTINCTION_LABEL = "Cycles before Extinction"
+
+# The graphs in README.md: file name, title, y-axis label, what to plot
+# ("ancestry", or "extinction" which is zero if it did not happen), the model,
+# and the values of SERIES that runs must have to be included.
+GRAPHS = [
+    ("EvolutionByPoolSize.png",
+        "Genetic mix of Neanderthals and Sapiens by sexual selection pool size",
+        ANCESTRY_LABEL, "ancestry", "evolve", {"engine": "standard", "MISCARRIAGE": "linear:1.0"}),
+    ("ReproductiveCyclesBeforeNeanderthalYGoesExtinct.png",
+        "Number of Reproductive Cycles before Neanderthal Y-Chromosome goes Extinct",
+        EXTINCTION_LABEL, "extinction", "evolve", {"engine": "standard", "MISCARRIAGE": "linear:1.0"}),
+    ("EvolutionByPoolSizeWithAdjustedSexualSelection.png",
+        "Genetic mix by sexual selection pool size, with males choosing",
+        ANCESTRY_LABEL, "ancestry", "male-selection", {"engine": "standard"}),
+    ("EvolutionByPoolSizeWithFullGeneHandling.png",
+        "Genetic mix by sexual selection pool size, with full genome modelling",
+        ANCESTRY_LABEL, "ancestry", "multi-gene", {"engine": "standard"}),
+    ("EvolutionByPoolSizeWith25PercentMiscarriage.png",
+        "Genetic mix by sexual selection pool size, with 25% chance of miscarriage",
+        ANCESTRY_LABEL, "ancestry", "evolve", {"engine": "standard", "MISCARRIAGE": "linear:0.25"}),
+    ("EvolutionByPoolSizeWithNoMiscarriage.png",
+        "Genetic mix by sexual selection pool size, with no miscarriage",
+        ANCESTRY_LABEL, "ancestry", "evolve", {"engine": "standard", "MISCARRIAGE": "none"}),
+    ("EvolutionByPoolSizeWithQuarterMaleAndEighthFemaleMiscarriage.png",
+        "Genetic mix by sexual selection pool size, with 25% male and 12.5% female miscarriage",
+        ANCESTRY_LABEL, "ancestry", "evolve", {"engine": "standard", "MISCARRIAGE": "sex:0.25:0.125"}),
+]
+
+def has_parquet() -> bool:
+    '''Whether pyarrow is installed, so parts can be written as Parquet
+    '''
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        return False
+    return True
+
+def write_part(path: str, columns: dict) -> str:
+    '''Writes a table as Parquet if possible, otherwise as CSV
+
+    Args:
+        path: file name of the part, without the extension
+        columns: list of values of each column, keyed by column name
+
+    Returns:
+        The file name actually written
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if has_parquet():
+        import pyarrow
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.Table.from_pydict(columns), path + ".parquet")
+        return path + ".parquet"
+
+    with open(path + ".csv", "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        for row in zip(*columns.values()):
+            writer.writerow(["" if value is None else value if isinstance(value, str) else json.dumps(value)
+                for value in row])
+    return path + ".csv"
+
+def read_part(path: str, names=None) -> dict:
+    '''Reads the given columns of a part written by write_part, or all of
+    them. Columns that are not in the part are all None.
+    '''
+    if path.endswith(".parquet"):
+        import pyarrow.parquet
+        available = pyarrow.parquet.read_schema(path).names
+        columns = pyarrow.parquet.read_table(
+            path, columns=[name for name in names or available if name in available]).to_pydict()
+    else:
+        with open(path, newline="") as source:
+            reader = csv.reader(source)
+            header = next(reader)
+            columns = {name: [] for name in header}
+            for row in reader:
+                for (name, cell) in zip(header, row):
+                    columns[name].append(_parse_cell(cell))
+        columns = {name: values for (name, values) in columns.items() if names is None or name in names}
+
+    n_rows = len(next(iter(columns.values()), []))
+    return {name: columns.get(name, [None] * n_rows) for name in names or columns}
+
+def _parse_cell(cell: str):
+    if cell == "":
+        return None
+    try:
+        return json.loads(cell)
+    except ValueError:
+        return cell
+
+def run_row(model: str, params: dict, result: dict) -> dict:
+    '''Flattens the parameters and result of a run into one row of the runs
+    table, including the ancestry and Y-extinction as found by adaptive.outcome.
+    Lists, such as the ancestry map of a spatial run, are stored as JSON.
+    '''
+    row = {name: value for (name, value) in params.items() if name != "constants"}
+    for (name, value) in params["constants"].items():
+        row[name] = json.dumps(value) if isinstance(value, list) else value
+    row.update(result["stats"])
+    row.update(result.get("lineages", {}))
+    if "spatial" in result:
+        row["hybrid_zone"] = result["spatial"]["hybrid_zone"]
+        row["ancestry_map"] = json.dumps(result["spatial"]["map"])
+    row.update({"cycles": result["cycles"], "reason": result["reason"], "extinction": result["extinction"]})
+    (row["ancestry"], row["extinct"], _) = adaptive.outcome(model, params, result)
+    return row
+
+def columns_of(rows) -> dict:
+    '''Turns a list of rows into columns. Any missing cells are None
+    '''
+    names = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    return {name: [row.get(name) for row in rows] for name in names}
+
+def ingest(ledger_path: str, store: str) -> int:
+    '''Adds to the store any runs in the ledger that are done and not yet there
+
+    Returns:
+        The number of runs added
+    '''
+    ingested_path = os.path.join(store, "ingested.txt")
+    ingested = set()
+    if os.path.exists(ingested_path):
+        with open(ingested_path) as source:
+            ingested = set(source.read().split())
+
+    conn = ledger.open_ledger(ledger_path)
+    new_runs = ledger.done_runs(conn, ingested)
+
+    by_model = {}
+    for (key, model, version, params, seed, result) in new_runs:
+        (runs, cycles) = by_model.setdefault(model, ([], []))
+        row = {"key": key, "version": version, "seed": seed}
+        row.update(run_row(model, params, result))
+        runs.append(row)
+        for entry in result.get("trace", []):
+            cycles.append(dict(zip(["key"] + CYCLE_COLUMNS, [key] + entry)))
+
+    for (model, (runs, cycles)) in by_model.items():
+        partition = "model={}".format(model)
+        part = "part-{:05d}".format(len(_parts(store, "runs", partition)))
+        write_part(os.path.join(store, "runs", partition, part), columns_of(runs))
+        if cycles:
+            write_part(os.path.join(store, "cycles", partition, part), columns_of(cycles))
+
+    # Only record the keys once the parts are safely written
+    os.makedirs(store, exist_ok=True)
+    with open(ingested_path, "a") as output:
+        output.writelines(key + "\n" for (key, *_) in new_runs)
+
+    return len(new_runs)
+
+def _parts(store: str, table: str, partition: str) -> list:
+    directory = os.path.join(store, table, partition)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+        if name.startswith("part-"))
+
+def digest(columns: dict) -> dict:
+    '''What the reports need from one part of the runs table: the ancestry,
+    Y-extinction and extinction cycle of every run, grouped by series and
+    pool size
+
+    Returns:
+        dict: lists of [ancestry, extinct, extinction], keyed by the series
+            (the values of SERIES, as JSON) and then by the pool size
+    '''
+    points = {}
+    series_columns = [columns[name] for name in SERIES]
+    for (i, pool_size) in enumerate(columns["pool_size"]):
+        series = json.dumps(dict(zip(SERIES, [values[i] for values in series_columns])), sort_keys=True)
+        points.setdefault(series, {}).setdefault(str(pool_size), []).append(
+            [columns["ancestry"][i], columns["extinct"][i], columns["extinction"][i]])
+    return points
+
+def collect(store: str) -> dict:
+    '''Gathers the digests of every part of the runs table, making any that
+    are missing
+
+    Returns:
+        dict: lists of [ancestry, extinct, extinction], keyed by model,
+            series and pool size, as in digest
+    '''
+    collected = {}
+    runs_directory = os.path.join(store, "runs")
+    partitions = sorted(os.listdir(runs_directory)) if os.path.isdir(runs_directory) else []
+    for partition in partitions:
+        model = partition.partition("=")[2]
+        for part in _parts(store, "runs", partition):
+            digest_path = os.path.join(store, "digests", partition,
+                os.path.splitext(os.path.basename(part))[0] + ".json")
+            if os.path.exists(digest_path):
+                with open(digest_path) as source:
+                    points = json.load(source)
+            else:
+                points = digest(read_part(part, SERIES + ["pool_size", "ancestry", "extinct", "extinction"]))
+                os.makedirs(os.path.dirname(digest_path), exist_ok=True)
+                with open(digest_path, "w") as output:
+                    json.dump(points, output)
+
+            for (series, by_pool) in points.items():
+                for (pool_size, values) in by_pool.items():
+                    collected.setdefault(model, {}).setdefault(series, {}).setdefault(
+                        int(pool_size), []).extend(values)
+
+    return collected
+
+def summary_rows(collected: dict) -> list:
+    '''One row for each model, series and pool size: the number of runs, mean
+    and standard deviation of ancestry, probability of Y-extinction, and mean
+    cycles to Y-extinction where it is known
+    '''
+    rows = [["model"] + SERIES + ["pool", "runs", "mean-ancestry", "sd-ancestry", "p-extinct", "mean-extinction"]]
+    for (model, by_series) in sorted(collected.items()):
+        for (series, by_pool) in sorted(by_series.items()):
+            values = json.loads(series)
+            for (pool_size, points) in sorted(by_pool.items()):
+                ancestries = [ancestry for (ancestry, _, _) in points]
+                times = [extinction for (_, extinct, extinction) in points if extinct and extinction is not None]
+                n = len(points)
+                mean = sum(ancestries) / n
+                sd = math.sqrt(sum((a - mean) ** 2 for a in ancestries) / (n - 1)) if n > 1 else 0.0
+                rows.append([model] + [values[name] for name in SERIES] + [pool_size, n, mean, sd,
+                    sum(1 for (_, extinct, _) in points if extinct) / n,
+                    sum(times) / len(times) if times else None])
+    return rows
+
+def write_summary(rows: list, path: str) -> str:
+    '''Writes the summary as a spreadsheet if openpyxl is installed, and
+    otherwise as CSV alongside
+
+    Returns:
+        The file name actually written
+    '''
+    try:
+        import openpyxl
+    except ImportError:
+        path = os.path.splitext(path)[0] + ".csv"
+        with open(path, "w", newline="") as output:
+            csv.writer(output).writerows(rows)
+        return path
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Summary"
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+def plot(collected: dict, graph: tuple, directory: str) -> bool:
+    '''Draws one of the GRAPHS as a scatter plot against pool size
+
+    Returns:
+        False if there were no matching runs to draw
+    '''
+    (name, title, label, quantity, model, wanted) = graph
+    (xs, ys) = ([], [])
+    for (series, by_pool) in collected.get(model, {}).items():
+        values = json.loads(series)
+        if any(values.get(key) != value for (key, value) in wanted.items()):
+            continue
+        for (pool_size, points) in by_pool.items():
+            for (ancestry, extinct, extinction) in points:
+                if quantity == "ancestry":
+                    xs.append(pool_size)
+                    ys.append(ancestry)
+                elif not extinct or extinction is not None:
+                    xs.append(pool_size)
+                    ys.append(extinction if extinct else 0)
+    if not xs:
+        return False
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as pyplot
+
+    (figure, axes) = pyplot.subplots(figsize=(5, 3.75))
+    axes.scatter(xs, ys)
+    axes.set_title(title, wrap=True)
+    axes.set_xlabel("Size of pool of potential mates")
+    axes.set_ylabel(label)
+    axes.set_xlim(0, max(xs) + 1)
+    if quantity == "ancestry":
+        axes.set_ylim(0.0, 1.0)
+    axes.grid(True)
+    figure.tight_layout()
+    figure.savefig(os.path.join(directory, name))
+    pyplot.close(figure)
+    return True
+
+def report(store: str, directory: str = ".", spreadsheet: str = "summary.xlsx") -> list:
+    '''Regenerates the README graphs and the summary spreadsheet from the store.
+    Graphs with no matching runs are left alone, as are all the graphs if
+    matplotlib is not installed.
+
+    Returns:
+        List[str]: the files written
+    '''
+    collected = collect(store)
+    os.makedirs(directory, exist_ok=True)
+    written = [write_summary(summary_rows(collected), os.path.join(directory, spreadsheet))]
+    try:
+        import matplotlib
+    except ImportError:
+        return written
+
+    for graph in GRAPHS:
+        if plot(collected, graph, directory):
+            written.append(os.path.join(directory, graph[0]))
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store the results of sweeps, and regenerate the reports")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = commands.add_parser("ingest", help="add new runs from a ledger to the store")
+    ingest_parser.add_argument("--ledger", default="sweep.db")
+    ingest_parser.add_argument("--store", default="results")
+    report_parser = commands.add_parser("report", help="regenerate the README graphs and a summary")
+    report_parser.add_argument("--store", default="results")
+    report_parser.add_argument("--out", default=".", help="directory for the graphs and summary")
+    report_parser.add_argument("--summary", default="summary.xlsx", help="file name of the summary")
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        print("ingested {} runs".format(ingest(args.ledger, args.store)))
+    else:
+        for path in report(args.store, args.out, args.summary):
+            print("wrote {}".format(path))
+
+if __name__ == '__main__':
+    main()
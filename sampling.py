@@ -0,0 +1,252 @@
+import math
+import random
+
+def bucket_of(value: float, n_buckets: int) -> int:
+    '''Which of n_buckets equal-width buckets a sapiensness (0.0 to 1.0) is in
+    '''
+    return min(int(value * n_buckets), n_buckets - 1)
+
+def bucket_factors(n_buckets: int, target: float, beta: float, members=None):
+    '''Mate choice weight of one individual in each bucket.
+
+    The weight is exp(-beta * distance), where distance is the L_inf norm
+    between the centre of the bucket and the target, so beta = 0 means no
+    preference at all.
+
+    Args:
+        members (List[list]): if given, the individuals in each bucket. The
+            weights are then scaled so the nearest bucket with anyone in it
+            has a weight of 1, which does not change the draws, but stops the
+            weights all underflowing to zero when beta is large and everyone
+            is far from the target. Any empty buckets that are nearer also
+            have a weight of 1.
+
+    Returns:
+        List[float]: one weight per bucket
+    '''
+    distances = [abs((b + 0.5) / n_buckets - target) for b in range(n_buckets)]
+    nearest = min((distance for (b, distance) in enumerate(distances) if members is None or members[b]),
+        default=0.0)
+    return [math.exp(-beta * max(distance - nearest, 0.0)) for distance in distances]
+
+class AliasTable:
+    '''Walker's alias method for drawing from a fixed discrete distribution.
+
+    Building the table is O(n) in the number of weights, and each draw is O(1)
+    with a single uniform random number.
+    '''
+
+    def __init__(self, weights):
+        '''
+        Args:
+            weights (List[float]): non-negative, not all zero
+        '''
+        n = len(weights)
+        total = sum(weights)
+        if not total > 0.0:
+            raise ValueError("cannot draw from weights that are all zero")
+
+        scaled = [weight * n / total for weight in weights]
+        self.probability = [1.0] * n
+        self.alias = list(range(n))
+
+        small = [i for (i, p) in enumerate(scaled) if p < 1.0]
+        large = [i for (i, p) in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.probability[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+
+        # Anything left over is only short of 1.0 through rounding errors, so
+        # keeps the default probability of one
+
+    def draw(self) -> int:
+        '''Returns an index, with probability proportional to its weight
+        '''
+        u = random.random() * len(self.probability)
+        i = int(u)
+        return i if u - i < self.probability[i] else self.alias[i]
+
+class FenwickTree:
+    '''Binary indexed tree of non-negative weights, for drawing from a
+    discrete distribution whose weights change between draws.
+
+    Updating a weight and drawing are both O(log n).
+    '''
+
+    def __init__(self, weights):
+        '''
+        Args:
+            weights (List[float]): initial non-negative weights
+        '''
+        n = len(weights)
+        self.weights = list(weights)
+        self.tree = [0.0] + self.weights
+        for i in range(1, n + 1):
+            parent = i + (i & -i)
+            if parent <= n:
+                self.tree[parent] += self.tree[i]
+
+        self.top = 1
+        while self.top * 2 <= n:
+            self.top *= 2
+
+    def total(self) -> float:
+        '''Sum of all the weights
+        '''
+        total = 0.0
+        i = len(self.weights)
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def set(self, index: int, weight: float):
+        '''Replaces one of the weights
+        '''
+        delta = weight - self.weights[index]
+        self.weights[index] = weight
+        i = index + 1
+        n = len(self.weights)
+        while i <= n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def draw(self) -> int:
+        '''Returns an index, with probability proportional to its weight
+        '''
+        n = len(self.weights)
+        while True:
+            total = self.total()
+            if not total > 0.0:
+                raise ValueError("cannot draw from weights that are all zero")
+            remaining = random.random() * total
+            position = 0
+            step = self.top
+            while step > 0:
+                next_position = position + step
+                if next_position <= n and self.tree[next_position] <= remaining:
+                    position = next_position
+                    remaining -= self.tree[position]
+                step //= 2
+
+            # Rounding errors in the tree can very rarely land us on an empty
+            # slot, or off the end, so just try again, unless the total is
+            # only the rounding errors left after setting every weight to zero
+            if position < n and self.weights[position] > 0.0:
+                return position
+            if not any(weight > 0.0 for weight in self.weights):
+                raise ValueError("cannot draw from weights that are all zero")
+
+class WeightedChoice:
+    '''Draws individuals with probability proportional to
+    exp(-beta * |sapiensness - target|), where the population does not change
+    between draws.
+
+    Individuals are bucketed by sapiensness, and an alias table over the
+    buckets is built the first time each target is used, so each draw is O(1).
+    The sapiensness of each individual is approximated by the centre of its
+    bucket when calculating its weight.
+    '''
+
+    def __init__(self, values, beta: float, n_buckets: int):
+        '''
+        Args:
+            values (Iterable[float]): sapiensness of each individual
+            beta: strength of preference. Zero means no preference
+            n_buckets: number of buckets to split sapiensness into
+        '''
+        self.beta = beta
+        self.n_buckets = n_buckets
+        self.members = [[] for _ in range(n_buckets)]
+        for (i, value) in enumerate(values):
+            self.members[bucket_of(value, n_buckets)].append(i)
+        self.tables = {}
+
+    def draw(self, target: float) -> int:
+        '''Returns the index of an individual chosen by an individual who
+        prefers sapiensness close to target
+        '''
+        table = self.tables.get(target)
+        if table is None:
+            factors = bucket_factors(self.n_buckets, target, self.beta, self.members)
+            table = AliasTable([len(members) * factor for (members, factor) in zip(self.members, factors)])
+            self.tables[target] = table
+
+        members = self.members[table.draw()]
+        return members[random.randint(0, len(members) - 1)]
+
+class RemovingWeightedChoice:
+    '''Like WeightedChoice, but each individual drawn is removed, so the
+    weights change after every draw.
+
+    There is a Fenwick tree over the buckets for each target, so each draw and
+    removal is O(number of targets * log(number of buckets)). The trees are
+    rebuilt whenever a bucket is emptied, to keep the weights scaled as in
+    bucket_factors, which is at most once per bucket.
+    '''
+
+    def __init__(self, values, beta: float, n_buckets: int, targets):
+        '''
+        Args:
+            values (Iterable[float]): sapiensness of each individual
+            beta: strength of preference. Zero means no preference
+            n_buckets: number of buckets to split sapiensness into
+            targets (Iterable[float]): the targets that will be passed to
+                draw_and_remove
+        '''
+        self.beta = beta
+        self.n_buckets = n_buckets
+        self.members = [[] for _ in range(n_buckets)]
+        self.size = 0
+        for (i, value) in enumerate(values):
+            self.members[bucket_of(value, n_buckets)].append(i)
+            self.size += 1
+
+        self.factors = {}
+        self.trees = {}
+        for target in targets:
+            self.build(target)
+
+    def build(self, target: float):
+        '''(Re)builds the Fenwick tree for one target from the buckets
+        '''
+        factors = bucket_factors(self.n_buckets, target, self.beta, self.members)
+        self.factors[target] = factors
+        self.trees[target] = FenwickTree(
+            [len(members) * factor for (members, factor) in zip(self.members, factors)])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def draw_and_remove(self, target: float) -> int:
+        '''Returns and removes the index of an individual chosen by an
+        individual who prefers sapiensness close to target
+        '''
+        if self.size == 0:
+            raise ValueError("no individuals left to draw")
+        bucket = self.trees[target].draw()
+
+        # Swap the chosen individual with the last in its bucket, then remove
+        members = self.members[bucket]
+        pick = random.randint(0, len(members) - 1)
+        chosen = members[pick]
+        members[pick] = members[-1]
+        members.pop()
+        self.size -= 1
+
+        if members:
+            for (other, tree) in self.trees.items():
+                tree.set(bucket, len(members) * self.factors[other][bucket])
+        else:
+            # The nearest bucket with anyone in it may have changed
+            for other in list(self.trees):
+                self.build(other)
+
+        return chosen
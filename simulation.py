@@ -0,0 +1,330 @@
+import hashlib
+import importlib
+import json
+import os
+import random
+
+import stopping
+
+# The models that can be run, and the module implementing each
+MODELS = {
+    "evolve": "evolve",
+    "male-selection": "evolve_with_male_selection",
+    "multi-gene": "evolve_multi_gene",
+}
+
+# Alternative engines for the breeding and culling cycles, the module that
+# implements each, and the models it can run. The "standard" engine is the
+# model's own cycles. Engine modules are only imported when a run uses them, so
+# an engine may depend on packages that are slow to import, or not installed.
+# An engine module provides initial_cohorts, cycles_until and population, as
+# lifetable.py does, or summary in place of population if the summary function
+# of the model cannot be used, as meanfield.py does.
+ENGINES = {
+    "standard": (None, ["evolve", "male-selection", "multi-gene"]),
+    "lifetable": ("lifetable", ["evolve", "multi-gene"]),
+    "meanfield": ("meanfield", ["evolve"]),
+    "outofcore": ("outofcore", ["multi-gene"]),
+}
+
+# Source files shared by all the models, which can also change their results
+ENGINE_FILES = ["simulation.py", "lifetable.py", "lineage.py", "meanfield.py", "miscarriage.py", "outofcore.py",
+    "sampling.py", "spatial.py", "stopping.py"]
+
+# Default run parameters for each model, matching their __main__ blocks. If
+# stop is set to a list of stopping rules (see stopping.Stopping), they are
+# used instead of extra_cycles. The engine is one of ENGINES. If trace is more
+# than zero, the population is recorded every trace cycles, as the trace of
+# the result.
+DEFAULTS = {
+    "evolve": {"n_sapiens": 200, "n_neanders": 200, "max_cycles": 100, "extra_cycles": 40,
+        "stop": None, "engine": "standard", "trace": 0},
+    "male-selection": {"n_sapiens": 1000, "n_neanders": 1000, "max_cycles": 200, "extra_cycles": 40,
+        "stop": None, "engine": "standard", "trace": 0},
+    "multi-gene": {"n_sapiens": 200, "n_neanders": 200, "max_cycles": 400, "extra_cycles": 40,
+        "stop": None, "engine": "standard", "trace": 0},
+}
+
+def load_model(model: str):
+    '''Imports the module implementing the given model
+    '''
+    return importlib.import_module(MODELS[model])
+
+def engine_version(model: str) -> str:
+    '''Hash of the source of the given model and the shared engine files. Any
+    edit invalidates old results
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for path in [load_model(model).__file__] + [os.path.join(directory, name) for name in ENGINE_FILES]:
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+def engine_modules(model: str, engine: str) -> list:
+    '''The modules whose constants affect a run, in order of precedence
+    '''
+    (module_name, models) = ENGINES.get(engine, (None, []))
+    if model not in models:
+        raise ValueError("{} cannot use the {} engine".format(model, engine))
+    if module_name is None:
+        return [load_model(model)]
+    return [load_model(model), importlib.import_module(module_name)]
+
+def model_constants(model: str, engine: str = "standard") -> dict:
+    '''The upper-case constants of a model and its engine, such as its
+    population caps or age schedules. Names starting with an underscore are
+    private to the module, and left out
+    '''
+    constants = {}
+    for module in reversed(engine_modules(model, engine)):
+        constants.update({name: value for (name, value) in vars(module).items()
+            if name.isupper() and not name.startswith("_") and isinstance(value, (int, float, str, list)) and not isinstance(value, bool)})
+    return constants
+
+def run_params(model: str, pool_size: int, overrides: dict = None, constants: dict = None) -> dict:
+    '''Builds the full parameter set of a run, including all model constants
+
+    Args:
+        model: name of the model
+        pool_size: number of choices when picking a partner
+        overrides: replacements for any of the DEFAULTS of the model
+        constants: replacements for any of the model_constants
+
+    Returns:
+        Everything other than the seed that determines the outcome of a run
+    '''
+    params = dict(DEFAULTS[model])
+    for name in overrides or {}:
+        if name not in params:
+            raise KeyError("{} has no run parameter {}".format(model, name))
+    params.update(overrides or {})
+    params["pool_size"] = pool_size
+    params["constants"] = model_constants(model, params["engine"])
+    for (name, value) in (constants or {}).items():
+        if name not in params["constants"]:
+            raise KeyError("{} has no constant {}".format(model, name))
+        params["constants"][name] = value
+    return params
+
+def load_config(path: str) -> dict:
+    '''Reads a JSON configuration file, such as
+
+        {"model": "multi-gene", "pool_size": 3, "max_cycles": 200,
+         "constants": {"MAX_POPULATION": 500}}
+
+    Any key other than model, pool_size, seed and constants must be one of the
+    DEFAULTS of the model. Command-line flags take precedence over the file.
+    '''
+    with open(path) as source:
+        config = json.load(source)
+
+    model = config.get("model", "evolve")
+    if model not in MODELS:
+        raise KeyError("unknown model {}".format(model))
+    for name in config:
+        if name not in ("model", "pool_size", "seed", "constants") and name not in DEFAULTS[model]:
+            raise KeyError("{} has no run parameter {}".format(model, name))
+    return config
+
+def configure(config: dict, model: str = None, overrides: dict = None, constants: dict = None):
+    '''Combines a configuration, as returned by load_config, with settings
+    from command-line flags, which take precedence. The pool_size and seed
+    of the configuration are left for the caller.
+
+    Returns:
+        (str, dict, dict): the model, the replacements for its DEFAULTS and
+            the replacements for its constants
+    '''
+    model = model or config.get("model", "evolve")
+    merged_overrides = {name: value for (name, value) in config.items()
+        if name not in ("model", "pool_size", "seed", "constants")}
+    merged_overrides.update(overrides or {})
+    merged_constants = dict(config.get("constants", {}))
+    merged_constants.update(constants or {})
+    return (model, merged_overrides, merged_constants)
+
+def parse_assignment(text: str):
+    '''Parses a NAME=VALUE command-line assignment. The value is a number, or
+    failing that a string
+    '''
+    (name, _, value) = text.partition("=")
+    try:
+        return (name, json.loads(value))
+    except ValueError:
+        return (name, value)
+
+def y_extinct(model: str, module, population) -> bool:
+    '''Whether the neanderthal Y-chromosome has died out
+
+    Args:
+        model: name of the model
+        module: the model module
+        population: as passed to the repeated_cycles function of the model
+    '''
+    if model == "multi-gene":
+        return not module.any_male_neanderthals(population[0])
+    return len(population[1]) == 0
+
+def class_counts(model: str, population) -> tuple:
+    '''Numbers of male sapiens, male neanderthals and females
+
+    Args:
+        model: name of the model
+        population: as passed to the repeated_cycles function of the model
+    '''
+    if model != "multi-gene":
+        return tuple(len(individuals) for individuals in population)
+
+    (individuals,) = population
+    counts = [0, 0, 0]
+    for individual in individuals:
+        counts[2 if not individual.is_male else 1 if individual.is_neanderthal else 0] += 1
+    return tuple(counts)
+
+class Simulation:
+    '''One of the models, with every parameter other than the seed fixed.
+
+    This is the single way of running any model, used by neanderthals.py,
+    sweep.py and adaptive.py. For example
+
+        Simulation("multi-gene", pool_size=3, max_cycles=200,
+            constants={"MISCARRIAGE": "dosage:0.5"}).run(seed=1)
+    '''
+
+    def __init__(self, model: str = "evolve", pool_size: int = 1, constants: dict = None, **overrides):
+        '''
+        Args:
+            model: name of the model, one of MODELS
+            pool_size: number of choices when picking a partner
+            constants: replacements for any of the model_constants
+            overrides: replacements for any of the DEFAULTS of the model
+        '''
+        self.model = model
+        self.params = run_params(model, pool_size, overrides, constants)
+
+    @classmethod
+    def from_params(cls, model: str, params: dict):
+        '''Recreates a simulation from the params of an earlier one, as stored
+        in the ledger
+        '''
+        simulation = cls.__new__(cls)
+        simulation.model = model
+        simulation.params = params
+        return simulation
+
+    def run(self, seed: int, progress=None) -> dict:
+        '''Executes one Monte-Carlo run.
+
+        The model constants are temporarily replaced by those in params, and
+        the random number generator is seeded, so the run is reproducible.
+
+        Args:
+            seed: Monte-Carlo seed
+            progress (progress.Progress): if given, told about every cycle
+
+        Returns:
+            dict: the number of cycles performed, the summary of the final
+                state, why the run stopped, and the cycle when the neanderthal
+                y-chromosome went extinct (None if it did not). Under the
+                default stopping rule, the reason is y_extinct whenever it
+                went extinct, even if the run then hit max_cycles. If the trace
+                parameter is set, there is also the trace, as recorded by
+                stopping.Stopping. If the model tracks paternal lineages,
+                there is also the lineages summary, from lineage.Lineages, and
+                if it is spatial, the spatial summary, from spatial.Landscape
+        '''
+        (model, params) = (self.model, self.params)
+        modules = engine_modules(model, params["engine"])
+        module = modules[0]
+        owners = {}
+        for owner in reversed(modules):
+            owners.update({name: owner for name in params["constants"] if hasattr(owner, name)})
+
+        saved = {name: getattr(owners[name], name) for name in params["constants"]}
+        try:
+            for (name, value) in params["constants"].items():
+                setattr(owners[name], name, value)
+
+            random.seed(seed)
+            if model == "multi-gene":
+                population = [module.initial_population(params["n_sapiens"], params["n_neanders"])]
+            else:
+                population = list(module.initial_population(params["n_sapiens"], params["n_neanders"]))
+
+            # Only the standard engine keeps the lineages and positions in step
+            # with the individuals
+            tracks = {}
+            if hasattr(module, "initial_lineages"):
+                tracks["lineages"] = module.initial_lineages(*population[:2])
+            if hasattr(module, "initial_landscape"):
+                tracks["landscape"] = module.initial_landscape(*population)
+            tracks = {name: track for (name, track) in tracks.items() if track is not None}
+            if tracks and params["engine"] != "standard":
+                raise ValueError("{} cannot be tracked by the {} engine".format(
+                    " and ".join(sorted(tracks)), params["engine"]))
+
+            # Without stopping rules, the rule y_extinct:extra_cycles behaves
+            # like repeated_cycles
+            stop = stopping.Stopping(params["stop"] or "y_extinct:{}".format(params["extra_cycles"]),
+                params["max_cycles"], params["trace"], progress)
+            if progress is not None:
+                if params["stop"] or params["trace"] or params["engine"] != "standard":
+                    progress.watch(lambda: stop.history[-1].counts)
+                else:
+                    progress.watch(lambda: class_counts(model, population))
+
+            if params["engine"] != "standard":
+                engine = modules[1]
+                cohorts = engine.initial_cohorts(module, *population)
+                try:
+                    cycles = engine.cycles_until(cohorts, module, params["pool_size"], stop)
+                    (reason, extinction) = (stop.reason, stop.extinction)
+                    if hasattr(engine, "summary"):
+                        stats = engine.summary(cohorts, module)
+                    else:
+                        stats = module.summary(*engine.population(cohorts, module))
+                finally:
+                    # Engines that hold files or threads release them here
+                    if hasattr(cohorts, "close"):
+                        cohorts.close()
+            elif params["stop"] or params["trace"]:
+                cycles = module.cycles_until(*population, params["pool_size"], stop, **tracks)
+                (reason, extinction) = (stop.reason, stop.extinction)
+                stats = module.summary(*population)
+            else:
+                # Note the cycle when the Y-chromosome dies out as it happens,
+                # as repeated_cycles may hit max_cycles within extra_cycles of
+                # it. Once extinct, it cannot come back.
+                extinctions = []
+                def watch(cycles):
+                    if not extinctions and y_extinct(model, module, population):
+                        extinctions.append(cycles - 1)
+                    if progress is not None:
+                        progress(cycles)
+
+                cycles = module.repeated_cycles(*population, params["pool_size"],
+                    params["max_cycles"], params["extra_cycles"], watch, **tracks)
+                extinction = extinctions[0] if extinctions else None
+                reason = "max_cycles" if extinction is None else "y_extinct"
+                stats = module.summary(*population)
+
+            # Under the default rule, max_cycles means the Y-chromosome survived
+            if not params["stop"] and reason == "max_cycles" and extinction is not None:
+                reason = "y_extinct"
+
+            # The map uses the model constants, so is made before restoring them
+            if "landscape" in tracks:
+                spatial_stats = module.spatial_summary(*population, tracks["landscape"])
+        finally:
+            for (name, value) in saved.items():
+                setattr(owners[name], name, value)
+
+        result = {"cycles": cycles, "stats": stats, "reason": reason, "extinction": extinction}
+        if params["trace"]:
+            result["trace"] = stop.trace
+        if "lineages" in tracks:
+            result["lineages"] = tracks["lineages"].summary()
+        if "landscape" in tracks:
+            result["spatial"] = spatial_stats
+        return result
@@ -0,0 +1,215 @@
+import collections
+import random
+from array import array
+from typing import List, Optional
+
+# Spatially explicit mate choice for evolve.py. Every individual has a position
+# in the unit square, sapiens starting in the left half and neanderthals in the
+# right, so that the two species meet along a contact zone in the middle. A
+# female only considers males within some radius of her, found through a
+# uniform grid of the males that is rebuilt once per breeding cycle, and each
+# child is born near its mother. A female with no male within the radius does
+# not breed that cycle, so the species only meet where their ranges touch.
+
+# How many candidates may be drawn at random from the cells around a female,
+# looking for one within the radius, before the males within the radius are
+# listed exactly instead. Roughly a third of the area of the cells is within
+# the radius, and a fifth in a corner of the square, so this is seldom hit
+# unless the neighbourhood is almost empty.
+ATTEMPTS = 50
+
+def cell_of(x: float, y: float, side: int) -> int:
+    '''Number of the cell of a grid with side cells a side that holds a
+    position, counting along the rows from the bottom
+    '''
+    return min(int(x * side), side - 1) + side * min(int(y * side), side - 1)
+
+def grid_side(radius: float) -> int:
+    '''Number of cells along each side of a grid whose cells are no smaller
+    than the radius
+    '''
+    return max(int(1.0 / radius), 1)
+
+class Grid:
+    '''Uniform grid of points in the unit square, for sampling the points near
+    a position.
+
+    The square is divided into cells whose side is at least the radius, so
+    every point within the radius of a position is in the block of three by
+    three cells around it. The points are sorted by cell, and the points of
+    the block around each cell are gathered into a list of its own with
+    slices, so building the grid is a sort and a few copies of the points,
+    all done in C. Sampling a point near a position is then a random index
+    into the block of its cell, and a distance check.
+    '''
+
+    def __init__(self, xs: array, ys: array, cells: array, radius: float):
+        '''
+        Args:
+            xs, ys: coordinates of the points
+            cells: cell of each point, from cell_of with grid_side(radius)
+            radius: how far from a position a point may be to count as near
+        '''
+        self.xs = xs
+        self.ys = ys
+        self.radius_squared = radius * radius
+        self.side = grid_side(radius)
+        side = self.side
+        order = sorted(range(len(cells)), key=cells.__getitem__)
+        counts = collections.Counter(cells)
+        starts = [0]
+        for cell in range(side * side):
+            starts.append(starts[-1] + counts[cell])
+
+        # Each row of a block is a run of consecutive cells, so of points
+        self.blocks = []
+        for cell in range(side * side):
+            (row, column) = divmod(cell, side)
+            block = []
+            for cell_row in range(max(row - 1, 0), min(row + 2, side)):
+                first = starts[cell_row * side + max(column - 1, 0)]
+                last = starts[cell_row * side + min(column + 2, side)]
+                block += order[first:last]
+            self.blocks.append(block)
+
+    def near(self, x: float, y: float, n: int) -> List[int]:
+        '''Draws n points at random, with replacement, from those within the
+        radius of the given position.
+
+        Returns:
+            The points drawn, or an empty list if there are none within the
+            radius
+        '''
+        side = self.side
+        points = self.blocks[min(int(x * side), side - 1) + side * min(int(y * side), side - 1)]
+        (xs, ys) = (self.xs, self.ys)
+        total = len(points)
+        radius_squared = self.radius_squared
+        uniform = random.random
+        picks = []
+        inside = None
+        while len(picks) < n and total > 0:
+            if inside is None:
+                # Rejection sampling from the whole block
+                for _ in range(ATTEMPTS):
+                    point = points[int(uniform() * total)]
+                    dx = xs[point] - x
+                    dy = ys[point] - y
+                    if dx * dx + dy * dy <= radius_squared:
+                        picks.append(point)
+                        break
+                else:
+                    # Few of the block are near, so list exactly those that are
+                    inside = [point for point in points
+                        if (xs[point] - x) * (xs[point] - x) + (ys[point] - y) * (ys[point] - y) <= radius_squared]
+                    total = len(inside)
+            else:
+                picks.append(inside[int(uniform() * total)])
+        return picks
+
+def reflect(value: float) -> float:
+    '''Folds a coordinate back into the unit interval, as if off a wall
+    '''
+    while value < 0.0 or value > 1.0:
+        value = -value if value < 0.0 else 2.0 - value
+    return value
+
+class Landscape:
+    '''Positions of the individuals of evolve.py, held in arrays parallel to
+    its lists of male sapiens, male neanderthals and females, and kept in the
+    same order: children are added at the end, and the oldest culled from the
+    front.
+    '''
+
+    def __init__(self, classes, radius: float, dispersal: float):
+        '''Places the founders at random, sapiens in the left half of the
+        square and neanderthals in the right.
+
+        Args:
+            classes: sapiensness of the male sapiens, male neanderthals and
+                females
+            radius: how far a female looks for a partner
+            dispersal: standard deviation of the distance from mother to
+                child in each direction
+        '''
+        self.radius = radius
+        self.dispersal = dispersal
+        self.side = grid_side(radius)
+        self.xs = [array("d") for _ in classes]
+        self.ys = [array("d") for _ in classes]
+        self.cells = [array("i") for _ in classes]
+        for (category, values) in enumerate(classes):
+            self.add(category, [(0.5 * random.random() + (0.0 if value >= 0.5 else 0.5), random.random())
+                for value in values])
+
+    def grid(self) -> Grid:
+        '''Index of all the males, sapiens followed by neanderthals, as they
+        are numbered by find_partner_index
+        '''
+        return Grid(self.xs[0] + self.xs[1], self.ys[0] + self.ys[1], self.cells[0] + self.cells[1], self.radius)
+
+    def disperse(self, x: float, y: float):
+        '''Position of a child born to a mother at the given position
+        '''
+        x = random.gauss(x, self.dispersal)
+        y = random.gauss(y, self.dispersal)
+        if not (0.0 <= x <= 1.0 and 0.0 <= y <= 1.0):
+            (x, y) = (reflect(x), reflect(y))
+        return (x, y)
+
+    def add(self, category: int, positions):
+        '''Adds the positions of newborns to the end of one class. Their cells
+        of the grid are worked out once here, as they never move
+        '''
+        (xs, ys, cells, side) = (self.xs[category], self.ys[category], self.cells[category], self.side)
+        for (x, y) in positions:
+            xs.append(x)
+            ys.append(y)
+            cells.append(min(int(x * side), side - 1) + side * min(int(y * side), side - 1))
+
+    def kill_oldest(self, category: int, n: int):
+        '''Removes the n oldest of one class, as the culling does
+        '''
+        del self.xs[category][0:n]
+        del self.ys[category][0:n]
+        del self.cells[category][0:n]
+
+    def summary(self, classes, bins: int) -> dict:
+        '''The spatial ancestry map, and the width of the hybrid zone
+
+        Args:
+            classes: sapiensness of the male sapiens, male neanderthals and
+                females, in the same order as the positions
+            bins: number of cells of the map along each side
+
+        Returns:
+            dict: "map" is the mean sapiensness in each cell of the map, row
+                by row from the bottom, or None for empty cells. "hybrid_zone"
+                is as found by hybrid_zone_width.
+        '''
+        totals = [[0.0] * bins for _ in range(bins)]
+        counts = [[0] * bins for _ in range(bins)]
+        for (category, values) in enumerate(classes):
+            for (value, x, y) in zip(values, self.xs[category], self.ys[category]):
+                (column, row) = (min(int(x * bins), bins - 1), min(int(y * bins), bins - 1))
+                totals[row][column] += value
+                counts[row][column] += 1
+
+        ancestry_map = [[total / n if n > 0 else None for (total, n) in zip(total_row, count_row)]
+            for (total_row, count_row) in zip(totals, counts)]
+        cline = []
+        for column in range(bins):
+            n = sum(count_row[column] for count_row in counts)
+            cline.append(sum(total_row[column] for total_row in totals) / n if n > 0 else None)
+        return {"map": ancestry_map, "hybrid_zone": hybrid_zone_width(cline)}
+
+def hybrid_zone_width(cline: List[Optional[float]], low: float = 0.2, high: float = 0.8) -> float:
+    '''Width of the hybrid zone, from the mean sapiensness of each of a number
+    of equal columns across the square.
+
+    This is the total width of the columns whose mean is between low and
+    high, so it is 0.0 if the species are cleanly separated, or one of them
+    has taken over, and 1.0 if the whole population is mixed. Empty columns
+    are left out.
+    '''
+    return sum(1 for mean in cline if mean is not None and low <= mean <= high) / len(cline)
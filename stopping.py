@@ -0,0 +1,193 @@
+import collections
+from typing import List, NamedTuple, Tuple
+
+# Number of equal-width bins used for the histogram of sapiensness
+HISTOGRAM_BINS = 20
+
+class CycleStats(NamedTuple):
+    '''Cheap summary of the population at the end of one cycle
+
+    The three classes are always in the order male sapiens (sapiens
+    y-chromosome), male neanderthals (neanderthal y-chromosome) and females.
+    '''
+    cycle: int
+    counts: Tuple[int, int, int]
+    means: Tuple[float, float, float]
+    histogram: List[float]   # proportion of the whole population in each bin
+
+def cycle_stats(cycle: int, classes) -> CycleStats:
+    '''Summarises the population at the end of a cycle
+
+    Args:
+        cycle: which cycle has just finished (starts at zero)
+        classes: sequences of the sapiensness (0.0 to 1.0) of the male
+            sapiens, male neanderthals and females
+
+    Returns:
+        The summary, for passing to Stopping.update
+    '''
+    counts = []
+    means = []
+    histogram = [0] * HISTOGRAM_BINS
+    top = HISTOGRAM_BINS - 1
+
+    for values in classes:
+        n = 0
+        total = 0.0
+        for value in values:
+            n += 1
+            total += value
+            histogram[min(int(value * HISTOGRAM_BINS), top)] += 1
+        counts.append(n)
+        means.append(total / n if n > 0 else 0.0)
+
+    n_total = sum(counts)
+    if n_total > 0:
+        histogram = [count / n_total for count in histogram]
+
+    return CycleStats(cycle, tuple(counts), tuple(means), histogram)
+
+def histogram_distance(a: List[float], b: List[float]) -> float:
+    '''Total variation distance between two normalised histograms (0.0 to 1.0)
+    '''
+    return 0.5 * sum(abs(x - y) for (x, y) in zip(a, b))
+
+def mean_sapiens(stats: CycleStats) -> float:
+    '''Mean sapiensness of the whole population
+    '''
+    n_total = sum(stats.counts)
+    if n_total == 0:
+        return 0.0
+    return sum(n * mean for (n, mean) in zip(stats.counts, stats.means)) / n_total
+
+class Stopping:
+    '''Decides when a run has gone on long enough.
+
+    Each cycle, the model passes a CycleStats to update, which checks each of
+    the rules in turn. The rules are written as "name:arg:arg", for example
+    "stationary:20:0.01", and are:
+
+        y_extinct:N             the neanderthal y-chromosome has been extinct
+                                for N cycles (the original extra_cycles rule)
+        fixation:T              mean sapiensness is within T of 0.0 or 1.0
+        stationary:W:T          over the last W cycles, the histogram has moved
+                                by no more than T (total variation) each cycle,
+                                and the class means and fractions by no more
+                                than T in total
+        y_extinct_stable:W:T    both y_extinct:W and stationary:W:T
+
+    The run always stops after max_cycles, or if the whole population has
+    died out, whatever the rules say.
+
+    As it goes, it can also keep a trace of the population, as a list of
+    [cycle, counts..., means...] for the classes of CycleStats.
+    '''
+
+    def __init__(self, rules: str, max_cycles: int, trace: int = 0, progress=None):
+        '''
+        Args:
+            rules: comma-separated list of rules, such as "y_extinct:40"
+            max_cycles: the maximum number of cycles to run
+            trace: record the population every this many cycles, and at the
+                last cycle. Zero means never
+            progress (Callable[[int], None]): if given, called with the
+                number of cycles performed so far after every cycle, as by
+                the repeated_cycles function of the models
+        '''
+        self.rules = parse_rules(rules)
+        self.max_cycles = max_cycles
+        self.trace_every = trace
+        self.trace = []
+        self.progress = progress
+
+        # The stationary rules need to look back over their windows
+        window = 1
+        for (name, args) in self.rules:
+            if name in ("stationary", "y_extinct_stable"):
+                window = max(window, int(args[0]))
+        self.history = collections.deque(maxlen=window + 1)
+
+        self.cycles = 0
+        self.extinction = None   # cycle when the neanderthal y-chromosome died out
+        self.reason = None
+
+    def update(self, stats: CycleStats) -> bool:
+        '''Records the state after a cycle and decides whether to stop
+
+        Returns:
+            True if the run should stop, in which case reason says why
+        '''
+        self.history.append(stats)
+        self.cycles = stats.cycle + 1
+        if self.extinction is None and stats.counts[1] == 0:
+            self.extinction = stats.cycle
+
+        self.reason = self._reason()
+        if self.trace_every and (self.reason or stats.cycle % self.trace_every == 0):
+            self.trace.append([stats.cycle, *stats.counts, *stats.means])
+        if self.progress is not None:
+            self.progress(self.cycles)
+        return self.reason is not None
+
+    def _reason(self) -> str:
+        '''Why the run should stop after the latest cycle, or None
+        '''
+        if sum(self.history[-1].counts) == 0:
+            return "died_out"
+
+        for (name, args) in self.rules:
+            if _RULES[name](self, *args):
+                return name
+
+        if self.cycles >= self.max_cycles:
+            return "max_cycles"
+
+        return None
+
+def parse_rules(rules: str):
+    '''Splits a comma-separated list of rules into (name, args) pairs
+    '''
+    parsed = []
+    for rule in rules.split(","):
+        (name, *args) = rule.strip().split(":")
+        if name not in _RULES:
+            raise ValueError("unknown stopping rule {}".format(name))
+        parsed.append((name, [float(arg) for arg in args]))
+    return parsed
+
+def _y_extinct(stopping: Stopping, cycles: float) -> bool:
+    return stopping.extinction is not None and stopping.cycles - stopping.extinction >= cycles
+
+def _fixation(stopping: Stopping, tolerance: float) -> bool:
+    mean = mean_sapiens(stopping.history[-1])
+    return mean <= tolerance or mean >= 1.0 - tolerance
+
+def _stationary(stopping: Stopping, window: float, tolerance: float) -> bool:
+    history = stopping.history
+    if len(history) <= window:
+        return False
+
+    for (before, after) in zip(list(history)[:-1], list(history)[1:]):
+        if histogram_distance(before.histogram, after.histogram) > tolerance:
+            return False
+
+    (first, last) = (history[0], history[-1])
+    n_first = max(sum(first.counts), 1)
+    n_last = max(sum(last.counts), 1)
+    for i in range(3):
+        if abs(first.means[i] - last.means[i]) > tolerance:
+            return False
+        if abs(first.counts[i] / n_first - last.counts[i] / n_last) > tolerance:
+            return False
+
+    return True
+
+def _y_extinct_stable(stopping: Stopping, window: float, tolerance: float) -> bool:
+    return _y_extinct(stopping, window) and _stationary(stopping, window, tolerance)
+
+_RULES = {
+    "y_extinct": _y_extinct,
+    "fixation": _fixation,
+    "stationary": _stationary,
+    "y_extinct_stable": _y_extinct_stable,
+}
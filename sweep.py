@@ -0,0 +1,195 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+import ledger
+import progress
+import simulation
+
+def run_key(model: str, version: str, params: dict, seed: int) -> str:
+    '''Unique hash identifying a run in the ledger
+    '''
+    text = json.dumps({"model": model, "version": version, "params": params, "seed": seed}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def work(ledger_path: str, models):
+    '''Worker loop: claims and executes pending runs until there are none left.
+
+    Any number of these may run at once against the same ledger. Each
+    publishes its progress, for progress.py to show.
+
+    Args:
+        ledger_path: file name of the ledger
+        models (Iterable[str]): models whose pending runs we may execute
+    '''
+    conn = ledger.open_ledger(ledger_path)
+    worker = ledger.worker_name()
+    versions = [simulation.engine_version(model) for model in models]
+    status = progress.Progress(os.path.join(
+        progress.status_directory(ledger_path), worker.replace(":", "-") + ".json"))
+
+    while True:
+        claimed = ledger.claim_run(conn, worker, versions)
+        if claimed is None:
+            status.close()
+            return
+
+        (key, model, params, seed) = claimed
+        status.begin(key, model, params, seed)
+        try:
+            result = simulation.Simulation.from_params(model, params).run(seed, status)
+        except Exception as e:
+            ledger.fail_run(conn, key, repr(e))
+        else:
+            ledger.complete_run(conn, key, result)
+        status.end()
+
+def run_many(ledger_path: str, model: str, jobs, workers: int = 1,
+        overrides: dict = None, constants: dict = None):
+    '''Executes a batch of runs of a model, skipping memoised runs.
+
+    Every run is added to the ledger. Completed runs are reused, failed or
+    interrupted ones are requeued, and the rest are shared out between the
+    workers.
+
+    Args:
+        ledger_path: file name of the ledger
+        model: name of the model
+        jobs (Iterable[tuple]): pool size and seed of each run, optionally
+            followed by a dict of constants for that run only, which take
+            precedence over constants, and a dict of overrides for that run
+            only, which take precedence over overrides
+        workers: number of worker processes
+        overrides: replacements for any of the DEFAULTS of the model
+        constants: replacements for any of the model_constants
+
+    Returns:
+        List[(str, dict)]: status and result of each job, in order. The
+            result is None unless the status is done.
+    '''
+    conn = ledger.open_ledger(ledger_path)
+    version = simulation.engine_version(model)
+
+    keys = []
+    pending = 0
+    for (pool_size, seed, *job_settings) in jobs:
+        (job_constants, job_overrides) = (job_settings + [{}, {}])[:2]
+        params = simulation.run_params(model, pool_size, dict(overrides or {}, **job_overrides),
+            dict(constants or {}, **job_constants))
+        key = run_key(model, version, params, seed)
+        if ledger.add_run(conn, key, model, version, params, seed) != ledger.DONE:
+            pending += 1
+        keys.append(key)
+
+    ledger.requeue_runs(conn)
+
+    # No point starting more processes than there are runs to do
+    workers = min(workers, pending)
+    if workers == 1:
+        work(ledger_path, [model])
+    elif workers > 1:
+        processes = [multiprocessing.Process(target=work, args=(ledger_path, [model]))
+            for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+    return [ledger.run_result(conn, key) for key in keys]
+
+def sweep(ledger_path: str, model: str, pool_sizes, replicates: int, first_seed: int = 0,
+        workers: int = 1, overrides: dict = None, constants: dict = None, variants=None):
+    '''Runs a model over pool sizes and replicates, skipping memoised runs.
+
+    Args:
+        ledger_path: file name of the ledger
+        model: name of the model
+        pool_sizes (Iterable[int]): pool sizes to try
+        replicates: number of Monte-Carlo runs for each pool size
+        first_seed: seed of the first replicate. Replicate i uses first_seed + i
+        workers: number of worker processes
+        overrides: replacements for any of the DEFAULTS of the model
+        constants: replacements for any of the model_constants
+        variants (List[dict]): if given, the whole sweep is repeated for each
+            of these sets of constants, such as different MISCARRIAGE models,
+            all as one batch of runs
+
+    Returns:
+        List[(dict, int, int, str, dict)]: variant, replicate, pool size,
+            status and result of each run, in the order the __main__ blocks
+            print them. The result is None unless the status is done.
+    '''
+    runs = [(variant, replicate, pool_size) for variant in (variants or [{}])
+        for replicate in range(replicates) for pool_size in pool_sizes]
+    jobs = [(pool_size, first_seed + replicate, variant) for (variant, replicate, pool_size) in runs]
+    results = run_many(ledger_path, model, jobs, workers, overrides, constants)
+
+    return [(variant, replicate, pool_size, status, result)
+        for ((variant, replicate, pool_size), (status, result)) in zip(runs, results)]
+
+def parse_variants(assignments) -> list:
+    '''Expands NAME=VALUE assignments into every combination of the values
+
+    For example, A=1, A=2, B=3 gives [{A: 1, B: 3}, {A: 2, B: 3}]
+    '''
+    values = {}
+    for (name, value) in assignments:
+        values.setdefault(name, []).append(value)
+    return [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
+
+def parse_range(text: str):
+    '''Parses a list of integers such as "1-6" or "1,2,5"
+    '''
+    values = []
+    for part in text.split(","):
+        (low, _, high) = part.partition("-")
+        values.extend(range(int(low), int(high or low) + 1))
+    return values
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep a model over pool sizes, memoising runs in a ledger")
+    parser.add_argument("--model", choices=sorted(simulation.MODELS), help="default evolve")
+    parser.add_argument("--config", metavar="FILE",
+        help="JSON file of the model, run parameters and constants, overridden by any flags")
+    parser.add_argument("--pools", type=parse_range, default=parse_range("1-6"), help="e.g. 1-6 or 1,3,10")
+    parser.add_argument("--replicates", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first replicate")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--ledger", default="sweep.db")
+    parser.add_argument("--set", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a run parameter, e.g. max_cycles=200")
+    parser.add_argument("--const", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="override a model constant, e.g. ALWAYS_KILL=0")
+    parser.add_argument("--stop", metavar="RULES",
+        help="stopping rules to use instead of extra_cycles, e.g. stationary:20:0.01,y_extinct:40")
+    parser.add_argument("--vary", type=simulation.parse_assignment, action="append", default=[],
+        metavar="NAME=VALUE", help="repeat the sweep for each value of a model constant, "
+        "e.g. --vary MISCARRIAGE=none --vary MISCARRIAGE=linear:0.25")
+    args = parser.parse_args(argv)
+
+    overrides = dict(args.set)
+    if args.stop:
+        overrides["stop"] = args.stop
+    config = simulation.load_config(args.config) if args.config else {}
+    (model, overrides, constants) = simulation.configure(config, args.model, overrides, dict(args.const))
+    variants = parse_variants(args.vary)
+    varied = list(variants[0])
+
+    results = sweep(args.ledger, model, args.pools, args.replicates, args.seed,
+        args.workers, overrides, constants, variants)
+
+    module = simulation.load_model(model)
+    module.print_header("stop", "extinction", *varied)
+    for (variant, replicate, pool_size, status, result) in results:
+        if status == ledger.DONE:
+            module.print_row(pool_size, result["cycles"], result["stats"],
+                result["reason"], result["extinction"], *variant.values())
+        else:
+            print("replicate {} pool {} {}".format(replicate, pool_size, status), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()